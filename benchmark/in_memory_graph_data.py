@@ -0,0 +1,78 @@
+"""
+In-memory stand-in for GraphData that replaces Neo4j and the online OSM services with a synthetic instance.
+"""
+
+import os.path
+from typing import List, Optional, Tuple
+import gpxpy
+import gpxpy.gpx
+import networkx as nx
+from shapely import Polygon
+from model.graph_data import GraphData
+from model.metrics import Metrics
+from benchmark.in_memory_neo4j import InMemoryNeo4j
+from benchmark.synthetic import SyntheticInstance
+
+
+class InMemoryGraphData(GraphData):
+    """
+    A GraphData whose Neo4j database is an InMemoryNeo4j and whose downloads and geocoding return a synthetic instance.
+
+    The stamp points are written to a GPX file in cache_directory, which is passed to import_data like the official
+    GPX file, and the map, bus stops, parking lots and home network are taken from the instance. All stages of
+    import_data (stamp points, map, bus stops, parking lots, simplification, landmarks and distances) run through the
+    regular GraphData code and queries, so only the network and Neo4j round trips are missing from the measured times.
+    """
+
+    # the GPX names of the stamp points are parsed as 'HWN<stamp ID with 3 digits> <name>'
+    _max_stamp_id = 999
+    _home_map_radius_m = 500
+
+    def __init__(self,
+                 instance: SyntheticInstance,
+                 cache_directory: str,
+                 metrics: Optional[Metrics] = None,
+                 contraction_hierarchy: bool = False):
+        # the driver connects lazily and is never used
+        super().__init__("bolt://localhost:7687", "", "", metrics=metrics, contraction_hierarchy=contraction_hierarchy)
+        self._instance = instance
+        self._map_filename = os.path.join(cache_directory, 'graph.graphml')
+        self._raw_map_filename = os.path.join(cache_directory, 'raw_graph.graphml')
+        self._home_filename = os.path.join(cache_directory, 'home.json')
+        self._landmarks_filename = os.path.join(cache_directory, 'landmarks.npz')
+        self._contraction_hierarchy_filename = os.path.join(cache_directory, 'contraction_hierarchy.npz')
+        self._import_state_filename = os.path.join(cache_directory, 'import_state.json')
+        self._database = InMemoryNeo4j()
+        self.stamp_point_gpx_filename = os.path.join(cache_directory, 'stamp_points.gpx')
+        self._write_stamp_point_gpx()
+
+    def _write_stamp_point_gpx(self) -> None:
+        gpx = gpxpy.gpx.GPX()
+        for stamp_point in self._instance.stamp_points:
+            if stamp_point.stamp_id > self._max_stamp_id:
+                raise ValueError(f"Stamp ID {stamp_point.stamp_id} has more than three digits.")
+            gpx.waypoints.append(gpxpy.gpx.GPXWaypoint(stamp_point.latitude, stamp_point.longitude,
+                                                       name=f"HWN{stamp_point.stamp_id:03d} {stamp_point.name}"))
+        with open(self.stamp_point_gpx_filename, 'w', encoding='utf-8') as file:
+            file.write(gpx.to_xml())
+
+    def _neo4j_session(self):
+        return self._database.session()
+
+    def _download_map(self, polygon: Polygon) -> nx.MultiDiGraph:
+        return self._instance.map.copy()
+
+    def _query_osm_nodes(self, osm_filter: str, osm_output: str, polygon_string: str) -> List[Tuple[int, float, float]]:
+        if osm_filter == self._bus_stop_osm_filter:
+            nodes = self._instance.bus_stops
+        elif osm_filter == self._parking_lot_osm_filter:
+            nodes = self._instance.parking_lots
+        else:
+            raise ValueError(f"Unknown OSM filter '{osm_filter}'.")
+        return [(node.osm_id, node.latitude, node.longitude) for node in nodes]
+
+    def _get_home_map(self, address: str) -> Tuple[Tuple[float, float], nx.MultiDiGraph, int]:
+        # the unsimplified network around the home node reaches intersections that are kept in the simplified map
+        home = self._instance.home
+        home_map = nx.ego_graph(self._instance.map, home.osm_id, radius=self._home_map_radius_m, distance='length')
+        return (home.latitude, home.longitude), home_map, home.osm_id
@@ -0,0 +1,441 @@
+"""
+In-memory stand-in for the Neo4j driver that runs the Cypher queries of GraphData on dictionaries.
+"""
+
+import hashlib
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class _Record(dict):
+    """
+    A result row with the accessors of a neo4j.Record used by GraphData.
+    """
+
+    def data(self) -> Dict:
+        return dict(self)
+
+
+class _Counters:
+    """
+    The update counters of a query summary used by GraphData.
+    """
+
+    __slots__ = ('nodes_created',)
+
+    def __init__(self, nodes_created: int):
+        self.nodes_created = nodes_created
+
+
+class _Summary:
+    """
+    The summary of a consumed result.
+    """
+
+    __slots__ = ('counters',)
+
+    def __init__(self, counters: _Counters):
+        self.counters = counters
+
+
+class _Result(list):
+    """
+    The records of a query, which like a neo4j.Result can be iterated or consumed into its summary.
+    """
+
+    def __init__(self, records: List[_Record], nodes_created: int = 0):
+        super().__init__(records)
+        self._summary = _Summary(_Counters(nodes_created))
+
+    def consume(self) -> _Summary:
+        return self._summary
+
+
+class _Node:
+    """
+    A stored node with its only label and its properties.
+    """
+
+    __slots__ = ('element_id', 'label', 'properties')
+
+    def __init__(self, element_id: str, label: str, properties: Dict):
+        self.element_id = element_id
+        self.label = label
+        self.properties = properties
+
+
+class _Relationship:
+    """
+    A TO relationship bound to a query variable, with the element IDs of its nodes and its stored properties.
+    """
+
+    __slots__ = ('start_id', 'end_id', 'properties')
+
+    def __init__(self, start_id: str, end_id: str, properties: Dict):
+        self.start_id = start_id
+        self.end_id = end_id
+        self.properties = properties
+
+
+class InMemoryNeo4j:
+    """
+    The nodes and TO relationships of a database, queried with the subset of Cypher that GraphData uses.
+
+    Every query is parsed into its clauses (UNWIND, MATCH, WHERE, MERGE, ON CREATE SET, SET, CREATE, DELETE,
+    DETACH DELETE, RETURN) and run on the bindings of its variables, so these queries of GraphData run unchanged.
+    Any other keyword or function raises NotImplementedError instead of returning wrong rows. The constraints and
+    indexes of the schema are accepted without effect, as the stamp IDs and OSM IDs are always indexed.
+
+    The node tables query of GraphData._read_tables (CALL subqueries with WITH, collect and list comprehensions) is
+    not interpreted but stubbed: _tables answers it in Python. The stub is pinned to the SHA-1 of the query text, so a
+    changed query raises NotImplementedError until _tables is checked against it and the checksum is updated.
+    """
+
+    _clause_pattern = re.compile(r'\b(UNWIND|MATCH|WHERE|MERGE|ON CREATE SET|SET|CREATE|DETACH DELETE|DELETE|RETURN)\b')
+    # keywords (clauses, operators and the relationship type) and functions the clauses are evaluated with
+    _keywords = {'UNWIND', 'MATCH', 'WHERE', 'MERGE', 'ON', 'CREATE', 'SET', 'DETACH', 'DELETE', 'RETURN',
+                 'AS', 'AND', 'OR', 'NOT', 'IS', 'NULL', 'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'TO'}
+    _functions = {'labels'}
+    # node properties with an index from their value to the node
+    _key_properties = ('stamp_id', 'osmid')
+    # the nodes and relationships of a CREATE pattern
+    _create_pattern = re.compile(r'\((\w*)(?::(\w+))?\s*(\{[^}]*\})?\)|-\[(\w*):TO\s*(\{[^}]*\})?\]->')
+    _tables_query_sha1 = 'e5ee73238e260142c310586b500d521f35e9792b'
+    _node_pattern = re.compile(r'\((\w*)(?::(\w+))?(?:\s*\{(\w+):\s*([^}]+)\})?\)')
+    _path_pattern = re.compile(r'^(\(.*?\))-\[(\w*):TO(?:\s*(\{.*?\}))?\]->(\(.*\))$')
+
+    def __init__(self):
+        self._nodes: Dict[str, _Node] = {}
+        self._next_id = 0
+        # node of each (label, key property, value), e.g. ('StampPoint', 'stamp_id', 17)
+        self._keys: Dict[Tuple[str, str, Any], _Node] = {}
+        # properties of the relationships leaving each node, keyed by the element IDs of both nodes
+        self._relationships: Dict[str, Dict[str, Dict]] = {}
+
+    def session(self) -> 'InMemoryNeo4j':
+        return self
+
+    def __enter__(self) -> 'InMemoryNeo4j':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def execute_read(self, work: Callable) -> Any:
+        return work(self)
+
+    def run(self, query: str, parameters: Optional[Dict] = None) -> _Result:
+        parameters = parameters or {}
+        if query.startswith(("CREATE CONSTRAINT ", "CREATE INDEX ")):
+            return _Result([])
+        if query.startswith("CALL {"):
+            if hashlib.sha1(query.encode('utf-8')).hexdigest() != self._tables_query_sha1:
+                raise NotImplementedError("The query of GraphData._read_tables changed, InMemoryNeo4j._tables has to "
+                                          "be checked against it and its checksum updated.")
+            return _Result([_Record(self._tables(parameters))])
+        self._check_supported(query)
+        parts = self._clause_pattern.split(query)
+        bindings = [{}]
+        created = set()
+        records = None
+        # the element IDs are numbered consecutively
+        next_id = self._next_id
+        for keyword, text in zip(parts[1::2], parts[2::2]):
+            text = text.strip()
+            if keyword == 'UNWIND':
+                source, variable = (part.strip() for part in text.split(' AS '))
+                bindings = [{variable: row} for binding in bindings for row in self._evaluate(source, binding, parameters)]
+            elif keyword == 'MATCH':
+                bindings = [matched for binding in bindings for matched in self._match(text, binding, parameters)]
+            elif keyword == 'WHERE':
+                bindings = [binding for binding in bindings if self._evaluate(text, binding, parameters)]
+            elif keyword == 'MERGE':
+                for binding in bindings:
+                    if self._merge(text, binding, parameters):
+                        created.add(id(binding))
+            elif keyword == 'ON CREATE SET':
+                for binding in bindings:
+                    if id(binding) in created:
+                        self._set(text, binding, parameters)
+            elif keyword == 'SET':
+                for binding in bindings:
+                    self._set(text, binding, parameters)
+            elif keyword == 'CREATE':
+                for binding in bindings:
+                    self._create(text, binding, parameters)
+            elif keyword in ('DELETE', 'DETACH DELETE'):
+                for binding in bindings:
+                    self._delete(text, binding, keyword == 'DETACH DELETE')
+            else:
+                items = [item.rsplit(' AS ', 1) for item in self._split(text, ',')]
+                records = [_Record((alias.strip(), self._evaluate(expression.strip(), binding, parameters))
+                                   for expression, alias in items)
+                           for binding in bindings]
+        return _Result(records if records is not None else [], self._next_id - next_id)
+
+    def _check_supported(self, query: str) -> None:
+        # Cypher keywords are written in upper case in GraphData, so every other upper case word is unsupported
+        for word in re.findall(r'\b[A-Z]{2,}\b', query):
+            if word not in self._keywords:
+                raise NotImplementedError(f"Unsupported Cypher keyword {word} in {query}")
+        if re.search(r'\bON\b(?! CREATE SET\b)', query):
+            raise NotImplementedError(f"Unsupported ON clause in {query}")
+        for function in re.findall(r'\b(\w+)\(', query):
+            if function not in self._functions:
+                raise NotImplementedError(f"Unsupported Cypher function {function}() in {query}")
+
+    @staticmethod
+    def _split(text: str, separator: str) -> List[str]:
+        # split at the separator outside of brackets and CASE expressions
+        parts = []
+        depth = 0
+        start = 0
+        i = 0
+        while i < len(text):
+            if text[i] in '([{':
+                depth += 1
+            elif text[i] in ')]}':
+                depth -= 1
+            elif text.startswith('CASE ', i):
+                depth += 1
+            elif text.startswith(' END', i):
+                depth -= 1
+            elif depth == 0 and text.startswith(separator, i):
+                parts.append(text[start:i])
+                start = i + len(separator)
+                i = start
+                continue
+            i += 1
+        parts.append(text[start:])
+        return [part.strip() for part in parts]
+
+    def _candidates(self, node_text: str, binding: Dict, parameters: Dict) -> Tuple[str, List[_Node]]:
+        # the variable of a node pattern and the stored nodes it may be bound to
+        match = self._node_pattern.fullmatch(node_text.strip())
+        if match is None:
+            raise NotImplementedError(f"Unsupported node pattern {node_text}.")
+        variable, label, key, value = match.groups()
+        if variable and variable in binding:
+            nodes = [binding[variable]]
+        elif label is not None and key in self._key_properties:
+            node = self._keys.get((label, key, self._evaluate(value, binding, parameters)))
+            nodes = [] if node is None else [node]
+        else:
+            nodes = list(self._nodes.values())
+        nodes = [node for node in nodes if label is None or node.label == label]
+        if key is not None:
+            nodes = [node for node in nodes
+                     if node.properties.get(key) == self._evaluate(value, binding, parameters)]
+        return variable, nodes
+
+    def _match(self, text: str, binding: Dict, parameters: Dict) -> List[Dict]:
+        path = self._path_pattern.match(text)
+        if path is None:
+            variable, nodes = self._candidates(text, binding, parameters)
+            return [{**binding, variable: node} if variable else binding for node in nodes]
+        node_text1, relationship, _, node_text2 = path.groups()
+        variable1, nodes1 = self._candidates(node_text1, binding, parameters)
+        matches = []
+        for node1 in nodes1:
+            binding1 = {**binding, variable1: node1} if variable1 else binding
+            variable2, nodes2 = self._candidates(node_text2, binding1, parameters)
+            relationships = self._relationships[node1.element_id]
+            if len(nodes2) > len(relationships):
+                candidate_ids = {node.element_id for node in nodes2}
+                nodes2 = [self._nodes[element_id] for element_id in relationships if element_id in candidate_ids]
+            for node2 in nodes2:
+                properties = relationships.get(node2.element_id)
+                if properties is not None:
+                    matched = {**binding1, variable2: node2} if variable2 else dict(binding1)
+                    if relationship:
+                        matched[relationship] = _Relationship(node1.element_id, node2.element_id, properties)
+                    matches.append(matched)
+        return matches
+
+    def _path_nodes(self, text: str, binding: Dict, parameters: Dict) -> Tuple[str, Optional[str], _Node, _Node]:
+        # the relationship variable, properties text and both (bound) nodes of a path in MERGE or CREATE
+        path = self._path_pattern.match(text)
+        if path is None:
+            raise NotImplementedError(f"Unsupported path {text}.")
+        node_text1, relationship, properties, node_text2 = path.groups()
+        nodes = []
+        for node_text in (node_text1, node_text2):
+            variable, candidates = self._candidates(node_text, binding, parameters)
+            if len(candidates) != 1:
+                raise NotImplementedError(f"The nodes of {text} have to be bound.")
+            nodes.append(candidates[0])
+        return relationship, properties, nodes[0], nodes[1]
+
+    def _add_node(self, label: str, properties: Dict) -> _Node:
+        self._next_id += 1
+        node = _Node(f"4:in-memory:{self._next_id}", label, {})
+        self._nodes[node.element_id] = node
+        self._relationships[node.element_id] = {}
+        for name, value in properties.items():
+            self._set_property(node, name, value)
+        return node
+
+    def _set_property(self, node: _Node, name: str, value: Any) -> None:
+        # keep the index of the key properties up to date
+        if name in self._key_properties:
+            if name in node.properties:
+                self._keys.pop((node.label, name, node.properties[name]), None)
+            self._keys[node.label, name, value] = node
+        node.properties[name] = value
+
+    def _merge(self, text: str, binding: Dict, parameters: Dict) -> bool:
+        if self._path_pattern.match(text) is None:
+            # a node identified by its label and key property
+            match = self._node_pattern.fullmatch(text)
+            if match is None or match.group(2) is None or match.group(3) is None:
+                raise NotImplementedError(f"Unsupported MERGE {text}.")
+            variable, label, key, value = match.groups()
+            _, nodes = self._candidates(text, binding, parameters)
+            is_created = len(nodes) == 0
+            node = self._add_node(label, {key: self._evaluate(value, binding, parameters)}) if is_created else nodes[0]
+            if variable:
+                binding[variable] = node
+            return is_created
+        relationship, _, node1, node2 = self._path_nodes(text, binding, parameters)
+        relationships = self._relationships[node1.element_id]
+        is_created = node2.element_id not in relationships
+        if is_created:
+            relationships[node2.element_id] = {}
+        if relationship:
+            binding[relationship] = _Relationship(node1.element_id, node2.element_id, relationships[node2.element_id])
+        return is_created
+
+    def _create(self, text: str, binding: Dict, parameters: Dict) -> None:
+        # a chain of bound or new nodes connected by new relationships
+        position = 0
+        previous = None
+        relationship_properties = None
+        for match in self._create_pattern.finditer(text):
+            if match.start() != position:
+                raise NotImplementedError(f"Unsupported CREATE {text}.")
+            position = match.end()
+            variable, label, node_properties, relationship, properties = match.groups()
+            if match.group(0).startswith('-'):
+                if previous is None or relationship:
+                    raise NotImplementedError(f"Unsupported CREATE {text}.")
+                relationship_properties = {} if properties is None else self._evaluate(properties, binding, parameters)
+                continue
+            if variable and variable in binding:
+                node = binding[variable]
+            else:
+                node = self._add_node(label, {} if node_properties is None
+                                      else self._evaluate(node_properties, binding, parameters))
+                if variable:
+                    binding[variable] = node
+            if relationship_properties is not None:
+                self._relationships[previous.element_id][node.element_id] = relationship_properties
+                relationship_properties = None
+            previous = node
+        if position != len(text) or relationship_properties is not None:
+            raise NotImplementedError(f"Unsupported CREATE {text}.")
+
+    def _set(self, text: str, binding: Dict, parameters: Dict) -> None:
+        for assignment in self._split(text, ','):
+            target, expression = (part.strip() for part in assignment.split('=', 1))
+            value = self._evaluate(expression, binding, parameters)
+            if '.' in target:
+                variable, name = target.split('.')
+                entity = binding[variable]
+                if isinstance(entity, _Node):
+                    self._set_property(entity, name, value)
+                else:
+                    entity.properties[name] = value
+            else:
+                # replace all properties of the relationship
+                binding[target].properties.clear()
+                binding[target].properties.update(value)
+
+    def _delete(self, text: str, binding: Dict, detach: bool) -> None:
+        for variable in self._split(text, ','):
+            entity = binding[variable]
+            if isinstance(entity, _Relationship):
+                self._relationships[entity.start_id].pop(entity.end_id, None)
+            elif detach:
+                if entity.element_id not in self._nodes:
+                    continue
+                for name in self._key_properties:
+                    if name in entity.properties:
+                        self._keys.pop((entity.label, name, entity.properties[name]), None)
+                del self._nodes[entity.element_id]
+                del self._relationships[entity.element_id]
+                for relationships in self._relationships.values():
+                    relationships.pop(entity.element_id, None)
+            else:
+                raise NotImplementedError(f"Nodes can only be deleted with DETACH DELETE, not {variable}.")
+
+    def _evaluate(self, text: str, binding: Dict, parameters: Dict) -> Any:
+        text = text.strip()
+        for separator in (' OR ', ' AND '):
+            parts = self._split(text, separator)
+            if len(parts) > 1:
+                values = [self._evaluate(part, binding, parameters) for part in parts]
+                return any(values) if separator == ' OR ' else all(values)
+        if text.startswith('NOT '):
+            return not self._evaluate(text[4:], binding, parameters)
+        if text.endswith(' IS NOT NULL'):
+            return self._evaluate(text[:-12], binding, parameters) is not None
+        parts = self._split(text, ' < ')
+        if len(parts) == 2:
+            value1, value2 = (self._evaluate(part, binding, parameters) for part in parts)
+            return value1 is not None and value2 is not None and value1 < value2
+        if text.startswith('$'):
+            return parameters[text[1:]]
+        if re.fullmatch(r"'[^']*'", text):
+            return text[1:-1]
+        if re.fullmatch(r'-?\d+(\.\d+)?', text):
+            return float(text) if '.' in text else int(text)
+        if text.startswith('{'):
+            return {name.strip(): self._evaluate(expression, binding, parameters)
+                    for name, expression in (item.split(':', 1) for item in self._split(text[1:-1], ','))}
+        case = re.fullmatch(r'CASE WHEN (.+?) THEN (.+?) ELSE (.+?) END', text)
+        if case is not None:
+            condition, then_value, else_value = case.groups()
+            return self._evaluate(then_value if self._evaluate(condition, binding, parameters) else else_value,
+                                  binding, parameters)
+        if self._path_pattern.match(text):
+            return len(self._match(text, binding, parameters)) > 0
+        if text.startswith('('):
+            return self._evaluate(text[1:-1], binding, parameters)
+        label = re.fullmatch(r'labels\((\w+)\)\[0\]', text)
+        if label is not None:
+            return binding[label.group(1)].label
+        has_label = re.fullmatch(r'(\w+):(\w+)', text)
+        if has_label is not None:
+            return binding[has_label.group(1)].label == has_label.group(2)
+        access = re.fullmatch(r'(\w+)\.(\w+)', text)
+        if access is not None:
+            entity = binding[access.group(1)]
+            # a stored node or relationship, or a row of UNWIND
+            return (entity if isinstance(entity, dict) else entity.properties).get(access.group(2))
+        if re.fullmatch(r'\w+', text) and text in binding:
+            return binding[text]
+        raise NotImplementedError(f"Unsupported expression {text}.")
+
+    def _tables(self, parameters: Dict) -> Dict[str, List]:
+        # the node tables and distances of _read_tables: nodes with a finite distance to or from them
+        infinity = parameters.get('infinity', math.inf)
+        relationships = [(from_id, to_id, properties['distance'])
+                         for from_id, to_relationships in self._relationships.items()
+                         for to_id, properties in to_relationships.items()
+                         if properties.get('distance') is not None and properties['distance'] < infinity]
+        connected = {element_id for from_id, to_id, _ in relationships for element_id in (from_id, to_id)}
+        tables = {}
+        for label, prefix in (('StampPoint', 'stamp_point'), ('BusStop', 'bus_stop'), ('ParkingLot', 'parking_lot')):
+            nodes = [node for node in self._nodes.values() if node.label == label and node.element_id in connected]
+            tables[f'{prefix}_ids'] = [node.element_id for node in nodes]
+            tables[f'{prefix}_latitudes'] = [node.properties['latitude'] for node in nodes]
+            tables[f'{prefix}_longitudes'] = [node.properties['longitude'] for node in nodes]
+            tables[f'{prefix}_osmids'] = [node.properties['osmid'] for node in nodes]
+        stamp_points = [self._nodes[element_id] for element_id in tables['stamp_point_ids']]
+        tables['stamp_point_stamp_ids'] = [node.properties['stamp_id'] for node in stamp_points]
+        tables['stamp_point_names'] = [node.properties['name'] for node in stamp_points]
+        tables['from_ids'] = [from_id for from_id, _, _ in relationships]
+        tables['to_ids'] = [to_id for _, to_id, _ in relationships]
+        tables['distances'] = [distance for _, _, distance in relationships]
+        return tables
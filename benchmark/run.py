@@ -0,0 +1,155 @@
+"""
+Offline benchmark of the import, solve and rendering phases on synthetic instances.
+
+Example:
+    python -m benchmark.run --stamp-points 20 40 --days 2 --output bench_output.json
+"""
+
+import argparse
+from contextlib import contextmanager
+import datetime
+import json
+import os.path
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+from model.metrics import Metrics
+from model.problem_solver import ProblemSolver
+from benchmark.synthetic import generate_instance
+from benchmark.in_memory_graph_data import InMemoryGraphData
+
+
+_home_address = "Synthetic Home"
+
+
+@contextmanager
+def _timer(timings: Dict[str, float], phase: str):
+    start = time.perf_counter()
+    yield
+    timings[phase] = time.perf_counter() - start
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_instance(stamp_point_count: int,
+                 bus_stop_count: int,
+                 parking_lot_count: int,
+                 grid_size: int,
+                 seed: int,
+                 max_section_length_m: Optional[float],
+                 days: int,
+                 maximum_daily_distance: float,
+                 min_stamps: int,
+                 max_bus_days: int,
+                 max_parking_days: int,
+                 prioritized_solver_str: Optional[str],
+                 contraction_hierarchy: bool = False,
+                 nearest_neighbours: Optional[int] = None,
+                 nearest_neighbour_radius_m: Optional[float] = None) -> Dict:
+    """
+    Generates one synthetic instance and returns the duration of each phase in seconds and the recorded metrics.
+    """
+    timings = {}
+    metrics = Metrics()
+    with tempfile.TemporaryDirectory() as cache_directory:
+        with _timer(timings, 'generate'):
+            instance = generate_instance(stamp_point_count, bus_stop_count, parking_lot_count, grid_size=grid_size, seed=seed)
+        data = InMemoryGraphData(instance, cache_directory, metrics=metrics, contraction_hierarchy=contraction_hierarchy)
+        with _timer(timings, 'distance_import'):
+            data.import_data(data.stamp_point_gpx_filename,
+                             ignore_radius=0.0,
+                             max_section_length_m=max_section_length_m,
+                             nearest_neighbours=nearest_neighbours,
+                             nearest_neighbour_radius_m=nearest_neighbour_radius_m)
+        with _timer(timings, 'home_cache'):
+            data.get_home_stamp_distances(_home_address)
+
+        solution = ProblemSolver(data).solve(days, maximum_daily_distance, min_stamps, _home_address,
+                                             max_bus_days=max_bus_days,
+                                             max_parking_days=max_parking_days,
+                                             prioritized_solver_str=prioritized_solver_str)
+        solver_phases = metrics.to_dict()
+        timings['model_build'] = solver_phases['build_model']['duration']
+        timings['solve'] = solver_phases['solve_model']['duration']
+        timings['extract'] = solver_phases['extract_solution']['duration']
+
+        with _timer(timings, 'render_markers'):
+            solution.visualize_html(os.path.join(cache_directory, 'markers.html'))
+        with _timer(timings, 'render_geojson'):
+            solution.visualize_html(os.path.join(cache_directory, 'geojson.html'), mode='geojson',
+                                    context_nodes=data.stamp_points.values())
+
+    build_model = solver_phases['build_model']
+    return {
+        'phases': timings,
+        'model': {key: build_model[key] for key in ('variables', 'constraints', 'nonzeros')},
+        'metrics': metrics.to_dict(),
+        'arcs': sum(len(to_distances) for to_distances in data.distances.values()),
+        'visited_stamps': sum(len(tour) - 2 for tour in solution.tours),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stamp-points', type=int, nargs='+', default=[20, 40])
+    parser.add_argument('--bus-stops', type=int, default=5)
+    parser.add_argument('--parking-lots', type=int, default=5)
+    parser.add_argument('--grid-size', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-section-length', type=float, default=3000.0)
+    parser.add_argument('--days', type=int, default=2)
+    parser.add_argument('--maximum-daily-distance', type=float, default=15000.0)
+    parser.add_argument('--min-stamps', type=int, default=6)
+    parser.add_argument('--max-bus-days', type=int, default=1)
+    parser.add_argument('--max-parking-days', type=int, default=1)
+    parser.add_argument('--solver', default=None, help="e.g. GLPK_CMD, CPLEX_CMD, GUROBI, PULP_CBC_CMD")
+    parser.add_argument('--contraction-hierarchy', action='store_true', help="route with a contraction hierarchy")
+    parser.add_argument('--nearest-neighbours', type=int, default=None,
+                        help="import only arcs to the nearest stamp points instead of all pairs within the maximum section length")
+    parser.add_argument('--nearest-neighbour-radius', type=float, default=None,
+                        help="with --nearest-neighbours, also import all arcs shorter than this radius in meters")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default=None, help="JSON file for the results (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for stamp_point_count in args.stamp_points:
+        instance = {'stamp_points': stamp_point_count, 'bus_stops': args.bus_stops, 'parking_lots': args.parking_lots,
+                    'grid_size': args.grid_size, 'seed': args.seed, 'max_section_length_m': args.max_section_length,
+                    'days': args.days, 'maximum_daily_distance': args.maximum_daily_distance,
+                    'min_stamps': args.min_stamps, 'contraction_hierarchy': args.contraction_hierarchy,
+                    'nearest_neighbours': args.nearest_neighbours,
+                    'nearest_neighbour_radius_m': args.nearest_neighbour_radius}
+        runs = [run_instance(stamp_point_count, args.bus_stops, args.parking_lots, args.grid_size, args.seed,
+                             args.max_section_length, args.days, args.maximum_daily_distance, args.min_stamps,
+                             args.max_bus_days, args.max_parking_days, args.solver, args.contraction_hierarchy,
+                             args.nearest_neighbours, args.nearest_neighbour_radius)
+                for _ in range(args.repeat)]
+        best = {phase: min(run['phases'][phase] for run in runs) for phase in runs[0]['phases']}
+        results.append({'instance': instance, 'best': best, 'runs': runs})
+
+    output = {
+        'commit': _git_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(output, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(output, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
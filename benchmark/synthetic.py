@@ -0,0 +1,88 @@
+"""
+Generator for synthetic, Harz-like hiking instances that need neither network access nor Neo4j.
+"""
+
+from dataclasses import dataclass
+from typing import List
+import random
+import networkx as nx
+import osmnx as ox
+from model.stamp_point import StampPoint
+from model.bus_stop import BusStop
+from model.parking_lot import ParkingLot
+from model.home import Home
+
+
+@dataclass
+class SyntheticInstance:
+    """
+    A synthetic walk network together with stamp points, bus stops, parking lots and a home node on it.
+    """
+
+    map: nx.MultiDiGraph
+    stamp_points: List[StampPoint]
+    bus_stops: List[BusStop]
+    parking_lots: List[ParkingLot]
+    home: Home
+
+
+def generate_instance(stamp_point_count: int,
+                      bus_stop_count: int,
+                      parking_lot_count: int,
+                      grid_size: int = 60,
+                      spacing_m: float = 150.0,
+                      seed: int = 0) -> SyntheticInstance:
+    """
+    Generates a perturbed grid walk network of grid_size x grid_size intersections around the Brocken and places
+    the given number of stamp points, bus stops and parking lots on distinct network nodes.
+    """
+    rng = random.Random(seed)
+    center_lat, center_lon = 51.80, 10.62
+    lat_step = spacing_m / 111320.0
+    lon_step = spacing_m / (111320.0 * 0.6185)  # cos(51.8°)
+
+    # intersections with some positional noise
+    graph = nx.MultiDiGraph(crs='epsg:4326')
+    for i in range(grid_size):
+        for j in range(grid_size):
+            osmid = i * grid_size + j + 1
+            lat = center_lat + (i - grid_size / 2 + rng.uniform(-0.3, 0.3)) * lat_step
+            lon = center_lon + (j - grid_size / 2 + rng.uniform(-0.3, 0.3)) * lon_step
+            graph.add_node(osmid, y=lat, x=lon, street_count=4)
+
+    # winding trails between neighbouring intersections, some of them missing
+    for i in range(grid_size):
+        for j in range(grid_size):
+            u = i * grid_size + j + 1
+            for v in ([u + grid_size] if i + 1 < grid_size else []) + ([u + 1] if j + 1 < grid_size else []):
+                if rng.random() < 0.15:
+                    continue
+                length = rng.uniform(1.0, 1.6) * ox.distance.great_circle(
+                    graph.nodes[u]['y'], graph.nodes[u]['x'], graph.nodes[v]['y'], graph.nodes[v]['x'])
+                graph.add_edge(u, v, length=length)
+                graph.add_edge(v, u, length=length)
+    largest_component = max(nx.weakly_connected_components(graph), key=len)
+    graph = graph.subgraph(largest_component).copy()
+
+    # distinct nodes for all points of interest
+    osmids = rng.sample(sorted(graph.nodes), stamp_point_count + bus_stop_count + parking_lot_count + 1)
+    def coords(osmid):
+        return graph.nodes[osmid]['y'], graph.nodes[osmid]['x']
+
+    stamp_points = []
+    for k, osmid in enumerate(osmids[:stamp_point_count]):
+        graph.nodes[osmid]['keep'] = True
+        stamp_points.append(StampPoint(f"stamp:{k+1}", *coords(osmid), osmid, k+1, f"Stempelstelle {k+1}"))
+    osmids = osmids[stamp_point_count:]
+    bus_stops = []
+    for k, osmid in enumerate(osmids[:bus_stop_count]):
+        graph.nodes[osmid]['keep'] = True
+        bus_stops.append(BusStop(f"bus:{k+1}", *coords(osmid), osmid))
+    osmids = osmids[bus_stop_count:]
+    parking_lots = []
+    for k, osmid in enumerate(osmids[:parking_lot_count]):
+        graph.nodes[osmid]['keep'] = True
+        parking_lots.append(ParkingLot(f"parking:{k+1}", *coords(osmid), osmid))
+    home = Home("home", *coords(osmids[-1]), osmids[-1])
+
+    return SyntheticInstance(graph, stamp_points, bus_stops, parking_lots, home)
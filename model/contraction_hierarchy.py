@@ -0,0 +1,183 @@
+"""
+ContractionHierarchy class for fast shortest distance queries between nodes of the walk network.
+"""
+
+import heapq
+import math
+from typing import Dict, List, Tuple
+import numpy as np
+import networkx as nx
+
+
+class ContractionHierarchy:
+    """
+    A contraction hierarchy of the walk network.
+
+    The nodes are contracted one by one in the order of their edge difference. Contracting a node adds a shortcut
+    between two of its neighbours unless a witness search finds a path between them that is not longer, so the
+    shortest distances between the remaining nodes are preserved. A query then only searches upwards in the
+    contraction order from both ends, which settles few nodes regardless of the size of the network.
+    """
+
+    # nodes settled by a witness search before a shortcut is added without proof that it is needed
+    _witness_settled_limit = 100
+
+    def __init__(self, osmids: np.ndarray, forward_edges: np.ndarray, backward_edges: np.ndarray, fingerprint: str = ''):
+        """
+        The edges are rows (from, to, length) with positions in osmids, each leading to a node contracted later.
+        The backward edges are reversed, so that the search from the destination also follows them forward.
+        The fingerprint identifies the map the hierarchy was built for.
+        """
+        self.fingerprint = fingerprint
+        self._osmids = osmids
+        self._forward_edges = forward_edges
+        self._backward_edges = backward_edges
+        self._positions = {int(osmid): i for i, osmid in enumerate(osmids)}
+        self._forward = self._adjacency(forward_edges)
+        self._backward = self._adjacency(backward_edges)
+
+    def _adjacency(self, edges: np.ndarray) -> List[List[Tuple[int, float]]]:
+        adjacency = [[] for _ in range(len(self._osmids))]
+        for from_position, to_position, length in edges:
+            adjacency[int(from_position)].append((int(to_position), float(length)))
+        return adjacency
+
+    @classmethod
+    def build(cls, graph: nx.MultiDiGraph) -> 'ContractionHierarchy':
+        """
+        Contracts all nodes of the graph, using the shortest parallel edge between two nodes.
+        """
+        osmids = np.array(list(graph.nodes), dtype=np.int64)
+        positions = {osmid: i for i, osmid in enumerate(graph.nodes)}
+        out_edges: List[Dict[int, float]] = [{} for _ in range(len(osmids))]
+        in_edges: List[Dict[int, float]] = [{} for _ in range(len(osmids))]
+        for u, v, length in graph.edges(data='length'):
+            i, j = positions[u], positions[v]
+            if i != j and length < out_edges[i].get(j, math.inf):
+                out_edges[i][j] = length
+                in_edges[j][i] = length
+        deleted_neighbours = [0] * len(osmids)
+
+        def shortcuts(node):
+            needed = []
+            for u, in_length in in_edges[node].items():
+                targets = {w: in_length + out_length for w, out_length in out_edges[node].items() if w != u}
+                if not targets:
+                    continue
+                witnesses = cls._witness_search(out_edges, u, node, max(targets.values()), set(targets))
+                for w, length in targets.items():
+                    if witnesses.get(w, math.inf) > length:
+                        needed.append((u, w, length))
+            return needed
+
+        def priority(node, node_shortcuts):
+            return len(node_shortcuts) - len(in_edges[node]) - len(out_edges[node]) + deleted_neighbours[node]
+
+        forward_edges = []
+        backward_edges = []
+        heap = [(priority(node, shortcuts(node)), node) for node in range(len(osmids))]
+        heapq.heapify(heap)
+        while heap:
+            _, node = heapq.heappop(heap)
+            # lazy update: contract the node only if it still has the smallest priority
+            new_shortcuts = shortcuts(node)
+            current_priority = priority(node, new_shortcuts)
+            if heap and current_priority > heap[0][0]:
+                heapq.heappush(heap, (current_priority, node))
+                continue
+            for w, length in out_edges[node].items():
+                forward_edges.append((node, w, length))
+                del in_edges[w][node]
+                deleted_neighbours[w] += 1
+            for u, length in in_edges[node].items():
+                backward_edges.append((node, u, length))
+                del out_edges[u][node]
+                deleted_neighbours[u] += 1
+            out_edges[node] = {}
+            in_edges[node] = {}
+            for u, w, length in new_shortcuts:
+                if length < out_edges[u].get(w, math.inf):
+                    out_edges[u][w] = length
+                    in_edges[w][u] = length
+        return cls(osmids,
+                   np.array(forward_edges, dtype=np.float64).reshape(-1, 3),
+                   np.array(backward_edges, dtype=np.float64).reshape(-1, 3))
+
+    @classmethod
+    def _witness_search(cls,
+                        out_edges: List[Dict[int, float]],
+                        source: int,
+                        skipped: int,
+                        max_length: float,
+                        targets: set) -> Dict[int, float]:
+        # lengths of paths from the source avoiding the skipped node (tentative lengths are real paths as well)
+        lengths = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and targets and settled < cls._witness_settled_limit:
+            length, node = heapq.heappop(heap)
+            if length > lengths[node]:
+                continue
+            if length > max_length:
+                break
+            settled += 1
+            targets.discard(node)
+            for neighbour, edge_length in out_edges[node].items():
+                if neighbour != skipped and length + edge_length < lengths.get(neighbour, math.inf):
+                    lengths[neighbour] = length + edge_length
+                    heapq.heappush(heap, (length + edge_length, neighbour))
+        return lengths
+
+    def save(self, filename: str) -> None:
+        np.savez_compressed(filename, osmids=self._osmids,
+                            forward_edges=self._forward_edges, backward_edges=self._backward_edges,
+                            fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, filename: str) -> 'ContractionHierarchy':
+        with np.load(filename) as data:
+            fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else ''
+            return cls(data['osmids'], data['forward_edges'], data['backward_edges'], fingerprint)
+
+    def __contains__(self, osmid: int) -> bool:
+        return osmid in self._positions
+
+    @staticmethod
+    def _upward_search(adjacency: List[List[Tuple[int, float]]], source: int) -> Dict[int, float]:
+        lengths = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = set()
+        while heap:
+            length, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            for neighbour, edge_length in adjacency[node]:
+                if length + edge_length < lengths.get(neighbour, math.inf):
+                    lengths[neighbour] = length + edge_length
+                    heapq.heappush(heap, (length + edge_length, neighbour))
+        return lengths
+
+    def distance_table(self, origin_osmids: List[int], destination_osmids: List[int]) -> List[List[float]]:
+        """
+        Returns the shortest distance from every origin to every destination (inf if there is no route).
+        """
+        try:
+            origins = [self._positions[osmid] for osmid in origin_osmids]
+            destinations = [self._positions[osmid] for osmid in destination_osmids]
+        except KeyError as exc:
+            raise ValueError(f"Node with osmid {exc.args[0]} is not part of the contraction hierarchy.") from exc
+        # the backward search space of every destination is stored in buckets at the nodes it reaches
+        buckets: Dict[int, List[Tuple[int, float]]] = {}
+        for column, destination in enumerate(destinations):
+            for node, length in self._upward_search(self._backward, destination).items():
+                buckets.setdefault(node, []).append((column, length))
+        table = []
+        for origin in origins:
+            row = [math.inf] * len(destinations)
+            for node, length in self._upward_search(self._forward, origin).items():
+                for column, bucket_length in buckets.get(node, ()):
+                    if length + bucket_length < row[column]:
+                        row[column] = length + bucket_length
+            table.append(row)
+        return table
@@ -0,0 +1,333 @@
+"""
+This module contains the DecomposedProblemSolver class which solves hiking route problems with many days
+by splitting them into geographic clusters.
+
+Classes
+DecomposedProblemSolver
+"""
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+import math
+from typing import Callable, Dict, List, Optional, Set
+import networkx as nx
+import osmnx as ox
+from model.problem_solver import InfeasibleError, ProblemSolver, SolverTimeoutError
+from model.solution import Solution
+
+
+@dataclass(eq=False)
+class _Cluster:
+    """
+    A group of stamp points with the start nodes next to them and its share of the days and limits.
+    """
+
+    medoids: Set[int]
+    stamp_point_ids: Set[int]
+    start_ids: Set[int]
+    days: int = 0
+    min_stamps: int = 0
+    max_bus_days: int = 0
+    max_parking_days: int = 0
+    solution: Optional[Solution] = None
+
+
+class DecomposedProblemSolver(ProblemSolver):
+    """
+    A problem solver for plans with many days, for which the monolithic model becomes too large.
+
+    The stamp points are clustered with k-medoids on their walking distances. The days, the minimum number of stamps
+    and the bus and parking days are shared among the clusters in proportion to their size, and the clusters are
+    solved in parallel, each with the bus stops and parking lots connected to its stamp points. A cluster that is
+    infeasible or not solved within the time limit is merged with its nearest cluster, and neighbouring clusters are merged and solved again as long as this
+    shortens the plan. The solution reports its gap against a lower bound of the whole problem.
+    """
+
+    _max_medoid_iterations = 20
+    # penalty on the straight line distance between stamp points that are not connected by sections
+    _disconnected_factor = 2.0
+    # minimum saving in meters for accepting a merge of two clusters
+    _min_improvement_m = 1.0
+
+    def solve(self,
+              days: int,
+              maximum_daily_distance: float,
+              min_stamps: int,
+              home_address: str,
+              max_bus_days: int = 0,
+              max_parking_days: int = 0,
+              ignore_stamp_ids: Set[int] = set(),
+              prioritized_solver_str: Optional[str] = None,
+              time_limit: Optional[float] = None,
+              formulation: str = 'directed',
+              clusters: Optional[int] = None,
+              workers: int = 4,
+              improvement_rounds: int = 1) -> Solution:
+        """
+        Solves the hiking route problem like ProblemSolver.solve, split into the given number of clusters
+        (one per day by default) that are solved by up to workers threads. The time_limit applies to every
+        cluster and every merge attempted in the improvement_rounds.
+        """
+        home_stamp_distances = self.data.get_home_stamp_distances(home_address)
+        stamp_point_ids = [stamp_point_id for stamp_point_id in self.data.stamp_points
+                           if self.data.node(stamp_point_id).stamp_id not in ignore_stamp_ids]
+        if not stamp_point_ids:
+            raise InfeasibleError("Problem configuration is infeasible.")
+
+        with self.metrics.phase('lower_bound'):
+            lower_bound = self._lower_bound(days, min_stamps, stamp_point_ids, home_stamp_distances)
+        with self.metrics.phase('cluster') as values:
+            distances = self._walking_distances(stamp_point_ids)
+            cluster_count = min(days, len(stamp_point_ids), clusters if clusters is not None else days)
+            cluster_list = self._cluster(stamp_point_ids, cluster_count, distances)
+            self._share(cluster_list, days, min_stamps, max_bus_days, max_parking_days)
+            values['clusters'] = len(cluster_list)
+
+        def solve_cluster(cluster: _Cluster) -> Optional[Solution]:
+            return self._solve_cluster(cluster, maximum_daily_distance, home_address, ignore_stamp_ids,
+                                       prioritized_solver_str, time_limit, formulation)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            with self.metrics.phase('solve_clusters') as values:
+                cluster_list = self._solve_clusters(cluster_list, solve_cluster, executor, distances)
+                values['clusters'] = len(cluster_list)
+            with self.metrics.phase('improve_clusters') as values:
+                values['merges'] = 0
+                for _ in range(improvement_rounds):
+                    cluster_list, merges = self._improve(cluster_list, solve_cluster, executor, distances)
+                    values['merges'] += merges
+                    if merges == 0:
+                        break
+
+        tours = [tour for cluster in cluster_list for tour in cluster.solution.tours]
+        distance = sum(cluster.solution.distance for cluster in cluster_list)
+        return Solution(tours, distance=distance, lower_bound=lower_bound)
+
+    def _lower_bound(self,
+                     days: int,
+                     min_stamps: int,
+                     stamp_point_ids: List[int],
+                     home_stamp_distances: Dict[int, float]) -> float:
+        # every visited stamp point is entered by one section and every day visits at least one stamp point and
+        # ends with one section back to its start node (bus stop, parking lot or home)
+        stamp_point_id_set = set(stamp_point_ids)
+        start_ids = set(self.data.bus_stops) | set(self.data.parking_lots)
+        entries = []
+        for stamp_point_id in stamp_point_ids:
+            candidates = [distance for from_id, distance in self.data.distances_reverse.get(stamp_point_id, {}).items()
+                          if from_id in stamp_point_id_set or from_id in start_ids]
+            if stamp_point_id in home_stamp_distances:
+                candidates.append(home_stamp_distances[stamp_point_id])
+            if candidates:
+                entries.append(min(candidates))
+        closings = [home_stamp_distances[stamp_point_id] for stamp_point_id in stamp_point_ids
+                    if stamp_point_id in home_stamp_distances]
+        for start_id in start_ids:
+            closings += [distance for from_id, distance in self.data.distances_reverse.get(start_id, {}).items()
+                         if from_id in stamp_point_id_set]
+        visited_stamps = max(min_stamps, days)
+        if len(entries) < visited_stamps or not closings:
+            raise InfeasibleError("Problem configuration is infeasible.")
+        return sum(sorted(entries)[:visited_stamps]) + days * min(closings)
+
+    def _walking_distances(self, stamp_point_ids: List[int]) -> Dict[int, Dict[int, float]]:
+        graph = nx.Graph()
+        for from_id, to_distances in self.data.distances.items():
+            for to_id, distance in to_distances.items():
+                if not graph.has_edge(from_id, to_id) or distance < graph[from_id][to_id]['weight']:
+                    graph.add_edge(from_id, to_id, weight=distance)
+        distances = {}
+        for stamp_point_id in stamp_point_ids:
+            lengths = nx.single_source_dijkstra_path_length(graph, stamp_point_id) if stamp_point_id in graph else {}
+            node = self.data.node(stamp_point_id)
+            distances[stamp_point_id] = {}
+            for other_id in stamp_point_ids:
+                if other_id in lengths:
+                    distances[stamp_point_id][other_id] = lengths[other_id]
+                else:
+                    other = self.data.node(other_id)
+                    distances[stamp_point_id][other_id] = self._disconnected_factor * \
+                        ox.distance.great_circle(node.latitude, node.longitude, other.latitude, other.longitude)
+        return distances
+
+    def _cluster(self,
+                 stamp_point_ids: List[int],
+                 cluster_count: int,
+                 distances: Dict[int, Dict[int, float]]) -> List[_Cluster]:
+        def assign(medoids):
+            members = {medoid: [] for medoid in medoids}
+            for stamp_point_id in stamp_point_ids:
+                members[min(medoids, key=lambda medoid: distances[stamp_point_id][medoid])].append(stamp_point_id)
+            return {medoid: group for medoid, group in members.items() if group}
+
+        # deterministic start with the most central stamp point, then always the farthest one
+        medoids = [min(stamp_point_ids, key=lambda stamp_point_id: sum(distances[stamp_point_id].values()))]
+        while len(medoids) < cluster_count:
+            medoids.append(max(stamp_point_ids,
+                               key=lambda stamp_point_id: min(distances[stamp_point_id][medoid] for medoid in medoids)))
+        for _ in range(self._max_medoid_iterations):
+            new_medoids = [min(group, key=lambda stamp_point_id: sum(distances[stamp_point_id][other_id] for other_id in group))
+                           for group in assign(medoids).values()]
+            if set(new_medoids) == set(medoids):
+                break
+            medoids = new_medoids
+
+        start_ids = set(self.data.bus_stops) | set(self.data.parking_lots)
+        cluster_list = []
+        for medoid, group in assign(medoids).items():
+            group = set(group)
+            # the bus stops and parking lots with a section to or from the stamp points of the cluster
+            cluster_start_ids = {start_id for start_id in start_ids
+                                 if not group.isdisjoint(self.data.distances.get(start_id, {}))
+                                 or not group.isdisjoint(self.data.distances_reverse.get(start_id, {}))}
+            cluster_list.append(_Cluster({medoid}, group, cluster_start_ids))
+        return cluster_list
+
+    def _share(self,
+               cluster_list: List[_Cluster],
+               days: int,
+               min_stamps: int,
+               max_bus_days: int,
+               max_parking_days: int) -> None:
+        sizes = [len(cluster.stamp_point_ids) for cluster in cluster_list]
+        cluster_days = [1 + extra_days for extra_days in
+                        self._apportion(days - len(cluster_list), sizes, [days] * len(cluster_list))]
+        cluster_min_stamps = self._apportion(min_stamps, cluster_days, sizes)
+        bus_caps = [cluster_days[i] if not cluster.start_ids.isdisjoint(self.data.bus_stops) else 0
+                    for i, cluster in enumerate(cluster_list)]
+        cluster_bus_days = self._apportion(min(max_bus_days, sum(bus_caps)), cluster_days, bus_caps)
+        parking_caps = [cluster_days[i] if not cluster.start_ids.isdisjoint(self.data.parking_lots) else 0
+                        for i, cluster in enumerate(cluster_list)]
+        cluster_parking_days = self._apportion(min(max_parking_days, sum(parking_caps)), cluster_days, parking_caps)
+        for i, cluster in enumerate(cluster_list):
+            cluster.days = cluster_days[i]
+            cluster.min_stamps = cluster_min_stamps[i]
+            cluster.max_bus_days = cluster_bus_days[i]
+            cluster.max_parking_days = cluster_parking_days[i]
+
+    @staticmethod
+    def _apportion(total: int, weights: List[float], caps: List[int]) -> List[int]:
+        # largest remainder method, where every share is limited by its cap
+        shares = [0] * len(weights)
+        remaining = total
+        while remaining > 0:
+            open_ids = [i for i in range(len(weights)) if shares[i] < caps[i]]
+            if not open_ids:
+                raise InfeasibleError("Problem configuration is infeasible.")
+            weight_sum = sum(weights[i] for i in open_ids)
+            quotas = {i: remaining * weights[i] / weight_sum for i in open_ids}
+            added = 0
+            for i in open_ids:
+                share = min(caps[i] - shares[i], math.floor(quotas[i]))
+                shares[i] += share
+                added += share
+            if added == 0:
+                for i in sorted(open_ids, key=lambda i: quotas[i] - math.floor(quotas[i]), reverse=True)[:remaining]:
+                    shares[i] += 1
+                    added += 1
+            remaining -= added
+        return shares
+
+    def _solve_cluster(self,
+                       cluster: _Cluster,
+                       maximum_daily_distance: float,
+                       home_address: str,
+                       ignore_stamp_ids: Set[int],
+                       prioritized_solver_str: Optional[str],
+                       time_limit: Optional[float],
+                       formulation: str) -> Optional[Solution]:
+        ignore_node_ids = (set(self.data.stamp_points) | set(self.data.bus_stops) | set(self.data.parking_lots)) \
+            - cluster.stamp_point_ids - cluster.start_ids
+        try:
+            with self.metrics.phase('build_model') as values:
+                model = self._build_model(cluster.days, maximum_daily_distance, cluster.min_stamps, home_address,
+                                          cluster.max_bus_days, cluster.max_parking_days, ignore_stamp_ids,
+                                          ignore_node_ids, formulation)
+                values.update(self._model_statistics(model.problem))
+            with self.metrics.phase('solve_model') as values:
+                self._solve_model(model, prioritized_solver_str, time_limit)
+                values['solver_seconds'] = model.problem.solutionTime
+        except (InfeasibleError, SolverTimeoutError):
+            # no solution within the time limit is treated like an infeasible cluster
+            return None
+        with self.metrics.phase('extract_solution'):
+            return self._extract_solution(model)
+
+    @staticmethod
+    def _merge(cluster: _Cluster, other: _Cluster) -> _Cluster:
+        return _Cluster(cluster.medoids | other.medoids,
+                        cluster.stamp_point_ids | other.stamp_point_ids,
+                        cluster.start_ids | other.start_ids,
+                        cluster.days + other.days,
+                        cluster.min_stamps + other.min_stamps,
+                        cluster.max_bus_days + other.max_bus_days,
+                        cluster.max_parking_days + other.max_parking_days)
+
+    @staticmethod
+    def _nearest(cluster: _Cluster, cluster_list: List[_Cluster], distances: Dict[int, Dict[int, float]]) -> _Cluster:
+        return min((other for other in cluster_list if other is not cluster),
+                   key=lambda other: min(distances[medoid][other_medoid]
+                                         for medoid in cluster.medoids for other_medoid in other.medoids))
+
+    def _solve_clusters(self,
+                        cluster_list: List[_Cluster],
+                        solve_cluster: Callable[[_Cluster], Optional[Solution]],
+                        executor: Executor,
+                        distances: Dict[int, Dict[int, float]]) -> List[_Cluster]:
+        cluster_list = list(cluster_list)
+        pending = list(cluster_list)
+        while pending:
+            for cluster, solution in zip(pending, executor.map(solve_cluster, pending)):
+                cluster.solution = solution
+            infeasible = [cluster for cluster in cluster_list if cluster.solution is None]
+            if infeasible and len(cluster_list) == 1:
+                raise InfeasibleError("Problem configuration is infeasible.")
+            # merge every infeasible cluster with its nearest cluster and solve the merged cluster
+            pending = []
+            for cluster in infeasible:
+                if cluster not in cluster_list or len(cluster_list) == 1:
+                    continue
+                nearest = self._nearest(cluster, cluster_list, distances)
+                merged = self._merge(cluster, nearest)
+                cluster_list = [other for other in cluster_list if other is not cluster and other is not nearest]
+                cluster_list.append(merged)
+                pending = [other for other in pending if other is not nearest] + [merged]
+        return cluster_list
+
+    def _improve(self,
+                 cluster_list: List[_Cluster],
+                 solve_cluster: Callable[[_Cluster], Optional[Solution]],
+                 executor: Executor,
+                 distances: Dict[int, Dict[int, float]]):
+        # solve every cluster together with its nearest cluster, so that tours can cross the cluster border
+        if len(cluster_list) < 2:
+            return cluster_list, 0
+        pairs = []
+        for cluster in cluster_list:
+            nearest = self._nearest(cluster, cluster_list, distances)
+            if not any(nearest is first and cluster is second for first, second in pairs):
+                pairs.append((cluster, nearest))
+        merged_list = [self._merge(first, second) for first, second in pairs]
+
+        def solve_merged(merged: _Cluster) -> Optional[Solution]:
+            # a merge the solver fails on is no improvement, the solutions of its clusters are kept
+            try:
+                return solve_cluster(merged)
+            except RuntimeError:
+                return None
+
+        for merged, solution in zip(merged_list, executor.map(solve_merged, merged_list)):
+            merged.solution = solution
+        savings = []
+        for (first, second), merged in zip(pairs, merged_list):
+            if merged.solution is not None:
+                saving = first.solution.distance + second.solution.distance - merged.solution.distance
+                if saving >= self._min_improvement_m:
+                    savings.append((saving, first, second, merged))
+        # accept the largest savings of disjoint pairs
+        merges = 0
+        for _, first, second, merged in sorted(savings, key=lambda entry: entry[0], reverse=True):
+            if first in cluster_list and second in cluster_list:
+                cluster_list = [other for other in cluster_list if other is not first and other is not second]
+                cluster_list.append(merged)
+                merges += 1
+        return cluster_list, merges
@@ -2,10 +2,13 @@
 GraphData class for managing and importing geographical data into a Neo4j database.
 """
 
+import hashlib
 import json
+import math
 import os  # os.remove
 import os.path  # os.path.isfile
-from typing import Dict, Optional
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from neo4j import GraphDatabase
 import gpxpy
 import numpy as np
@@ -21,6 +24,12 @@ from model.stamp_point import StampPoint
 from model.bus_stop import BusStop
 from model.parking_lot import ParkingLot
 from model.home import Home
+from model.node_registry import NodeRegistry
+from model.metrics import Metrics
+from model.tiled_map import TiledMap
+from model.landmarks import LandmarkIndex
+from model.contraction_hierarchy import ContractionHierarchy
+from model.import_state import ImportState
 
 
 class GraphData:
@@ -29,131 +38,215 @@ class GraphData:
     """
 
     _map_filename = 'cache/graph.graphml'
+    _raw_map_filename = 'cache/raw_graph.graphml'
+    _import_state_filename = 'cache/import_state.json'
+    _tiles_directory = 'cache/tiles'
+    _landmarks_filename = 'cache/landmarks.npz'
+    _contraction_hierarchy_filename = 'cache/contraction_hierarchy.npz'
     _map_enlarge_factor = 1.1
     _threads = 1
     _home_filename = 'cache/home.json'
+    # straight line candidates per node for every nearest neighbour kept by walking distance
+    _nearest_neighbour_candidate_factor = 2
+    # source nodes routed between two checkpoints of the distance import
+    _checkpoint_sources = 50
+    _bus_stop_osm_filter = 'way[public_transport]'
+    _parking_lot_osm_filter = 'way[amenity=parking][access=yes][fee=no][parking=surface]'
+    _schema = [
+        "CREATE CONSTRAINT stamp_point_stamp_id IF NOT EXISTS FOR (n:StampPoint) REQUIRE n.stamp_id IS UNIQUE",
+        "CREATE CONSTRAINT bus_stop_osmid IF NOT EXISTS FOR (n:BusStop) REQUIRE n.osmid IS UNIQUE",
+        "CREATE CONSTRAINT parking_lot_osmid IF NOT EXISTS FOR (n:ParkingLot) REQUIRE n.osmid IS UNIQUE",
+        "CREATE INDEX stamp_point_osmid IF NOT EXISTS FOR (n:StampPoint) ON (n.osmid)",
+        "CREATE INDEX to_distance IF NOT EXISTS FOR ()-[r:TO]-() ON (r.distance)",
+        "CREATE INDEX to_lower_bound IF NOT EXISTS FOR ()-[r:TO]-() ON (r.lowerBound)",
+    ]
 
     def __init__(self,
                  neo4j_uri: str,
                  neo4j_user: str,
                  neo4j_password: str,
-                 neo4j_database: Optional[str] = None):
+                 neo4j_database: Optional[str] = None,
+                 metrics: Optional[Metrics] = None,
+                 tile_size_deg: Optional[float] = None,
+                 max_loaded_tiles: int = 16,
+                 landmark_count: int = 16,
+                 contraction_hierarchy: bool = False):
+        """
+        Connects to the Neo4j database. If tile_size_deg is given, the walk network is stored in tiles of that size
+        (in degrees) and at most max_loaded_tiles tiles are held in memory while routing. Otherwise, distances to
+        landmark_count landmarks (0 to disable) are stored next to the map for distance bounds and A* routing, and
+        with contraction_hierarchy, the import also stores a contraction hierarchy of the map for faster routing.
+        """
         self._driver = GraphDatabase.driver(
             neo4j_uri, auth=(neo4j_user, neo4j_password))
         self._neo4j_database = neo4j_database
+        self.metrics = metrics if metrics is not None else Metrics()
         self._map = None
+        self._tiled_map = None
+        if tile_size_deg is not None:
+            self._tiled_map = TiledMap(self._tiles_directory, tile_size_deg, max_loaded_tiles)
+        self._landmark_count = landmark_count
+        self._landmarks = None
+        self._use_contraction_hierarchy = contraction_hierarchy
+        self._contraction_hierarchy = None
+        self._map_fingerprint = None
+        self._import_state = None
         self._enclosing_lon_lat_polygon = None
+        self._load_lock = threading.Lock()
+        self._home_lock = threading.Lock()
+        self._home_address_locks = {}
+        self._home_caches = {}
+        self._nodes = None
         self._stamp_points = None
         self._bus_stops = None
         self._parking_lots = None
         self._distances = None
         self._distances_reverse = None
 
+    def load(self, force: bool = False) -> None:
+        """
+        Loads all stamp points, bus stops, parking lots and distances in a single read transaction.
+        Concurrent calls wait for the first one, and force reloads data that is already loaded.
+        """
+        if self._distances is not None and not force:
+            return
+        with self._load_lock:
+            if self._distances is not None and not force:
+                return
+            with self.metrics.phase('load') as values:
+                tables = self._read_tables()
+                self._fill_tables(tables)
+                values['rows'] = len(self._nodes) + len(tables['from_ids'])
+
+    def _read_tables(self) -> Dict[str, List]:
+        # one query returning every node table and the distance list column by column
+        # (the import without nearest_neighbours stores pairs without a route with an infinite distance, so that they
+        # are not routed again)
+        query = "CALL { " \
+                "    MATCH (n:StampPoint)-[r:TO]-() WHERE r.distance < $infinity " \
+                "    WITH DISTINCT n WITH collect(n) AS nodes " \
+                "    RETURN [n IN nodes | elementId(n)] AS stamp_point_ids, [n IN nodes | n.latitude] AS stamp_point_latitudes, " \
+                "           [n IN nodes | n.longitude] AS stamp_point_longitudes, [n IN nodes | n.osmid] AS stamp_point_osmids, " \
+                "           [n IN nodes | n.stamp_id] AS stamp_point_stamp_ids, [n IN nodes | n.name] AS stamp_point_names " \
+                "} " \
+                "CALL { " \
+                "    MATCH (n:BusStop)-[r:TO]-() WHERE r.distance < $infinity " \
+                "    WITH DISTINCT n WITH collect(n) AS nodes " \
+                "    RETURN [n IN nodes | elementId(n)] AS bus_stop_ids, [n IN nodes | n.latitude] AS bus_stop_latitudes, " \
+                "           [n IN nodes | n.longitude] AS bus_stop_longitudes, [n IN nodes | n.osmid] AS bus_stop_osmids " \
+                "} " \
+                "CALL { " \
+                "    MATCH (n:ParkingLot)-[r:TO]-() WHERE r.distance < $infinity " \
+                "    WITH DISTINCT n WITH collect(n) AS nodes " \
+                "    RETURN [n IN nodes | elementId(n)] AS parking_lot_ids, [n IN nodes | n.latitude] AS parking_lot_latitudes, " \
+                "           [n IN nodes | n.longitude] AS parking_lot_longitudes, [n IN nodes | n.osmid] AS parking_lot_osmids " \
+                "} " \
+                "CALL { " \
+                "    MATCH ()-[r:TO]->() WHERE r.distance < $infinity " \
+                "    WITH collect(r) AS relationships " \
+                "    RETURN [r IN relationships | elementId(startNode(r))] AS from_ids, " \
+                "           [r IN relationships | elementId(endNode(r))] AS to_ids, " \
+                "           [r IN relationships | r.distance] AS distances " \
+                "} " \
+                "RETURN *"
+        with self._neo4j_session() as session:
+            return session.execute_read(lambda tx: self._run_query(tx, query, {'infinity': math.inf})[0].data())
+
+    def _fill_tables(self, tables: Dict[str, List]) -> None:
+        # build the registry and dictionaries before publishing them, so that readers never see partial data
+        nodes = NodeRegistry()
+        stamp_points = dict()
+        for columns in zip(tables['stamp_point_ids'], tables['stamp_point_latitudes'], tables['stamp_point_longitudes'],
+                           tables['stamp_point_osmids'], tables['stamp_point_stamp_ids'], tables['stamp_point_names']):
+            stamp_point = StampPoint(*columns)
+            stamp_points[nodes.add(stamp_point)] = stamp_point
+        bus_stops = dict()
+        for columns in zip(tables['bus_stop_ids'], tables['bus_stop_latitudes'], tables['bus_stop_longitudes'],
+                           tables['bus_stop_osmids']):
+            bus_stop = BusStop(*columns)
+            bus_stops[nodes.add(bus_stop)] = bus_stop
+        parking_lots = dict()
+        for columns in zip(tables['parking_lot_ids'], tables['parking_lot_latitudes'], tables['parking_lot_longitudes'],
+                           tables['parking_lot_osmids']):
+            parking_lot = ParkingLot(*columns)
+            parking_lots[nodes.add(parking_lot)] = parking_lot
+        distances = dict()
+        distances_reverse = dict()
+        from_ids = [nodes.index(neo4j_id) for neo4j_id in tables['from_ids']]
+        to_ids = [nodes.index(neo4j_id) for neo4j_id in tables['to_ids']]
+        for from_id, to_id, distance in zip(from_ids, to_ids, tables['distances']):
+            if from_id not in distances:
+                distances[from_id] = dict()
+            if to_id not in distances_reverse:
+                distances_reverse[to_id] = dict()
+            distances[from_id][to_id] = distance
+            distances_reverse[to_id][from_id] = distance
+        self._nodes = nodes
+        self._stamp_points = stamp_points
+        self._bus_stops = bus_stops
+        self._parking_lots = parking_lots
+        self._distances_reverse = distances_reverse
+        self._distances = distances
+
+    def _clear(self) -> None:
+        # drop the loaded data, so that it is loaded again on the next access
+        with self._load_lock:
+            self._distances = None
+        with self._home_lock:
+            self._home_caches = {}
+
     @property
     def stamp_points(self) -> Dict[int, StampPoint]:
         """
-        Returns a dictionary of stamp points as a dictionary of tuples.
+        Returns a dictionary of stamp points keyed by their node index.
         """
-        if self._stamp_points is None:
-            with self._neo4j_session() as session:
-                query = "MATCH (n:StampPoint) " \
-                        "WHERE EXISTS { " \
-                        "    MATCH (n)-[r:TO]-() " \
-                        "    WHERE r.distance IS NOT NULL " \
-                        "} " \
-                        "RETURN elementId(n) AS neo4j_id, n.latitude AS latitude, n.longitude AS longitude, n.osmid AS osmid, n.stamp_id AS stamp_id, n.name AS name"
-                self._stamp_points = {result.get("neo4j_id"): StampPoint(result.get("neo4j_id"),
-                                                                         result.get("latitude"),
-                                                                         result.get("longitude"),
-                                                                         result.get("osmid"),
-                                                                         result.get("stamp_id"),
-                                                                         result.get("name"))
-                                      for result in session.run(query)}
+        self.load()
         return self._stamp_points
 
     @property
     def bus_stops(self) -> Dict[int, BusStop]:
         """
-        Returns a dictionary of bus stops as a dictionary of tuples.
+        Returns a dictionary of bus stops keyed by their node index.
         """
-        if self._bus_stops is None:
-            with self._neo4j_session() as session:
-                query = "MATCH (n:BusStop) " \
-                        "WHERE EXISTS { " \
-                        "    MATCH (n)-[r:TO]-() " \
-                        "    WHERE r.distance IS NOT NULL " \
-                        "} " \
-                        "RETURN elementId(n) AS neo4j_id, n.latitude AS latitude, n.longitude AS longitude, n.osmid AS osmid"
-                self._bus_stops = {result.get("neo4j_id"): BusStop(result.get("neo4j_id"),
-                                                                   result.get("latitude"),
-                                                                   result.get("longitude"),
-                                                                   result.get("osmid"))
-                                   for result in session.run(query)}
+        self.load()
         return self._bus_stops
 
     @property
     def parking_lots(self) -> Dict[int, ParkingLot]:
         """
-        Returns a dictionary of parking lots as a dictionary of tuples.
+        Returns a dictionary of parking lots keyed by their node index.
         """
-        if self._parking_lots is None:
-            with self._neo4j_session() as session:
-                query = "MATCH (n:ParkingLot) " \
-                        "WHERE EXISTS { " \
-                        "    MATCH (n)-[r:TO]-() " \
-                        "    WHERE r.distance IS NOT NULL " \
-                        "} " \
-                        "RETURN elementId(n) AS neo4j_id, n.latitude AS latitude, n.longitude AS longitude, n.osmid AS osmid"
-                self._parking_lots = {result.get("neo4j_id"): ParkingLot(result.get("neo4j_id"),
-                                                                         result.get("latitude"),
-                                                                         result.get("longitude"),
-                                                                         result.get("osmid"))
-                                      for result in session.run(query)}
+        self.load()
         return self._parking_lots
-    
-    def node(self, neo4j_id: int) -> Node:
+
+    @property
+    def nodes(self) -> NodeRegistry:
         """
-        Returns the node with the given neo4j ID.
+        Returns the registry of all stamp points, bus stops and parking lots.
         """
-        if neo4j_id in self.stamp_points:
-            return self.stamp_points[neo4j_id]
-        elif neo4j_id in self.bus_stops:
-            return self.bus_stops[neo4j_id]
-        elif neo4j_id in self.parking_lots:
-            return self.parking_lots[neo4j_id]
-        else:
-            raise ValueError(f"Node with neo4j ID {neo4j_id} not found.")
+        self.load()
+        return self._nodes
+
+    def node(self, index: int) -> Node:
+        """
+        Returns the node with the given node index.
+        """
+        return self.nodes[index]
 
     @property
     def distances(self) -> Dict[int, Dict[int, float]]:
         """
-        Returns a dictionary of distances between nodes as a dictionary of dictionaries.
+        Returns a dictionary of distances between node indices as a dictionary of dictionaries.
         """
-        if self._distances is None:
-            with self._neo4j_session() as session:
-                query = "MATCH (s)-[r:TO]->(t) " \
-                        "WHERE r.distance IS NOT NULL " \
-                        "RETURN elementId(s) AS from_id, elementId(t) AS to_id, r.distance AS distance"
-                self._distances = dict()
-                self._distances_reverse = dict()
-                for result in session.run(query):
-                    from_id = result.get("from_id")
-                    to_id = result.get("to_id")
-                    distance = result.get("distance")
-                    if from_id not in self._distances:
-                        self._distances[from_id] = dict()
-                    if to_id not in self._distances_reverse:
-                        self._distances_reverse[to_id] = dict()
-                    self._distances[from_id][to_id] = distance
-                    self._distances_reverse[to_id][from_id] = distance
+        self.load()
         return self._distances
     
     @property
     def distances_reverse(self) -> Dict[int, Dict[int, float]]:
         """
-        Returns a dictionary of distances between nodes as a dictionary of dictionaries.
+        Returns a dictionary of distances between node indices keyed by the destination first.
         """
-        self.distances  # ensure that self._distances_reverse is initialized
+        self.load()
         return self._distances_reverse
 
     @property
@@ -164,13 +257,13 @@ class GraphData:
     
     def is_arc(self, from_id: int, to_id: int) -> bool:
         """
-        Returns True if there is an arc from the node with the given neo4j ID to the node with the other given neo4j ID.
+        Returns True if there is an arc from the node with the given index to the node with the other given index.
         """
         return from_id in self.distances and to_id in self.distances[from_id]
     
     def distance(self, from_id: int, to_id: int) -> float:
         """
-        Returns the distance of the arc from the node with the given neo4j ID to the node with the other given neo4j ID.
+        Returns the distance of the arc from the node with the given index to the node with the other given index.
         """
         return self.distances[from_id][to_id]
 
@@ -179,44 +272,111 @@ class GraphData:
                     ignore_radius: float = 500.0,
                     max_section_length_m: Optional[float] = None,
                     log: bool = False,
-                    force_update: bool = False) -> None:
+                    force_update: bool = False,
+                    nearest_neighbours: Optional[int] = None,
+                    nearest_neighbour_radius_m: Optional[float] = None) -> None:
         """
         Imports data from various sources and updates the map and database accordingly.
+
+        Without nearest_neighbours, the distances of all pairs that may be within max_section_length_m are imported.
+        With nearest_neighbours, each stamp point, bus stop and parking lot gets arcs to its nearest_neighbours
+        nearest stamp points by walking distance, and the stamp points are connected by a spanning forest of the
+        candidate arcs, so the number of arcs grows linearly. Arcs shorter than nearest_neighbour_radius_m are kept
+        in addition, and max_section_length_m drops all longer arcs.
+
+        The completed stages and the progress of the distance import are recorded in an import state file, so an
+        interrupted import resumes where it stopped unless force_update is given.
         """
+        import_state = self._get_import_state()
         if force_update:
             self._empty_database()
             self._delete_map()
+            import_state.delete()
         else:
             self._ensure_map_database_consistency()
+        self._ensure_schema()
 
         ox.settings.log_console = log
         if not self._map_exists():
-            new_stamp_point_count = self._import_stamp_points(
-                stamp_point_gpx_filename)
-            if new_stamp_point_count > 0 and log:
-                print(f"Imported {new_stamp_point_count} stamp points.")
+            # the landmark index and contraction hierarchy of a previous map do not fit the new one
+            self._delete_derived_caches()
+            # each stage is recorded when completed, so that an interrupted import resumes with the next stage
+            if not import_state.is_completed('import_stamp_points'):
+                with self.metrics.phase('import_stamp_points') as values:
+                    new_stamp_point_count = self._import_stamp_points(
+                        stamp_point_gpx_filename)
+                    values['rows'] = new_stamp_point_count
+                import_state.complete('import_stamp_points')
+                if new_stamp_point_count > 0 and log:
+                    print(f"Imported {new_stamp_point_count} stamp points.")
 
-            self._create_map()
-            if log:
-                print("Created the map.")
+            if not import_state.is_completed('create_map'):
+                with self.metrics.phase('create_map') as values:
+                    self._create_map()
+                    self._save_raw_map()
+                    values['rows'] = self._map_size()
+                import_state.complete('create_map')
+                if log:
+                    print("Created the map.")
+            else:
+                with self.metrics.phase('load_raw_map') as values:
+                    self._load_raw_map()
+                    values['rows'] = self._map_size()
+                if log:
+                    print("Loaded the unsimplified map of the interrupted import.")
 
-            new_bus_stop_count = self._import_bus_stops(ignore_radius)
-            if new_bus_stop_count > 0 and log:
-                print(f"Imported {new_bus_stop_count} bus stops.")
+            if not import_state.is_completed('import_bus_stops'):
+                with self.metrics.phase('import_bus_stops') as values:
+                    new_bus_stop_count = self._import_bus_stops(ignore_radius)
+                    values['rows'] = new_bus_stop_count
+                import_state.complete('import_bus_stops')
+                if new_bus_stop_count > 0 and log:
+                    print(f"Imported {new_bus_stop_count} bus stops.")
 
-            new_parking_lot_count = self._import_parking_lots(ignore_radius)
-            if new_parking_lot_count > 0 and log:
-                print(f"Imported {new_parking_lot_count} parking lots.")
+            if not import_state.is_completed('import_parking_lots'):
+                with self.metrics.phase('import_parking_lots') as values:
+                    new_parking_lot_count = self._import_parking_lots(ignore_radius)
+                    values['rows'] = new_parking_lot_count
+                import_state.complete('import_parking_lots')
+                if new_parking_lot_count > 0 and log:
+                    print(f"Imported {new_parking_lot_count} parking lots.")
 
-            self._simplify_map()
-            self._save_map()
+            with self.metrics.phase('simplify_map') as values:
+                self._simplify_map()
+                values['rows'] = self._map_size()
+            with self.metrics.phase('save_map'):
+                self._save_map()
+            self._delete_raw_map()
             if log:
                 print("Saved the map.")
 
+        if self._uses_landmarks() and self._get_landmarks() is None:
+            with self.metrics.phase('build_landmarks') as values:
+                self._build_landmarks()
+                values['rows'] = self._landmarks.landmark_count
+            if log:
+                print("Built the landmark index.")
+
+        if self._uses_contraction_hierarchy() and self._get_contraction_hierarchy() is None:
+            with self.metrics.phase('build_contraction_hierarchy') as values:
+                self._build_contraction_hierarchy()
+                values['rows'] = self._map_size()
+            if log:
+                print("Built the contraction hierarchy.")
+
         if log:
-            print("Importing missing distances.")
-        self._import_missing_distances(
-            max_section_length_m=max_section_length_m)
+            checkpoint = import_state.checkpoint('import_missing_distances')
+            if checkpoint is not None:
+                print(f"Resuming the import of missing distances after {checkpoint['sources']} source nodes.")
+            else:
+                print("Importing missing distances.")
+        with self.metrics.phase('import_missing_distances') as values:
+            values['rows'] = self._import_missing_distances(
+                max_section_length_m=max_section_length_m, nearest_neighbours=nearest_neighbours,
+                nearest_neighbour_radius_m=nearest_neighbour_radius_m)
+        # the saved map marks the finished import
+        import_state.delete()
+        self._clear()
 
     def _neo4j_session(self):
         if self._neo4j_database is None:
@@ -224,6 +384,35 @@ class GraphData:
         else:
             return self._driver.session(database=self._neo4j_database)
 
+    def _run_query(self, session, query: str, parameters: Optional[Dict] = None) -> List:
+        # run the query to completion and record its duration and row count
+        with self.metrics.phase('neo4j_query') as values:
+            records = list(session.run(query, parameters))
+            values['rows'] = len(records)
+        self.metrics.count('neo4j_queries')
+        self.metrics.count('neo4j_seconds', values['duration'])
+        return records
+
+    def _run_update(self, session, query: str, parameters: Optional[Dict] = None):
+        # run the query to completion and return the counters of its summary, e.g. the number of created nodes
+        with self.metrics.phase('neo4j_query') as values:
+            counters = session.run(query, parameters).consume().counters
+            values['rows'] = 0
+        self.metrics.count('neo4j_queries')
+        self.metrics.count('neo4j_seconds', values['duration'])
+        return counters
+
+    def _ensure_schema(self) -> None:
+        # uniqueness constraints and indexes backing the MERGE and lookup queries
+        with self._neo4j_session() as session:
+            for query in self._schema:
+                self._run_query(session, query)
+
+    @staticmethod
+    def _node_key(label: str) -> str:
+        # the property identifying a node with the given label
+        return 'stamp_id' if label == 'StampPoint' else 'osmid'
+
     def _empty_database(self) -> None:
         # delete all nodes and relationships
         with self._neo4j_session() as session:
@@ -233,45 +422,79 @@ class GraphData:
                     "(:StampPoint {name: 'dummy', latitude: 0.0, longitude: 0.0, osmid: 0})" \
                 "-[:TO {distance: 0.0, lowerBound: 0.0}]->" \
                 "(:ParkingLot {latitude: 0.0, longitude: 0.0, osmid: 0})"
-            session.run(query)
+            self._run_query(session, query)
             # delete all nodes and relationships
             query = "MATCH (n) DETACH DELETE n"
-            session.run(query)
+            self._run_query(session, query)
 
     def _map_exists(self) -> bool:
+        if self._tiled_map is not None:
+            return self._tiled_map.exists()
         # check if map file exists
         return os.path.isfile(self._map_filename)
 
     def _delete_map(self) -> None:
-        if self._map_exists():
+        if self._tiled_map is not None:
+            self._tiled_map.delete()
+        elif self._map_exists():
             # delete the map file
             os.remove(self._map_filename)
+        if os.path.isfile(self._raw_map_filename):
+            os.remove(self._raw_map_filename)
+        self._delete_derived_caches()
+
+    def _delete_derived_caches(self) -> None:
+        # delete the landmark index and contraction hierarchy built from the map
+        for filename in (self._landmarks_filename, self._contraction_hierarchy_filename):
+            if os.path.isfile(filename):
+                os.remove(filename)
+        self._landmarks = None
+        self._contraction_hierarchy = None
+        self._map_fingerprint = None
+
+    def _map_size(self) -> int:
+        # number of nodes of the map or number of tiles of the tiled map
+        if self._tiled_map is not None:
+            return self._tiled_map.tile_count
+        return self._map.number_of_nodes()
+
+    def _get_import_state(self) -> ImportState:
+        if self._import_state is None:
+            self._import_state = ImportState(self._import_state_filename)
+        return self._import_state
 
     def _ensure_map_database_consistency(self) -> None:
-        if not self._map_exists():
-            # empty the database as the input process may have been interrupted
+        if self._map_exists():
+            return
+        import_state = self._get_import_state()
+        if import_state.is_completed('create_map') and not self._raw_map_exists():
+            # the unsimplified map of the interrupted import is lost, so it starts over
+            import_state.delete()
+        if not import_state.exists():
+            # empty the database as the input process may have been interrupted before its first stage
             self._empty_database()
 
     def _import_stamp_points(self, stamp_point_gpx_filename: str) -> int:
         with (self._neo4j_session() as session,
               open(stamp_point_gpx_filename, 'r', encoding="utf-8") as gpx_file):
             gpx = gpxpy.parse(gpx_file)
-            for stamp_point in gpx.waypoints:
-                stamp_id = int(stamp_point.name[3:6])
-                name = stamp_point.name[7:]
-                query = "CREATE (n:StampPoint {" \
-                    f"stamp_id: {stamp_id}, name: '{name}', " \
-                    f"latitude: {stamp_point.latitude}, longitude: {stamp_point.longitude}" \
-                    "})"
-                session.run(query)
-            return len(gpx.waypoints)
+            rows = [{'stamp_id': int(stamp_point.name[3:6]),
+                     'name': stamp_point.name[7:],
+                     'latitude': stamp_point.latitude,
+                     'longitude': stamp_point.longitude}
+                    for stamp_point in gpx.waypoints]
+            query = "UNWIND $rows AS row " \
+                    "MERGE (n:StampPoint {stamp_id: row.stamp_id}) " \
+                    "ON CREATE SET n.name = row.name, n.latitude = row.latitude, n.longitude = row.longitude"
+            # stamp points already in the database of an earlier import are not created again
+            return self._run_update(session, query, {'rows': rows}).nodes_created
 
     def _get_enclosing_lon_lat_polygon(self) -> Polygon:
         if self._enclosing_lon_lat_polygon is None:
             with self._neo4j_session() as session:
                 query = "MATCH (n:StampPoint) " \
                         "RETURN n.latitude AS lat, n.longitude AS lon"
-                result_list = list(session.run(query))
+                result_list = self._run_query(session, query)
                 points = np.empty([len(result_list), 2], dtype=np.float64)
                 for i, result in enumerate(result_list):
                     lon = result.get("lon")
@@ -286,32 +509,46 @@ class GraphData:
         return self._enclosing_lon_lat_polygon
 
     def _create_map(self) -> None:
-        with self._neo4j_session() as session:
-            # create an unsimplified map enclosing the stamp points
-            self._map = ox.graph_from_polygon(self._get_enclosing_lon_lat_polygon(),
-                                              network_type='walk',
-                                              simplify=False,
-                                              retain_all=False)
+        # create an unsimplified map enclosing the stamp points
+        if self._tiled_map is not None:
+            self._tiled_map.download(self._get_enclosing_lon_lat_polygon())
+        else:
+            self._map = self._download_map(self._get_enclosing_lon_lat_polygon())
+        self._assign_stamp_point_nodes()
+
+    def _download_map(self, polygon: Polygon) -> nx.MultiDiGraph:
+        # the unsimplified walk network within the polygon
+        return ox.graph_from_polygon(polygon,
+                                     network_type='walk',
+                                     simplify=False,
+                                     retain_all=False)
 
+    def _assign_stamp_point_nodes(self) -> None:
+        with self._neo4j_session() as session:
             # find the osmid of the nearest node for each stamp point
             query = "MATCH (n:StampPoint) " \
-                    "RETURN elementId(n) AS id, n.latitude AS lat, n.longitude AS lon"
-            neo4j_ids = []
+                    "RETURN n.stamp_id AS stamp_id, n.latitude AS lat, n.longitude AS lon"
+            stamp_ids = []
             lats = []
             lons = []
-            for result in session.run(query):
-                neo4j_ids.append(result.get("id"))
+            for result in self._run_query(session, query):
+                stamp_ids.append(result.get("stamp_id"))
                 lats.append(result.get("lat"))
                 lons.append(result.get("lon"))
             # find the osmid of the nearest node for each stamp point
-            osm_ids = ox.distance.nearest_nodes(self._map, lons, lats)
-            for i, neo4j_id in enumerate(neo4j_ids):
-                # store the osmid
-                query = f"MATCH (n) WHERE elementId(n) = '{neo4j_id}' " \
-                        f"SET n.osmid = {osm_ids[i]}"
-                session.run(query)
-                # mark the node to keep
-                self._map.nodes[osm_ids[i]]['keep'] = True
+            if self._tiled_map is not None:
+                osm_ids = self._tiled_map.nearest_nodes(lons, lats)
+            else:
+                osm_ids = [int(osm_id) for osm_id in ox.distance.nearest_nodes(self._map, lons, lats)]
+            # store the osmids
+            query = "UNWIND $rows AS row " \
+                    "MATCH (n:StampPoint {stamp_id: row.stamp_id}) " \
+                    "SET n.osmid = row.osmid"
+            self._run_query(session, query, {'rows': [{'stamp_id': stamp_id, 'osmid': osm_id}
+                                                      for stamp_id, osm_id in zip(stamp_ids, osm_ids)]})
+            # mark the nodes to keep
+            for osm_id in osm_ids:
+                self._keep_map_node(osm_id)
 
     def _import_osm_entities(self,
                              osm_filter: str,
@@ -324,15 +561,8 @@ class GraphData:
             polygon_string = ' '.join(
                 f"{lat} {lon}" for lon, lat in polygon.exterior.coords)
 
-            # query the OSM API for the entities
-            api = overpy.Overpass()
-            results = api.query(f"{osm_filter}"
-                                f"  (poly:'{polygon_string}');"
-                                f"{osm_output}")
-            entities = []
-            for node in results.nodes:
-                if node.id in self._map.nodes:
-                    entities.append((node.id, node.lat, node.lon))
+            entities = [(osmid, lat, lon) for osmid, lat, lon in self._query_osm_nodes(osm_filter, osm_output, polygon_string)
+                        if self._map_contains(osmid, lat, lon)]
 
             # thin the entities according to ignore_radius
             adjacent_entities = [[] for _ in range(len(entities))]
@@ -358,266 +588,743 @@ class GraphData:
                         deleted_indizes.append(j)
 
             # insert the thinned entities into the database and mark them to keep
-            for i in thinned_indizes:
-                osmid = entities[i][0]
-                lat = entities[i][1]
-                lon = entities[i][2]
-                query = f"MERGE (n:{neo4j_tag} {{osmid: {osmid}}}) " \
-                    f"ON CREATE SET n.latitude = {lat}, n.longitude = {lon}"
-                session.run(query)
-                self._map.nodes[osmid]['keep'] = True
+            rows = [{'osmid': entities[i][0], 'latitude': entities[i][1], 'longitude': entities[i][2]}
+                    for i in thinned_indizes]
+            query = "UNWIND $rows AS row " \
+                    f"MERGE (n:{neo4j_tag} {{osmid: row.osmid}}) " \
+                    "ON CREATE SET n.latitude = row.latitude, n.longitude = row.longitude"
+            self._run_query(session, query, {'rows': rows})
+            for row in rows:
+                self._keep_map_node(row['osmid'])
             return len(thinned_indizes)
 
+    def _query_osm_nodes(self, osm_filter: str, osm_output: str, polygon_string: str) -> List[Tuple[int, float, float]]:
+        # query the OSM API for the nodes (osmid, latitude, longitude) of the filtered entities within the polygon
+        api = overpy.Overpass()
+        results = api.query(f"{osm_filter}"
+                            f"  (poly:'{polygon_string}');"
+                            f"{osm_output}")
+        return [(node.id, float(node.lat), float(node.lon)) for node in results.nodes]
+
     def _import_bus_stops(self, ignore_radius: float) -> int:
-        return self._import_osm_entities('way[public_transport]',
+        return self._import_osm_entities(self._bus_stop_osm_filter,
                                          'node(w);out skel;',
                                          'BusStop',
                                          ignore_radius)
 
     def _import_parking_lots(self, ignore_radius: float) -> int:
-        return self._import_osm_entities(
-            'way[amenity=parking][access=yes][fee=no][parking=surface]',
-            'node(w);out skel;',
-            'ParkingLot',
-            ignore_radius)
+        return self._import_osm_entities(self._parking_lot_osm_filter,
+                                         'node(w);out skel;',
+                                         'ParkingLot',
+                                         ignore_radius)
+
+    def _map_contains(self, osmid: int, lat: float, lon: float) -> bool:
+        if self._tiled_map is not None:
+            return self._tiled_map.contains(osmid, lat, lon)
+        return osmid in self._map.nodes
+
+    def _keep_map_node(self, osmid: int) -> None:
+        # mark the node to keep during the simplification
+        if self._tiled_map is not None:
+            self._tiled_map.keep(osmid)
+        else:
+            self._map.nodes[osmid]['keep'] = True
 
     def _simplify_map(self) -> None:
-        self._map = ox.simplify_graph(self._map, node_attrs_include=[
-                                      'keep'], edge_attr_aggs={'length': sum})
+        if self._tiled_map is not None:
+            self._tiled_map.simplify()
+        else:
+            self._map = ox.simplify_graph(self._map, node_attrs_include=[
+                                          'keep'], edge_attr_aggs={'length': sum})
+
+    def _raw_map_exists(self) -> bool:
+        # the tiled map downloads the missing raw tiles again
+        return self._tiled_map is not None or os.path.isfile(self._raw_map_filename)
+
+    def _save_raw_map(self) -> None:
+        # checkpoint of the unsimplified map (the tiled map stores its raw tiles anyway)
+        if self._tiled_map is None:
+            ox.save_graphml(self._map, self._raw_map_filename)
+
+    def _load_raw_map(self) -> None:
+        if self._tiled_map is not None:
+            self._tiled_map.download(self._get_enclosing_lon_lat_polygon())
+        else:
+            self._map = ox.load_graphml(self._raw_map_filename)
+        # mark the nodes of the stored stamp points, bus stops and parking lots to keep again
+        self._assign_stamp_point_nodes()
+        with self._neo4j_session() as session:
+            query = "MATCH (n) WHERE n:BusStop OR n:ParkingLot " \
+                    "RETURN n.osmid AS osmid, n.latitude AS lat, n.longitude AS lon"
+            for result in self._run_query(session, query):
+                if self._map_contains(result.get("osmid"), result.get("lat"), result.get("lon")):
+                    self._keep_map_node(result.get("osmid"))
+
+    def _delete_raw_map(self) -> None:
+        if os.path.isfile(self._raw_map_filename):
+            os.remove(self._raw_map_filename)
 
     def _save_map(self) -> None:
-        ox.save_graphml(self._map, self._map_filename)
+        if self._tiled_map is not None:
+            self._tiled_map.save_index()
+        else:
+            ox.save_graphml(self._map, self._map_filename)
 
 
     def _load_map(self) -> None:
         self._map = ox.load_graphml(self._map_filename)
         #ox.plot_graph(self._map, node_color='r', node_size=.2, edge_linewidth=0.1, show=False, save=True, filepath='map.png', dpi=1200)
 
-    def _calculate_home_cache(self, address: str) -> None:
-        if os.path.isfile(self._home_filename):
-            with open(self._home_filename, 'r', encoding='utf-8') as file:
-                cache_data = json.load(file)
-            if cache_data['address'] == address:
-                return
+    def _uses_landmarks(self) -> bool:
+        # the landmark index covers the whole map, so it is not available for the tiled map
+        return self._tiled_map is None and self._landmark_count > 0
+
+    def _get_map_fingerprint(self) -> Optional[str]:
+        # hash of the saved map file, stored with the caches derived from the map
+        if self._map_fingerprint is None and os.path.isfile(self._map_filename):
+            sha1 = hashlib.sha1()
+            with open(self._map_filename, 'rb') as file:
+                for chunk in iter(lambda: file.read(1 << 20), b''):
+                    sha1.update(chunk)
+            self._map_fingerprint = sha1.hexdigest()
+        return self._map_fingerprint
+
+    def _build_landmarks(self) -> None:
+        self._landmarks = LandmarkIndex.build(self.map, self._landmark_count)
+        self._landmarks.fingerprint = self._get_map_fingerprint()
+        self._landmarks.save(self._landmarks_filename)
+
+    def _get_landmarks(self) -> Optional[LandmarkIndex]:
+        if self._landmarks is None and self._uses_landmarks() and os.path.isfile(self._landmarks_filename):
+            landmarks = LandmarkIndex.load(self._landmarks_filename)
+            # an index built for another map gives wrong bounds
+            if landmarks.fingerprint == self._get_map_fingerprint():
+                self._landmarks = landmarks
+        return self._landmarks
+
+    def _uses_contraction_hierarchy(self) -> bool:
+        return self._tiled_map is None and self._use_contraction_hierarchy
+
+    def _build_contraction_hierarchy(self) -> None:
+        self._contraction_hierarchy = ContractionHierarchy.build(self.map)
+        self._contraction_hierarchy.fingerprint = self._get_map_fingerprint()
+        self._contraction_hierarchy.save(self._contraction_hierarchy_filename)
+
+    def _get_contraction_hierarchy(self) -> Optional[ContractionHierarchy]:
+        if self._contraction_hierarchy is None and self._uses_contraction_hierarchy() \
+                and os.path.isfile(self._contraction_hierarchy_filename):
+            contraction_hierarchy = ContractionHierarchy.load(self._contraction_hierarchy_filename)
+            # a hierarchy built for another map gives wrong distances
+            if contraction_hierarchy.fingerprint == self._get_map_fingerprint():
+                self._contraction_hierarchy = contraction_hierarchy
+        return self._contraction_hierarchy
+
+    def _distance_lower_bounds(self,
+                               osmids1: List[int],
+                               osmids2: List[int],
+                               coordinates1: Optional[List[Tuple[float, float]]] = None,
+                               coordinates2: Optional[List[Tuple[float, float]]] = None) -> List[float]:
+        # lower bounds on the walking distance between the nodes of each pair in both directions
+        bounds = [0.0] * len(osmids1)
+        if coordinates1 is not None:
+            bounds = [0.95*ox.distance.great_circle(lat1, lon1, lat2, lon2)
+                      for (lat1, lon1), (lat2, lon2) in zip(coordinates1, coordinates2)]
+        landmarks = self._get_landmarks()
+        if landmarks is not None and len(osmids1) > 0:
+            # the arcs are stored in both directions, so the bound has to hold for both
+            landmark_bounds = np.minimum(landmarks.lower_bounds(osmids1, osmids2),
+                                         landmarks.lower_bounds(osmids2, osmids1))
+            bounds = [max(bound, float(landmark_bound)) for bound, landmark_bound in zip(bounds, landmark_bounds)]
+        return bounds
+
+    def _route_distances(self,
+                         origin_osmids: List[int],
+                         destination_osmids: List[int],
+                         home_map: Optional[nx.MultiDiGraph] = None,
+                         cutoff: Optional[float] = None) -> List[Optional[float]]:
+        # shortest walking distance for each pair of origin and destination (optionally including the home map),
+        # inf if there is no route; with a cutoff, pairs farther apart may be None (only the tiled search stops there)
+        if len(origin_osmids) == 0:
+            return []
+        if self._tiled_map is not None:
+            return self._route_tiled_distances(origin_osmids, destination_osmids, home_map, cutoff)
+        contraction_hierarchy = self._get_contraction_hierarchy()
+        if contraction_hierarchy is not None and all(osmid in contraction_hierarchy for osmid in destination_osmids):
+            return self._route_contraction_hierarchy_distances(origin_osmids, destination_osmids, home_map,
+                                                               contraction_hierarchy)
+        graph = self.map if home_map is None else nx.compose(self.map, home_map)
+        # the landmark bounds only hold on the map itself, not on the map with the home network
+        landmarks = self._get_landmarks() if home_map is None else None
+        with self.metrics.phase('routing') as values:
+            if landmarks is not None:
+                distances = [self._route_a_star(graph, origin, destination, landmarks)
+                             for origin, destination in zip(origin_osmids, destination_osmids)]
+            else:
+                routes = ox.routing.shortest_path(
+                    graph, orig=origin_osmids, dest=destination_osmids, weight='length', cpus=self._threads)
+                distances = []
+                for route in routes:
+                    if route is None:
+                        distances.append(math.inf)
+                    elif len(route) == 1:
+                        distances.append(0)
+                    else:
+                        gdf = ox.routing.route_to_gdf(graph, route, weight='length')
+                        distances.append(gdf['length'].sum())
+            values['routes'] = len(distances)
+        self.metrics.count('routing_calls')
+        self.metrics.count('routes', len(distances))
+        return distances
+
+    @staticmethod
+    def _route_a_star(graph: nx.MultiDiGraph, origin: int, destination: int, landmarks: LandmarkIndex) -> float:
+        # goal-directed search guided by the landmark bounds
+        try:
+            return nx.astar_path_length(graph, origin, destination,
+                                        heuristic=landmarks.heuristic(destination), weight='length')
+        except nx.NetworkXNoPath:
+            return math.inf
+
+    def _route_contraction_hierarchy_distances(self,
+                                               origin_osmids: List[int],
+                                               destination_osmids: List[int],
+                                               home_map: Optional[nx.MultiDiGraph],
+                                               contraction_hierarchy: ContractionHierarchy) -> List[float]:
+        # origins outside of the map (the home node) enter it through the nodes the home map shares with the map
+        with self.metrics.phase('routing') as values:
+            access_lengths = {}
+            for origin in set(origin_osmids):
+                if origin in contraction_hierarchy:
+                    access_lengths[origin] = {origin: 0.0}
+                elif home_map is not None and origin in home_map.nodes:
+                    lengths = nx.single_source_dijkstra_path_length(home_map, origin, weight='length')
+                    access_lengths[origin] = {node: length for node, length in lengths.items()
+                                              if node in contraction_hierarchy}
+                else:
+                    access_lengths[origin] = {}
+            sources = sorted({node for lengths in access_lengths.values() for node in lengths})
+            targets = sorted(set(destination_osmids))
+            table = contraction_hierarchy.distance_table(sources, targets)
+            rows = {source: row for source, row in zip(sources, table)}
+            columns = {target: column for column, target in enumerate(targets)}
+            distances = []
+            for origin, destination in zip(origin_osmids, destination_osmids):
+                distances.append(min((length + rows[node][columns[destination]]
+                                      for node, length in access_lengths[origin].items()), default=math.inf))
+            values['routes'] = len(distances)
+        self.metrics.count('routing_calls')
+        self.metrics.count('routes', len(distances))
+        return distances
+
+    def _route_tiled_distances(self,
+                               origin_osmids: List[int],
+                               destination_osmids: List[int],
+                               home_map: Optional[nx.MultiDiGraph],
+                               cutoff: Optional[float] = None) -> List[Optional[float]]:
+        # one search per origin, which loads only the tiles it reaches before the cutoff
+        destinations_by_origin = {}
+        for origin, destination in zip(origin_osmids, destination_osmids):
+            destinations_by_origin.setdefault(origin, set()).add(destination)
+        with self.metrics.phase('routing') as values:
+            lengths = {}
+            for origin, destinations in destinations_by_origin.items():
+                origin_lengths = self._tiled_map.shortest_path_lengths(origin, destinations, overlay=home_map,
+                                                                       cutoff=cutoff)
+                # a destination that was not reached is unreachable or farther away than the cutoff
+                missing = math.inf if cutoff is None else None
+                for destination in destinations:
+                    lengths[origin, destination] = origin_lengths.get(destination, missing)
+            distances = [lengths[origin, destination] for origin, destination in zip(origin_osmids, destination_osmids)]
+            values['routes'] = len(distances)
+        self.metrics.count('routing_calls', len(destinations_by_origin))
+        self.metrics.count('routes', len(distances))
+        return distances
+
+    def _get_home_map(self, address: str) -> Tuple[Tuple[float, float], nx.MultiDiGraph, int]:
+        # geocode the address and download the walk network around it
         maximum_search_distance_m = 100
         home_coords = ox.geocoder.geocode(address)
         home_map = ox.graph.graph_from_address(address, dist=maximum_search_distance_m, network_type='walk', simplify=False, retain_all=False)
         try:
-            home_osmid = ox.distance.nearest_nodes(home_map, [home_coords[0]], [home_coords[1]])[0]
+            home_osmid = ox.distance.nearest_nodes(home_map, [home_coords[1]], [home_coords[0]])[0]
         except Exception as exc:
             raise RuntimeError(f"Could not find a node within {maximum_search_distance_m} m of the address '{address}'.") from exc
-        combine_map = nx.compose(self.map, home_map)
-        stamp_neo4j_ids = []
-        origin_ids = []
-        destination_ids = []
-        for stamp_point in self.stamp_points.values():
-            stamp_neo4j_ids.append(stamp_point.neo4j_id)
-            origin_ids.append(home_osmid)
-            destination_ids.append(stamp_point.osm_id)
-        routes = ox.routing.shortest_path(combine_map, origin_ids, destination_ids, weight='length', cpus=self._threads)
-        distances = {}
-        for i, route in enumerate(routes):
-            if len(route) == 1:
-                distances[stamp_neo4j_ids[i]] = 0
-            else:
-                gdf = ox.routing.route_to_gdf(combine_map, route, weight='length')
-                distances[stamp_neo4j_ids[i]] = gdf['length'].sum()
-        cache_data = {'address': address, 'latitude': home_coords[0], 'longitude': home_coords[1], 'osmid': int(home_osmid), 'distances': distances}
-        with open(self._home_filename, 'w', encoding='utf-8') as file:
-            json.dump(cache_data, file)
+        return home_coords, home_map, home_osmid
+
+    def _calculate_home_cache(self, address: str) -> Dict:
+        # cached addresses are read without a lock, so that they are not blocked by the routing of a new address
+        home_caches = self._home_caches
+        if address in home_caches:
+            return home_caches[address]
+        # the lock of the address keeps concurrent requests from routing the same address twice
+        with self._home_lock:
+            address_lock = self._home_address_locks.setdefault(address, threading.Lock())
+        with address_lock:
+            if address in home_caches:
+                return home_caches[address]
+            if os.path.isfile(self._home_filename):
+                with open(self._home_filename, 'r', encoding='utf-8') as file:
+                    cache_data = json.load(file)
+                if cache_data['address'] == address:
+                    home_caches[address] = cache_data
+                    return cache_data
+            with self.metrics.phase('home_cache') as values:
+                home_coords, home_map, home_osmid = self._get_home_map(address)
+                stamp_neo4j_ids = []
+                origin_ids = []
+                destination_ids = []
+                for stamp_point in self.stamp_points.values():
+                    stamp_neo4j_ids.append(stamp_point.neo4j_id)
+                    origin_ids.append(home_osmid)
+                    destination_ids.append(stamp_point.osm_id)
+                route_distances = self._route_distances(origin_ids, destination_ids, home_map=home_map)
+                distances = dict(zip(stamp_neo4j_ids, route_distances))
+                cache_data = {'address': address, 'latitude': home_coords[0], 'longitude': home_coords[1], 'osmid': int(home_osmid), 'distances': distances}
+                # other addresses may be routed at the same time, so the file is replaced by a completely written one
+                temporary_filename = f"{self._home_filename}.{threading.get_ident()}.tmp"
+                with open(temporary_filename, 'w', encoding='utf-8') as file:
+                    json.dump(cache_data, file)
+                os.replace(temporary_filename, self._home_filename)
+                values['rows'] = len(route_distances)
+            home_caches[address] = cache_data
+            return cache_data
 
     def get_home_node(self, address: str, neo4j_id: str) -> Home:
-        self._calculate_home_cache(address)
-        with open(self._home_filename, 'r', encoding='utf-8') as file:
-            cache_data = json.load(file)
-            return Home(neo4j_id, cache_data['latitude'], cache_data['longitude'], cache_data['osmid'])
+        cache_data = self._calculate_home_cache(address)
+        return Home(neo4j_id, cache_data['latitude'], cache_data['longitude'], cache_data['osmid'])
 
     def get_home_stamp_distances(self, address: str) -> Dict[int, float]:
-        self._calculate_home_cache(address)
-        with open(self._home_filename, 'r', encoding='utf-8') as file:
-            cache_data = json.load(file)
-            return cache_data['distances']
+        cache_data = self._calculate_home_cache(address)
+        nodes = self.nodes
+        return {nodes.index(neo4j_id): distance
+                for neo4j_id, distance in cache_data['distances'].items()
+                if neo4j_id in nodes and not math.isinf(distance)}
     
-    def _import_missing_distances(self, max_section_length_m: Optional[float]) -> int:
+    def _import_missing_distances(self,
+                                  max_section_length_m: Optional[float],
+                                  nearest_neighbours: Optional[int] = None,
+                                  nearest_neighbour_radius_m: Optional[float] = None) -> int:
+        if nearest_neighbours is not None:
+            return self._import_nearest_neighbour_distances(nearest_neighbours, max_section_length_m,
+                                                            nearest_neighbour_radius_m)
+        routed_count = 0
+        lower_bound_filter = "r.lowerBound IS NOT NULL" if max_section_length_m is None else "r.lowerBound < $max_section_length_m"
+        parameters = {'max_section_length_m': max_section_length_m}
         with self._neo4j_session() as session:
             # calculate distances of arcs between stamp points if distance is missing and needed
+            # (arcs without distance carry a lowerBound, so the filter is backed by the lowerBound index)
             query = "MATCH (s1:StampPoint)-[r:TO]->(s2:StampPoint) " \
-                    "WHERE r.distance IS NULL AND s1.stamp_id < s2.stamp_id " \
-                    "" + ("" if max_section_length_m is None else f"AND r.lowerBound < {max_section_length_m} ") + "" \
-                    "RETURN s1.osmid AS osmid1, s2.osmid AS osmid2, elementId(r) AS rid"
-            results = session.run(query)
-            origin_osmids = []
-            destiation_osmids = []
-            relation_osmids = []
-            for result in results:
-                origin_osmids.append(result.get("osmid1"))
-                destiation_osmids.append(result.get("osmid2"))
-                relation_osmids.append(result.get("rid"))
-            if len(origin_osmids) > 0:
-                routes = ox.routing.shortest_path(
-                    self.map, orig=origin_osmids, dest=destiation_osmids,
-                    weight='length', cpus=self._threads)
-                for i, route in enumerate(routes):
-                    if len(route) == 1:
-                        distance = 0
-                    else:
-                        gdf = ox.routing.route_to_gdf(self.map, route, weight='length')
-                        distance = gdf['length'].sum()
-                    query = "MATCH (s1:StampPoint)-[r1:TO]->(s2:StampPoint) " \
-                            f"WHERE elementId(r1) = '{relation_osmids[i]}' " \
-                            "MATCH (s2:StampPoint)-[r2:TO]->(s1:StampPoint) " \
-                            f"SET r1 = {{distance: {distance}}}, r2 = {{distance: {distance}}}"
-                    session.run(query)
+                    f"WHERE {lower_bound_filter} AND s1.stamp_id < s2.stamp_id " \
+                    "RETURN s1.stamp_id AS stamp_id1, s1.osmid AS osmid1, s2.stamp_id AS stamp_id2, s2.osmid AS osmid2"
+            results, lower_bound_rows = self._split_by_lower_bound(
+                self._run_query(session, query, parameters), max_section_length_m, "stamp_id1", "stamp_id2")
+            # raise the lowerBound of arcs whose landmark bound or route already exceeds max_section_length_m
+            lower_bound_query = "UNWIND $rows AS row " \
+                                "MATCH (s1:StampPoint {stamp_id: row.key1})-[r1:TO]->(s2:StampPoint {stamp_id: row.key2}) " \
+                                "MATCH (s2)-[r2:TO]->(s1) " \
+                                "SET r1.lowerBound = row.lower_bound, r2.lowerBound = row.lower_bound"
+            self._run_query(session, lower_bound_query, {'rows': lower_bound_rows})
+            query = "UNWIND $rows AS row " \
+                    "MATCH (s1:StampPoint {stamp_id: row.stamp_id1})-[r1:TO]->(s2:StampPoint {stamp_id: row.stamp_id2}) " \
+                    "MATCH (s2)-[r2:TO]->(s1) " \
+                    "SET r1 = {distance: row.distance}, r2 = {distance: row.distance}"
+            routed_count += self._route_checkpointed(results, lambda chunk, distances: self._run_query(
+                session, query, {'rows': [{'stamp_id1': result.get("stamp_id1"),
+                                           'stamp_id2': result.get("stamp_id2"),
+                                           'distance': distance}
+                                          for result, distance in zip(chunk, distances)]}),
+                max_section_length_m, lambda chunk: self._run_query(session, lower_bound_query, {
+                    'rows': self._lower_bound_rows(chunk, max_section_length_m, "stamp_id1", "stamp_id2")}))
 
             # calculate distances of arcs between stamp points if arc is missing (reverse arcs are also created)
             query = "MATCH (s1:StampPoint) " \
                     "MATCH (s2:StampPoint) " \
-                    "WHERE NOT (s1)-[:TO]->(s2) AND s1.stamp_id < s2.stamp_id " \
-                    "RETURN elementId(s1) AS id1, s1.osmid AS osmid1, s1.latitude AS lat1, s1.longitude AS lon1, elementId(s2) AS id2, s2.osmid AS osmid2, s2.latitude AS lat2, s2.longitude AS lon2"
-            results = session.run(query)
-            origins = []
-            origin_osmids = []
-            destinations = []
-            destination_ids = []
-            for result in results:
-                distance_lower_bound = 0.95*ox.distance.great_circle(result.get(
-                    "lat1"), result.get("lon1"), result.get("lat2"), result.get("lon2"))
-                if max_section_length_m is None or distance_lower_bound < max_section_length_m:
-                    origins.append(result.get("osmid1"))
-                    origin_osmids.append(result.get("id1"))
-                    destinations.append(result.get("osmid2"))
-                    destination_ids.append(result.get("id2"))
-                else:
-                    query = f"MATCH (s1:StampPoint) WHERE elementId(s1) = '{result.get('id1')}' " \
-                            f"MATCH (s2:StampPoint) WHERE elementId(s2) = '{result.get('id2')}' " \
-                            f"MERGE (s1)-[r1:TO]->(s2) " \
-                            f"ON CREATE SET r1 = {{lowerBound: {distance_lower_bound}}} " \
-                            f"MERGE (s2)-[r2:TO]->(s1)" \
-                            f"ON CREATE SET r2 = {{lowerBound: {distance_lower_bound}}} "
-                    session.run(query)
-            if len(origins) > 0:
-                routes = ox.routing.shortest_path(
-                    self.map, orig=origins, dest=destinations, weight='length', cpus=self._threads)
-                for i, route in enumerate(routes):
-                    if len(route) == 1:
-                        distance = 0
-                    else:
-                        gdf = ox.routing.route_to_gdf(
-                            self.map, route, weight='length')
-                        distance = gdf['length'].sum()
-                    query = f"MATCH (s1:StampPoint) WHERE elementId(s1) = '{origin_osmids[i]}' " \
-                            f"MATCH (s2:StampPoint) WHERE elementId(s2) = '{destination_ids[i]}' " \
-                            f"MERGE (s1)-[r1:TO]->(s2) " \
-                            f"ON CREATE SET r1 = {{distance: {distance}}} " \
-                            f"MERGE (s2)-[r2:TO]->(s1)" \
-                            f"ON CREATE SET r2 = {{distance: {distance}}} "
-                    session.run(query)
+                    "WHERE s1.stamp_id < s2.stamp_id AND NOT (s1)-[:TO]->(s2) " \
+                    "RETURN s1.stamp_id AS stamp_id1, s1.osmid AS osmid1, s1.latitude AS lat1, s1.longitude AS lon1, " \
+                    "s2.stamp_id AS stamp_id2, s2.osmid AS osmid2, s2.latitude AS lat2, s2.longitude AS lon2"
+            routed_results, lower_bound_rows = self._split_by_lower_bound(
+                self._run_query(session, query), max_section_length_m, "stamp_id1", "stamp_id2")
+            lower_bound_query = "UNWIND $rows AS row " \
+                                "MATCH (s1:StampPoint {stamp_id: row.key1}) " \
+                                "MATCH (s2:StampPoint {stamp_id: row.key2}) " \
+                                "MERGE (s1)-[r1:TO]->(s2) " \
+                                "ON CREATE SET r1 = {lowerBound: row.lower_bound} " \
+                                "MERGE (s2)-[r2:TO]->(s1) " \
+                                "ON CREATE SET r2 = {lowerBound: row.lower_bound}"
+            self._run_query(session, lower_bound_query, {'rows': lower_bound_rows})
+            query = "UNWIND $rows AS row " \
+                    "MATCH (s1:StampPoint {stamp_id: row.stamp_id1}) " \
+                    "MATCH (s2:StampPoint {stamp_id: row.stamp_id2}) " \
+                    "MERGE (s1)-[r1:TO]->(s2) " \
+                    "ON CREATE SET r1 = {distance: row.distance} " \
+                    "MERGE (s2)-[r2:TO]->(s1) " \
+                    "ON CREATE SET r2 = {distance: row.distance}"
+            routed_count += self._route_checkpointed(routed_results, lambda chunk, distances: self._run_query(
+                session, query, {'rows': [{'stamp_id1': result.get("stamp_id1"),
+                                           'stamp_id2': result.get("stamp_id2"),
+                                           'distance': distance}
+                                          for result, distance in zip(chunk, distances)]}),
+                max_section_length_m, lambda chunk: self._run_query(session, lower_bound_query, {
+                    'rows': self._lower_bound_rows(chunk, max_section_length_m, "stamp_id1", "stamp_id2")}))
 
             # calculate distances of arcs not between stamp points if distance is missing and needed
             query = "MATCH (n1)-[r:TO]->(n2) " \
-                    "WHERE NOT (n1:StampPoint AND n2:StampPoint) AND r.distance IS NULL " + ("" if max_section_length_m is None else f"AND r.lowerBound < {max_section_length_m} ") + "" \
-                    "RETURN n1.osmid AS osmid1, n2.osmid AS osmid2, elementId(r) AS rid"
-            results = session.run(query)
-            origin_osmids = []
-            destiation_osmids = []
-            relation_osmids = []
-            for result in results:
-                origin_osmids.append(result.get("osmid1"))
-                destiation_osmids.append(result.get("osmid2"))
-                relation_osmids.append(result.get("rid"))
-            if len(origin_osmids) > 0:
-                routes = ox.routing.shortest_path(
-                    self.map, orig=origin_osmids, dest=destiation_osmids, weight='length', cpus=self._threads)
-                for i, route in enumerate(routes):
-                    if len(route) == 1:
-                        distance = 0
-                    else:
-                        gdf = ox.routing.route_to_gdf(
-                            self.map, route, weight='length')
-                        distance = gdf['length'].sum()
-                    query = "MATCH ()-[r:TO]->() " \
-                            f"WHERE elementId(r) = '{relation_osmids[i]}' " \
-                            f"SET r = {{distance: {distance}}}"
-                    session.run(query)
+                    f"WHERE {lower_bound_filter} AND NOT (n1:StampPoint AND n2:StampPoint) " \
+                    "RETURN labels(n1)[0] AS label1, n1.osmid AS osmid1, " \
+                    "CASE WHEN n1:StampPoint THEN n1.stamp_id ELSE n1.osmid END AS key1, " \
+                    "labels(n2)[0] AS label2, n2.osmid AS osmid2, " \
+                    "CASE WHEN n2:StampPoint THEN n2.stamp_id ELSE n2.osmid END AS key2"
+            routed_results, lower_bound_rows = self._split_by_lower_bound(
+                self._run_query(session, query, parameters), max_section_length_m, "key1", "key2", ("label1", "label2"))
+
+            def write_distances(chunk, distances):
+                # one update per combination of labels, so that both nodes are looked up by their key
+                rows_by_labels = {}
+                for result, distance in zip(chunk, distances):
+                    rows_by_labels.setdefault((result.get("label1"), result.get("label2")), []).append({
+                        'key1': result.get("key1"), 'key2': result.get("key2"), 'distance': distance})
+                for (label1, label2), rows in rows_by_labels.items():
+                    query = "UNWIND $rows AS row " \
+                            f"MATCH (n1:{label1} {{{self._node_key(label1)}: row.key1}})" \
+                            f"-[r:TO]->(n2:{label2} {{{self._node_key(label2)}: row.key2}}) " \
+                            "SET r = {distance: row.distance}"
+                    self._run_query(session, query, {'rows': rows})
+
+            def write_lower_bounds(lower_bound_rows):
+                lower_bound_rows_by_labels = {}
+                for row in lower_bound_rows:
+                    lower_bound_rows_by_labels.setdefault((row['label1'], row['label2']), []).append(row)
+                for (label1, label2), rows in lower_bound_rows_by_labels.items():
+                    query = "UNWIND $rows AS row " \
+                            f"MATCH (n1:{label1} {{{self._node_key(label1)}: row.key1}})" \
+                            f"-[r:TO]->(n2:{label2} {{{self._node_key(label2)}: row.key2}}) " \
+                            "SET r.lowerBound = row.lower_bound"
+                    self._run_query(session, query, {'rows': rows})
+
+            routed_count += self._route_checkpointed(routed_results, write_distances, max_section_length_m,
+                                                     lambda chunk: write_lower_bounds(self._lower_bound_rows(
+                                                         chunk, max_section_length_m, "key1", "key2",
+                                                         ("label1", "label2"))))
+            write_lower_bounds(lower_bound_rows)
 
             # calculate distances from bus stops to stamp points if arc is missing
             query = "MATCH (b:BusStop) " \
                     "MATCH (s:StampPoint) " \
                     "WHERE NOT (b)-[:TO]->(s) " \
-                    "RETURN elementId(b) AS bid, b.osmid AS bosmid, b.latitude AS blat, b.longitude AS blon, elementId(s) AS sid, s.osmid AS sosmid, s.latitude AS slat, s.longitude AS slon"
-            results = session.run(query)
-            origins = []
-            origin_osmids = []
-            destinations = []
-            destination_ids = []
-            for result in results:
-                distance_lower_bound = 0.95*ox.distance.great_circle(result.get(
-                    "blat"), result.get("blon"), result.get("slat"), result.get("slon"))
-                if max_section_length_m is None or distance_lower_bound < max_section_length_m:
-                    origins.append(result.get("bosmid"))
-                    origin_osmids.append(result.get("bid"))
-                    destinations.append(result.get("sosmid"))
-                    destination_ids.append(result.get("sid"))
-                else:
-                    query = f"MATCH (b:BusStop) WHERE elementId(b) = '{result.get('bid')}' " \
-                            f"MATCH (s:StampPoint) WHERE elementId(s) = '{result.get('sid')}' " \
-                            f"MERGE (b)-[r:TO]->(s) " \
-                            f"ON CREATE SET r = {{lowerBound: {distance_lower_bound}}} "
-                    session.run(query)
-            if len(origins) > 0:
-                routes = ox.routing.shortest_path(
-                    self.map, orig=origins, dest=destinations, weight='length', cpus=self._threads)
-                for i, route in enumerate(routes):
-                    if len(route) == 1:
-                        distance = 0
-                    else:
-                        gdf = ox.routing.route_to_gdf(
-                            self.map, route, weight='length')
-                        distance = gdf['length'].sum()
-                    query = f"MATCH (b:BusStop) WHERE elementId(b) = '{origin_osmids[i]}' " \
-                            f"MATCH (s:StampPoint) WHERE elementId(s) = '{destination_ids[i]}' " \
-                            f"CREATE (b)-[:TO {{distance: {distance}}}]->(s)"
-                    session.run(query)
+                    "RETURN b.osmid AS osmid1, b.latitude AS lat1, b.longitude AS lon1, " \
+                    "s.stamp_id AS stamp_id2, s.osmid AS osmid2, s.latitude AS lat2, s.longitude AS lon2"
+            routed_results, lower_bound_rows = self._split_by_lower_bound(
+                self._run_query(session, query), max_section_length_m, "osmid1", "stamp_id2")
+            lower_bound_query = "UNWIND $rows AS row " \
+                                "MATCH (b:BusStop {osmid: row.key1}) " \
+                                "MATCH (s:StampPoint {stamp_id: row.key2}) " \
+                                "MERGE (b)-[r:TO]->(s) " \
+                                "ON CREATE SET r = {lowerBound: row.lower_bound}"
+            self._run_query(session, lower_bound_query, {'rows': lower_bound_rows})
+            query = "UNWIND $rows AS row " \
+                    "MATCH (b:BusStop {osmid: row.osmid}) " \
+                    "MATCH (s:StampPoint {stamp_id: row.stamp_id}) " \
+                    "CREATE (b)-[:TO {distance: row.distance}]->(s)"
+            routed_count += self._route_checkpointed(routed_results, lambda chunk, distances: self._run_query(
+                session, query, {'rows': [{'osmid': result.get("osmid1"),
+                                           'stamp_id': result.get("stamp_id2"),
+                                           'distance': distance}
+                                          for result, distance in zip(chunk, distances)]}),
+                max_section_length_m, lambda chunk: self._run_query(session, lower_bound_query, {
+                    'rows': self._lower_bound_rows(chunk, max_section_length_m, "osmid1", "stamp_id2")}))
 
             # calculate distances from parking lots to stamp points if arc is missing
             query = "MATCH (p:ParkingLot) " \
                     "MATCH (s:StampPoint) " \
                     "WHERE NOT (p)-[:TO]->(s) " \
-                    "RETURN elementId(p) AS pid, p.osmid AS posmid, p.latitude AS plat, p.longitude AS plon, " \
-                    "elementId(s) AS sid, s.osmid AS sosmid, s.latitude AS slat, s.longitude AS slon"
-            results = session.run(query)
-            origins = []
-            origin_osmids = []
-            destinations = []
-            destination_ids = []
-            for result in results:
-                distance_lower_bound = 0.95*ox.distance.great_circle(result.get(
-                    "plat"), result.get("plon"), result.get("slat"), result.get("slon"))
-                if max_section_length_m is None or distance_lower_bound < max_section_length_m:
-                    origins.append(result.get("posmid"))
-                    origin_osmids.append(result.get("pid"))
-                    destinations.append(result.get("sosmid"))
-                    destination_ids.append(result.get("sid"))
-                else:
-                    query = f"MATCH (p:ParkingLot) WHERE elementId(p) = '{result.get('pid')}' " \
-                            f"MATCH (s:StampPoint) WHERE elementId(s) = '{result.get('sid')}' " \
-                            f"MERGE (p)-[r1:TO]->(s) " \
-                            f"ON CREATE SET r1 = {{lowerBound: {distance_lower_bound}}} " \
-                            f"MERGE (s)-[r2:TO]->(p) " \
-                            f"ON CREATE SET r2 = {{lowerBound: {distance_lower_bound}}} "
-                    session.run(query)
-            if len(origins) > 0:
-                routes = ox.routing.shortest_path(
-                    self.map, orig=origins, dest=destinations, weight='length', cpus=self._threads)
-                for i, route in enumerate(routes):
-                    if len(route) == 1:
-                        distance = 0
-                    else:
-                        gdf = ox.routing.route_to_gdf(
-                            self.map, route, weight='length')
-                        distance = gdf['length'].sum()
-                    query = f"MATCH (p:ParkingLot) WHERE elementId(p) = '{origin_osmids[i]}' " \
-                            f"MATCH (s:StampPoint) WHERE elementId(s) = '{destination_ids[i]}' " \
-                            f"CREATE (p)-[:TO {{distance: {distance}}}]->(s) " \
-                            f"CREATE (s)-[:TO {{distance: {distance}}}]->(p) "
-                    session.run(query)
+                    "RETURN p.osmid AS osmid1, p.latitude AS lat1, p.longitude AS lon1, " \
+                    "s.stamp_id AS stamp_id2, s.osmid AS osmid2, s.latitude AS lat2, s.longitude AS lon2"
+            routed_results, lower_bound_rows = self._split_by_lower_bound(
+                self._run_query(session, query), max_section_length_m, "osmid1", "stamp_id2")
+            lower_bound_query = "UNWIND $rows AS row " \
+                                "MATCH (p:ParkingLot {osmid: row.key1}) " \
+                                "MATCH (s:StampPoint {stamp_id: row.key2}) " \
+                                "MERGE (p)-[r1:TO]->(s) " \
+                                "ON CREATE SET r1 = {lowerBound: row.lower_bound} " \
+                                "MERGE (s)-[r2:TO]->(p) " \
+                                "ON CREATE SET r2 = {lowerBound: row.lower_bound}"
+            self._run_query(session, lower_bound_query, {'rows': lower_bound_rows})
+            query = "UNWIND $rows AS row " \
+                    "MATCH (p:ParkingLot {osmid: row.osmid}) " \
+                    "MATCH (s:StampPoint {stamp_id: row.stamp_id}) " \
+                    "CREATE (p)-[:TO {distance: row.distance}]->(s) " \
+                    "CREATE (s)-[:TO {distance: row.distance}]->(p)"
+            routed_count += self._route_checkpointed(routed_results, lambda chunk, distances: self._run_query(
+                session, query, {'rows': [{'osmid': result.get("osmid1"),
+                                           'stamp_id': result.get("stamp_id2"),
+                                           'distance': distance}
+                                          for result, distance in zip(chunk, distances)]}),
+                max_section_length_m, lambda chunk: self._run_query(session, lower_bound_query, {
+                    'rows': self._lower_bound_rows(chunk, max_section_length_m, "osmid1", "stamp_id2")}))
+        return routed_count
+
+    def _route_checkpointed(self,
+                            results: List,
+                            write: Callable[[List, List[float]], None],
+                            cutoff: Optional[float] = None,
+                            write_beyond_cutoff: Optional[Callable[[List], None]] = None) -> int:
+        # route the results (with osmid1 and osmid2) grouped by their source node and write the distances of every
+        # few sources, so that an interrupted import only routes the unwritten sources again
+        # (results that the search did not reach within the cutoff are written with write_beyond_cutoff instead)
+        results_by_source = {}
+        for result in results:
+            results_by_source.setdefault(result.get("osmid1"), []).append(result)
+        sources = list(results_by_source.values())
+        import_state = self._get_import_state()
+        checkpoint = import_state.checkpoint('import_missing_distances') or {'sources': 0, 'routed': 0}
+        for start in range(0, len(sources), self._checkpoint_sources):
+            chunk_sources = sources[start:start + self._checkpoint_sources]
+            chunk = [result for source_results in chunk_sources for result in source_results]
+            distances = self._route_distances([result.get("osmid1") for result in chunk],
+                                              [result.get("osmid2") for result in chunk],
+                                              cutoff=cutoff)
+            write([result for result, distance in zip(chunk, distances) if distance is not None],
+                  [distance for distance in distances if distance is not None])
+            beyond_cutoff = [result for result, distance in zip(chunk, distances) if distance is None]
+            if beyond_cutoff:
+                write_beyond_cutoff(beyond_cutoff)
+            checkpoint = {'sources': checkpoint['sources'] + len(chunk_sources),
+                          'routed': checkpoint['routed'] + len(chunk)}
+            import_state.set_checkpoint('import_missing_distances', checkpoint)
+        return len(results)
+
+    def _import_nearest_neighbour_distances(self,
+                                            nearest_neighbours: int,
+                                            max_section_length_m: Optional[float],
+                                            nearest_neighbour_radius_m: Optional[float] = None) -> int:
+        with self._neo4j_session() as session:
+            # nodes as (key, osmid, latitude, longitude) with the key (label, key property)
+            query = "MATCH (n) WHERE n:StampPoint OR n:BusStop OR n:ParkingLot " \
+                    "RETURN labels(n)[0] AS label, CASE WHEN n:StampPoint THEN n.stamp_id ELSE n.osmid END AS key, " \
+                    "n.osmid AS osmid, n.latitude AS lat, n.longitude AS lon"
+            stamp_points = []
+            start_points = []
+            for result in self._run_query(session, query):
+                point = ((result.get("label"), result.get("key")), result.get("osmid"), result.get("lat"), result.get("lon"))
+                (stamp_points if result.get("label") == 'StampPoint' else start_points).append(point)
+            query = "MATCH (n1)-[r:TO]->(n2:StampPoint) WHERE r.distance IS NOT NULL " \
+                    "RETURN labels(n1)[0] AS label1, CASE WHEN n1:StampPoint THEN n1.stamp_id ELSE n1.osmid END AS key1, " \
+                    "n2.stamp_id AS key2, r.distance AS distance"
+            known_distances = {((result.get("label1"), result.get("key1")), ('StampPoint', result.get("key2"))): result.get("distance")
+                               for result in self._run_query(session, query)}
+
+            distances, routed_count = self._nearest_neighbour_distances(
+                stamp_points, start_points, nearest_neighbours, max_section_length_m, known_distances,
+                nearest_neighbour_radius_m)
+
+            # one update per label of the first node (arcs from parking lots and between stamp points in both directions)
+            rows_by_label = {}
+            for ((label1, key1), (_, key2)), distance in distances.items():
+                rows_by_label.setdefault(label1, []).append({'key1': key1, 'key2': key2, 'distance': distance})
+            for label1, rows in rows_by_label.items():
+                query = "UNWIND $rows AS row " \
+                        f"MATCH (n1:{label1} {{{self._node_key(label1)}: row.key1}}) " \
+                        "MATCH (n2:StampPoint {stamp_id: row.key2}) " \
+                        "MERGE (n1)-[r1:TO]->(n2) " \
+                        "SET r1 = {distance: row.distance}"
+                if label1 != 'BusStop':
+                    query += " MERGE (n2)-[r2:TO]->(n1) " \
+                             "SET r2 = {distance: row.distance}"
+                self._run_query(session, query, {'rows': rows})
+
+            # delete the arcs that are not kept, e.g. the arcs of all pairs from an import without nearest_neighbours
+            kept_arcs = set()
+            for (node_key1, node_key2) in distances:
+                kept_arcs.add((node_key1, node_key2))
+                if node_key1[0] != 'BusStop':
+                    kept_arcs.add((node_key2, node_key1))
+            query = "MATCH (n1)-[r:TO]->(n2) " \
+                    "RETURN labels(n1)[0] AS label1, CASE WHEN n1:StampPoint THEN n1.stamp_id ELSE n1.osmid END AS key1, " \
+                    "labels(n2)[0] AS label2, CASE WHEN n2:StampPoint THEN n2.stamp_id ELSE n2.osmid END AS key2"
+            rows_by_labels = {}
+            for result in self._run_query(session, query):
+                node_key1 = (result.get("label1"), result.get("key1"))
+                node_key2 = (result.get("label2"), result.get("key2"))
+                if (node_key1, node_key2) not in kept_arcs:
+                    rows_by_labels.setdefault((node_key1[0], node_key2[0]), []).append(
+                        {'key1': node_key1[1], 'key2': node_key2[1]})
+            for (label1, label2), rows in rows_by_labels.items():
+                query = "UNWIND $rows AS row " \
+                        f"MATCH (n1:{label1} {{{self._node_key(label1)}: row.key1}})" \
+                        f"-[r:TO]->(n2:{label2} {{{self._node_key(label2)}: row.key2}}) " \
+                        "DELETE r"
+                self._run_query(session, query, {'rows': rows})
+        return routed_count
+
+    def _nearest_neighbour_distances(self,
+                                     stamp_points: List[Tuple],
+                                     start_points: List[Tuple],
+                                     nearest_neighbours: int,
+                                     max_section_length_m: Optional[float],
+                                     known_distances: Dict[Tuple, float],
+                                     radius_m: Optional[float] = None) -> Tuple[Dict[Tuple, float], int]:
+        # returns the distances of the kept pairs (key1, key2) of a stamp point or start point and a stamp point
+        # (points are (key, osmid, latitude, longitude) tuples) and the number of routed pairs, where all pairs
+        # shorter than radius_m are kept besides the nearest neighbours
+        if len(stamp_points) == 0:
+            return {}, 0
+        reference_latitude = float(np.mean([point[2] for point in stamp_points]))
+        stamp_xy = self._project([point[2:4] for point in stamp_points], reference_latitude)
+        tree = scipy.spatial.cKDTree(stamp_xy)
+        candidate_count = min(len(stamp_points), self._nearest_neighbour_candidate_factor * nearest_neighbours + 1)
+
+        def candidates(xy):
+            _, indices = tree.query(xy, k=candidate_count)
+            return np.atleast_1d(indices).tolist()
+
+        # candidate pairs (i, j) of stamp points with i < j and (s, j) of start points and stamp points
+        stamp_pairs = set()
+        start_pairs = set()
+        for i in range(len(stamp_points)):
+            stamp_pairs.update((min(i, j), max(i, j)) for j in candidates(stamp_xy[i]) if j != i)
+        if radius_m is not None:
+            # the walking distance is at least the straight line distance (with the slack of the lower bounds)
+            stamp_pairs.update(tree.query_pairs(radius_m / 0.95))
+        if len(start_points) > 0:
+            start_xy = self._project([point[2:4] for point in start_points], reference_latitude)
+            for start in range(len(start_points)):
+                start_pairs.update((start, j) for j in candidates(start_xy[start]))
+                if radius_m is not None:
+                    start_pairs.update((start, j) for j in tree.query_ball_point(start_xy[start], radius_m / 0.95))
+
+        def allowed(distance):
+            # max_section_length_m only caps the kept arcs, it never adds any
+            return not math.isinf(distance) and (max_section_length_m is None or distance <= max_section_length_m)
+
+        def key_pair(start, i, j):
+            return (stamp_points[i][0] if start is None else start_points[start][0], stamp_points[j][0])
+
+        def known_distance(start, i, j):
+            pair = key_pair(start, i, j)
+            distance = known_distances.get(pair)
+            if distance is None and start is None:
+                distance = known_distances.get((pair[1], pair[0]))
+            return distance
+
+        def route(pairs):
+            # distance of each (start, i, j) pair, routing only the unknown ones
+            distances = {pair: known_distance(*pair) for pair in pairs}
+            routed_pairs = [pair for pair, distance in distances.items() if distance is None]
+            routed_distances = self._route_distances(
+                [stamp_points[i][1] if start is None else start_points[start][1] for start, i, _ in routed_pairs],
+                [stamp_points[j][1] for _, _, j in routed_pairs])
+            distances.update(zip(routed_pairs, routed_distances))
+            return distances, len(routed_pairs)
+
+        distances, routed_count = route([(None, i, j) for i, j in stamp_pairs] +
+                                        [(start, None, j) for start, j in start_pairs])
+
+        # the nearest neighbours by walking distance
+        kept = set()
+        neighbours = {}
+        for (start, i, j), distance in distances.items():
+            if not allowed(distance):
+                continue
+            if start is None:
+                neighbours.setdefault(('stamp', i), []).append((distance, (start, i, j)))
+                neighbours.setdefault(('stamp', j), []).append((distance, (start, i, j)))
+            else:
+                neighbours.setdefault(('start', start), []).append((distance, (start, i, j)))
+        for node_pairs in neighbours.values():
+            kept.update(pair for _, pair in sorted(node_pairs)[:nearest_neighbours])
+        if radius_m is not None:
+            kept.update(pair for pair, distance in distances.items() if allowed(distance) and distance < radius_m)
+
+        # connect the stamp points by a minimum spanning forest of the candidate pairs and then by the closest
+        # straight line pairs between the remaining components
+        parent = list(range(len(stamp_points)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for start, i, j in kept:
+            if start is None:
+                parent[find(i)] = find(j)
+        for (start, i, j), distance in sorted(distances.items(), key=lambda item: item[1]):
+            if start is None and allowed(distance) and find(i) != find(j):
+                parent[find(i)] = find(j)
+                kept.add((start, i, j))
+        while True:
+            components = {}
+            for i in range(len(stamp_points)):
+                components.setdefault(find(i), []).append(i)
+            if len(components) == 1:
+                break
+            smallest = min(components.values(), key=len)
+            best = None
+            for i in smallest:
+                straight_distances, indices = tree.query(stamp_xy[i], k=min(len(stamp_points), len(smallest) + 1))
+                for straight_distance, j in zip(np.atleast_1d(straight_distances), np.atleast_1d(indices)):
+                    if find(int(j)) != find(i):
+                        if best is None or straight_distance < best[0]:
+                            best = (straight_distance, min(i, int(j)), max(i, int(j)))
+                        break
+            pair = (None, best[1], best[2])
+            if pair not in distances:
+                pair_distances, pair_routed_count = route([pair])
+                distances.update(pair_distances)
+                routed_count += pair_routed_count
+            # components without a route (within max_section_length_m) between them stay apart in the model
+            parent[find(pair[1])] = find(pair[2])
+            if allowed(distances[pair]):
+                kept.add(pair)
+
+        return {key_pair(*pair): distances[pair] for pair in kept}, routed_count
+
+    @staticmethod
+    def _project(coordinates: List[Tuple[float, float]], reference_latitude: float) -> np.ndarray:
+        # equirectangular projection of (latitude, longitude) to meters, accurate enough within the Harz
+        coordinates = np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+        return np.column_stack((coordinates[:, 1] * 111320.0 * np.cos(np.radians(reference_latitude)),
+                                coordinates[:, 0] * 110540.0))
+
+    def _split_by_lower_bound(self,
+                              results: List,
+                              max_section_length_m: Optional[float],
+                              key1: str,
+                              key2: str,
+                              extra_keys: Tuple[str, ...] = ()) -> Tuple[List, List[Dict]]:
+        # split the candidate pairs into those to route and lowerBound rows for those that are too far apart
+        # (the straight line bound is only used for results with coordinates, extra_keys are copied into the rows)
+        if max_section_length_m is None:
+            return results, []
+        coordinates1 = coordinates2 = None
+        if len(results) > 0 and "lat1" in results[0].keys():
+            coordinates1 = [(result.get("lat1"), result.get("lon1")) for result in results]
+            coordinates2 = [(result.get("lat2"), result.get("lon2")) for result in results]
+        distance_lower_bounds = self._distance_lower_bounds([result.get("osmid1") for result in results],
+                                                            [result.get("osmid2") for result in results],
+                                                            coordinates1, coordinates2)
+        routed_results = []
+        lower_bound_results = []
+        lower_bounds = []
+        for result, distance_lower_bound in zip(results, distance_lower_bounds):
+            if distance_lower_bound < max_section_length_m:
+                routed_results.append(result)
+            else:
+                lower_bound_results.append(result)
+                lower_bounds.append(distance_lower_bound)
+        return routed_results, self._lower_bound_rows(lower_bound_results, lower_bounds, key1, key2, extra_keys)
+
+    @staticmethod
+    def _lower_bound_rows(results: List,
+                          lower_bounds: Union[float, List[float]],
+                          key1: str,
+                          key2: str,
+                          extra_keys: Tuple[str, ...] = ()) -> List[Dict]:
+        # lowerBound rows with the keys of the results, extra_keys are copied into the rows
+        if not isinstance(lower_bounds, list):
+            lower_bounds = [lower_bounds] * len(results)
+        return [{'key1': result.get(key1),
+                 'key2': result.get(key2),
+                 'lower_bound': lower_bound,
+                 **{key: result.get(key) for key in extra_keys}}
+                for result, lower_bound in zip(results, lower_bounds)]
@@ -0,0 +1,73 @@
+"""
+ImportState class for recording the completed stages and checkpoints of an interrupted data import.
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+
+class ImportState:
+    """
+    The completed stages and progress checkpoints of GraphData.import_data, stored in a JSON file.
+
+    Every change replaces the file with a completely written temporary file, so the state on disk is consistent
+    even if the process dies while it is saved.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._state = None
+
+    def _get_state(self) -> Dict:
+        if self._state is None:
+            if os.path.isfile(self._filename):
+                with open(self._filename, 'r', encoding='utf-8') as file:
+                    self._state = json.load(file)
+            else:
+                self._state = {'completed': [], 'checkpoints': {}}
+        return self._state
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self._filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_filename = self._filename + '.tmp'
+        with open(temporary_filename, 'w', encoding='utf-8') as file:
+            json.dump(self._state, file)
+        os.replace(temporary_filename, self._filename)
+
+    def exists(self) -> bool:
+        """
+        Returns True if a stage or checkpoint of an interrupted import is recorded.
+        """
+        state = self._get_state()
+        return len(state['completed']) > 0 or len(state['checkpoints']) > 0
+
+    def is_completed(self, stage: str) -> bool:
+        return stage in self._get_state()['completed']
+
+    def complete(self, stage: str) -> None:
+        """
+        Records the completion of the stage and drops its checkpoint.
+        """
+        state = self._get_state()
+        if stage not in state['completed']:
+            state['completed'].append(stage)
+        state['checkpoints'].pop(stage, None)
+        self._save()
+
+    def checkpoint(self, stage: str) -> Optional[Dict]:
+        return self._get_state()['checkpoints'].get(stage)
+
+    def set_checkpoint(self, stage: str, checkpoint: Dict) -> None:
+        self._get_state()['checkpoints'][stage] = checkpoint
+        self._save()
+
+    def delete(self) -> None:
+        """
+        Forgets all stages, e.g. after the import has finished.
+        """
+        self._state = None
+        if os.path.isfile(self._filename):
+            os.remove(self._filename)
@@ -0,0 +1,111 @@
+"""
+LandmarkIndex class for lower bounds on walking distances from precomputed landmark distances (ALT).
+"""
+
+from typing import Callable, List
+import numpy as np
+import networkx as nx
+
+
+class LandmarkIndex:
+    """
+    Walking distances from and to a few landmark nodes of the map.
+
+    By the triangle inequality, d(u, v) >= d(L, v) - d(L, u) and d(u, v) >= d(u, L) - d(v, L) for every landmark L.
+    The landmarks are chosen by farthest selection, so they lie at the border of the map, where these bounds are
+    tightest. The bounds are consistent, so they can also be used as A* heuristic.
+    """
+
+    def __init__(self, osmids: np.ndarray, from_landmarks: np.ndarray, to_landmarks: np.ndarray, fingerprint: str = ''):
+        """
+        from_landmarks[i, j] is the distance from landmark j to the node osmids[i] and to_landmarks[i, j] the distance
+        back (inf if there is no route). The fingerprint identifies the map the index was built for.
+        """
+        self.fingerprint = fingerprint
+        self._positions = {int(osmid): i for i, osmid in enumerate(osmids)}
+        self._osmids = osmids
+        self._from_landmarks = from_landmarks
+        self._to_landmarks = to_landmarks
+
+    @classmethod
+    def build(cls, graph: nx.MultiDiGraph, landmark_count: int = 16) -> 'LandmarkIndex':
+        """
+        Selects the landmarks and computes their distances with two Dijkstra searches per landmark.
+        """
+        osmids = np.array(list(graph.nodes), dtype=np.int64)
+        positions = {osmid: i for i, osmid in enumerate(graph.nodes)}
+        reverse_graph = graph.reverse(copy=False)
+
+        def lengths(search_graph, source):
+            row = np.full(len(osmids), np.inf)
+            for node, length in nx.single_source_dijkstra_path_length(search_graph, source, weight='length').items():
+                row[positions[node]] = length
+            return row
+
+        from_columns = []
+        to_columns = []
+        # start with the node farthest from an arbitrary node, then always take the node farthest from all landmarks
+        distances = lengths(graph, osmids[0])
+        closest = np.full(len(osmids), np.inf)
+        for _ in range(min(landmark_count, len(osmids))):
+            landmark = osmids[np.argmax(np.where(np.isfinite(distances), distances, -1.0))]
+            from_columns.append(lengths(graph, landmark))
+            to_columns.append(lengths(reverse_graph, landmark))
+            closest = np.minimum(closest, from_columns[-1])
+            distances = closest
+        return cls(osmids, np.column_stack(from_columns), np.column_stack(to_columns))
+
+    def save(self, filename: str) -> None:
+        np.savez_compressed(filename, osmids=self._osmids,
+                            from_landmarks=self._from_landmarks, to_landmarks=self._to_landmarks,
+                            fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, filename: str) -> 'LandmarkIndex':
+        with np.load(filename) as data:
+            fingerprint = str(data['fingerprint']) if 'fingerprint' in data.files else ''
+            return cls(data['osmids'], data['from_landmarks'], data['to_landmarks'], fingerprint)
+
+    @property
+    def landmark_count(self) -> int:
+        return self._from_landmarks.shape[1]
+
+    def lower_bounds(self, origin_osmids: List[int], destination_osmids: List[int]) -> np.ndarray:
+        """
+        Returns a lower bound on the walking distance from each origin to its destination (0 for unknown nodes).
+        """
+        origins = np.array([self._positions.get(osmid, -1) for osmid in origin_osmids], dtype=np.int64)
+        destinations = np.array([self._positions.get(osmid, -1) for osmid in destination_osmids], dtype=np.int64)
+        bounds = np.zeros(len(origins))
+        known = (origins >= 0) & (destinations >= 0)
+        if known.any():
+            origins = origins[known]
+            destinations = destinations[known]
+            # inf - inf (both unreachable) gives no information
+            with np.errstate(invalid='ignore'):
+                candidates = np.hstack((self._from_landmarks[destinations] - self._from_landmarks[origins],
+                                        self._to_landmarks[origins] - self._to_landmarks[destinations]))
+            bounds[known] = np.maximum(np.where(np.isnan(candidates), 0.0, candidates).max(axis=1), 0.0)
+        return bounds
+
+    def heuristic(self, destination_osmid: int) -> Callable[[int, int], float]:
+        """
+        Returns an A* heuristic for routes to the given destination.
+        """
+        destination = self._positions.get(destination_osmid)
+        if destination is None:
+            return lambda node, target: 0.0
+        from_destination = self._from_landmarks[destination]
+        to_destination = self._to_landmarks[destination]
+
+        def heuristic(node: int, target: int) -> float:
+            position = self._positions.get(node)
+            if position is None:
+                return 0.0
+            with np.errstate(invalid='ignore'):
+                candidates = np.concatenate((from_destination - self._from_landmarks[position],
+                                             self._to_landmarks[position] - to_destination))
+            candidates = candidates[~np.isnan(candidates)]
+            return max(0.0, float(candidates.max())) if candidates.size > 0 else 0.0
+
+        return heuristic
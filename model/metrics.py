@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Dict, Iterator, List
+
+
+class Metrics:
+    """
+    A class to record the duration, counters and statistics of named phases.
+
+    Values of a phase that runs several times are summed up and its 'count' is incremented. Every finished phase is
+    passed to the registered hooks as hook(name, values).
+    """
+
+    def __init__(self) -> None:
+        self._phases: Dict[str, Dict[str, float]] = {}
+        self._hooks: List[Callable[[str, Dict[str, float]], None]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add_hook(self, hook: Callable[[str, Dict[str, float]], None]) -> None:
+        """
+        Registers a function that is called with the name and values of every finished phase.
+        """
+        self._hooks.append(hook)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Dict[str, float]]:
+        """
+        Measures the duration of the enclosed block. Values stored in the yielded dictionary are recorded with it.
+        """
+        values = {}
+        stack = self._stack()
+        stack.append(values)
+        start = time.perf_counter()
+        try:
+            yield values
+        finally:
+            values['duration'] = time.perf_counter() - start
+            stack.pop()
+            self.record(name, **values)
+
+    def count(self, key: str, amount: float = 1) -> None:
+        """
+        Adds the amount to the counter with the given key of every phase that is currently running in this thread.
+        """
+        for values in self._stack():
+            values[key] = values.get(key, 0) + amount
+
+    def record(self, name: str, **values: float) -> None:
+        """
+        Records the values of a finished phase.
+        """
+        with self._lock:
+            phase = self._phases.setdefault(name, {'count': 0})
+            phase['count'] += 1
+            for key, value in values.items():
+                phase[key] = phase.get(key, 0) + value
+        for hook in self._hooks:
+            hook(name, values)
+
+    def reset(self) -> None:
+        """
+        Removes all recorded phases.
+        """
+        with self._lock:
+            self._phases = {}
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns a copy of the recorded phases.
+        """
+        with self._lock:
+            return {name: dict(values) for name, values in self._phases.items()}
+
+    def _stack(self) -> List[Dict[str, float]]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
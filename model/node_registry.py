@@ -0,0 +1,46 @@
+from typing import Dict, Iterator, List
+from model.node import Node
+
+
+class NodeRegistry:
+    """
+    A registry assigning every node a dense integer index.
+    """
+
+    def __init__(self) -> None:
+        self._nodes: List[Node] = []
+        self._indices: Dict[str, int] = {}
+
+    def add(self, node: Node) -> int:
+        """
+        Registers the node and returns its index. Registering a node again returns its existing index.
+        """
+        index = self._indices.get(node.neo4j_id)
+        if index is None:
+            index = len(self._nodes)
+            self._nodes.append(node)
+            self._indices[node.neo4j_id] = index
+        return index
+
+    def index(self, neo4j_id: str) -> int:
+        """
+        Returns the index of the node with the given neo4j ID.
+        """
+        try:
+            return self._indices[neo4j_id]
+        except KeyError as exc:
+            raise ValueError(f"Node with neo4j ID {neo4j_id} not found.") from exc
+
+    def __getitem__(self, index: int) -> Node:
+        if not 0 <= index < len(self._nodes):
+            raise ValueError(f"Node with index {index} not found.")
+        return self._nodes[index]
+
+    def __contains__(self, neo4j_id: str) -> bool:
+        return neo4j_id in self._indices
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._nodes)))
+
+    def __len__(self) -> int:
+        return len(self._nodes)
@@ -0,0 +1,242 @@
+"""
+PlanningService class for solving hiking plans over HTTP with graph data that stays loaded.
+"""
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import json
+import math
+from typing import Deque, Dict, Optional, Tuple
+import uuid
+from model.graph_data import GraphData
+from model.metrics import Metrics
+from model.problem_solver import ProblemSolver
+
+
+@dataclass
+class _Job:
+    """
+    A solve request and its state (queued, running, cancelling, done, failed or cancelled).
+    """
+
+    id: str
+    parameters: Dict
+    time_limit: float
+    state: str = 'queued'
+    solution: Optional[Dict] = None
+    error: Optional[str] = None
+    metrics: Optional[Dict] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> Dict:
+        return {'id': self.id, 'state': self.state, 'solution': self.solution, 'error': self.error, 'metrics': self.metrics}
+
+
+class PlanningService:
+    """
+    A local HTTP service that loads the graph data once and solves concurrent plan requests on a bounded worker pool.
+
+    Endpoints (JSON in and out):
+        POST   /plans       queue a plan with the arguments of ProblemSolver.solve, an optional time_limit in seconds
+                            and wait=true to respond only once the plan is finished
+        GET    /plans/<id>  state, solution, error and metrics of a plan
+        DELETE /plans/<id>  cancel a queued or running plan
+        GET    /health      number of queued and running plans
+
+    Every plan is solved with a finite time limit, as a running solver cannot be interrupted. A plan cancelled while
+    running stays cancelling until the solver has stopped and released its worker, and only then is cancelled.
+    """
+
+    _required_parameters = {'days', 'maximum_daily_distance', 'min_stamps', 'home_address'}
+    _optional_parameters = {'max_bus_days', 'max_parking_days', 'ignore_stamp_ids', 'prioritized_solver_str', 'formulation'}
+    _max_finished_jobs = 1000
+    _reasons = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 503: 'Service Unavailable'}
+
+    def __init__(self,
+                 data: GraphData,
+                 workers: int = 2,
+                 queue_size: int = 16,
+                 default_time_limit: float = 600.0):
+        """
+        Solves at most workers plans at once, each with its time_limit or default_time_limit in seconds.
+        """
+        if not 0 < default_time_limit < math.inf:
+            raise ValueError("The default time limit has to be a positive number of seconds.")
+        self._data = data
+        self._workers = workers
+        self._queue_size = queue_size
+        self._default_time_limit = default_time_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # queued plans, a cancelled plan is removed at once so that it does not count against the queue_size
+        self._queue: Deque[_Job] = deque()
+        self._queue_changed = None
+        self._jobs: Dict[str, _Job] = {}
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        """
+        Loads the graph data and serves requests until the task is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._data.load)
+        self._queue_changed = asyncio.Condition()
+        workers = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self._queue_changed:
+                await self._queue_changed.wait_for(lambda: len(self._queue) > 0)
+                job = self._queue.popleft()
+            try:
+                # there are as many executor threads as workers, so the solve starts right away and its time limit
+                # runs from now on
+                job.state = 'running'
+                metrics = Metrics()
+                try:
+                    solution = await loop.run_in_executor(self._executor, self._solve, job, metrics)
+                    if job.state == 'cancelling':
+                        job.state = 'cancelled'
+                    else:
+                        job.solution = solution.to_dict()
+                        job.state = 'done'
+                except Exception as exc:
+                    if job.state == 'cancelling':
+                        job.state = 'cancelled'
+                    else:
+                        job.state = 'failed'
+                        job.error = str(exc)
+                job.metrics = metrics.to_dict()
+            finally:
+                job.done.set()
+                self._forget_finished_jobs()
+
+    def _solve(self, job: _Job, metrics: Metrics):
+        return ProblemSolver(self._data, metrics).solve(**job.parameters, time_limit=job.time_limit)
+
+    def _forget_finished_jobs(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - self._max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            status, body = await self._handle_request(reader)
+        except (ValueError, TypeError, IndexError, asyncio.IncompleteReadError) as exc:
+            status, body = 400, {'error': str(exc)}
+        payload = json.dumps(body).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {self._reasons[status]}\r\n"
+                     "Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n"
+                     "Connection: close\r\n\r\n".encode('latin-1') + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader) -> Tuple[int, Dict]:
+        method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        body = json.loads(await reader.readexactly(length)) if length > 0 else {}
+
+        parts = path.strip('/').split('/')
+        if method == 'GET' and parts == ['health']:
+            states = [job.state for job in self._jobs.values()]
+            return 200, {'queued': states.count('queued'), 'running': states.count('running'),
+                         'cancelling': states.count('cancelling')}
+        if method == 'POST' and parts == ['plans']:
+            return await self._post_plan(body)
+        if len(parts) == 2 and parts[0] == 'plans' and parts[1] in self._jobs:
+            job = self._jobs[parts[1]]
+            if method == 'GET':
+                return 200, job.to_dict()
+            if method == 'DELETE':
+                self._cancel(job)
+                return 200, job.to_dict()
+        return 404, {'error': f"{method} {path} not found."}
+
+    async def _post_plan(self, body: Dict) -> Tuple[int, Dict]:
+        if not isinstance(body, dict):
+            raise ValueError("The request body has to be a JSON object.")
+        missing = self._required_parameters - set(body)
+        if missing:
+            raise ValueError(f"Missing parameters: {', '.join(sorted(missing))}.")
+        unknown = set(body) - self._required_parameters - self._optional_parameters - {'time_limit', 'wait'}
+        if unknown:
+            raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}.")
+        parameters = {key: value for key, value in body.items()
+                      if key in self._required_parameters or key in self._optional_parameters}
+        self._validate_parameters(parameters)
+        if 'ignore_stamp_ids' in parameters:
+            parameters['ignore_stamp_ids'] = set(parameters['ignore_stamp_ids'])
+        time_limit = body.get('time_limit')
+        if time_limit is None:
+            time_limit = self._default_time_limit
+        elif not self._is_number(time_limit) or not 0 < time_limit < math.inf:
+            raise ValueError("The time limit has to be a positive number of seconds.")
+        job = _Job(uuid.uuid4().hex, parameters, float(time_limit))
+        if len(self._queue) >= self._queue_size:
+            return 503, {'error': "Too many queued plans."}
+        async with self._queue_changed:
+            self._queue.append(job)
+            self._queue_changed.notify()
+        self._jobs[job.id] = job
+        if body.get('wait', False):
+            await job.done.wait()
+            return 200, job.to_dict()
+        return 202, job.to_dict()
+
+    @staticmethod
+    def _is_integer(value) -> bool:
+        # JSON booleans are ints in Python
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    @staticmethod
+    def _is_number(value) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+    def _validate_parameters(self, parameters: Dict) -> None:
+        # invalid parameters are rejected with 400 before they reach a worker
+        if not self._is_integer(parameters['days']) or parameters['days'] < 1:
+            raise ValueError("The number of days has to be a positive integer.")
+        maximum_daily_distance = parameters['maximum_daily_distance']
+        if not self._is_number(maximum_daily_distance) or not 0 < maximum_daily_distance < math.inf:
+            raise ValueError("The maximum daily distance has to be a positive number of meters.")
+        for key in ('min_stamps', 'max_bus_days', 'max_parking_days'):
+            if key in parameters and (not self._is_integer(parameters[key]) or parameters[key] < 0):
+                raise ValueError(f"The parameter {key} has to be a non-negative integer.")
+        if not isinstance(parameters['home_address'], str) or not parameters['home_address'].strip():
+            raise ValueError("The home address has to be a non-empty string.")
+        ignore_stamp_ids = parameters.get('ignore_stamp_ids', [])
+        if not isinstance(ignore_stamp_ids, list) or not all(self._is_integer(stamp_id) for stamp_id in ignore_stamp_ids):
+            raise ValueError("The ignored stamp IDs have to be a list of integers.")
+        prioritized_solver_str = parameters.get('prioritized_solver_str')
+        if prioritized_solver_str is not None and not isinstance(prioritized_solver_str, str):
+            raise ValueError("The prioritized solver has to be a string.")
+        if parameters.get('formulation', 'directed') not in ('directed', 'undirected'):
+            raise ValueError("The formulation has to be 'directed' or 'undirected'.")
+
+    def _cancel(self, job: _Job) -> None:
+        if job.state == 'queued':
+            self._queue.remove(job)
+            job.state = 'cancelled'
+            job.done.set()
+        elif job.state == 'running':
+            # the worker sets the plan to cancelled once the solver has returned
+            job.state = 'cancelling'
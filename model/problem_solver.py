@@ -3,23 +3,65 @@ This module contains the ProblemSolver class which is used to solve hiking route
 
 Classes
 ProblemSolver
+InfeasibleError
+SolverTimeoutError
 """
-from pulp import LpVariable, LpProblem, LpBinary, LpContinuous, LpMinimize, lpSum, listSolvers, getSolver, PULP_CBC_CMD, LpStatus
-from typing import Optional, Set
+from pulp import LpVariable, LpProblem, LpBinary, LpContinuous, LpMinimize, lpSum, listSolvers, getSolver, PULP_CBC_CMD, LpStatus, value
+from dataclasses import dataclass, field
+import time
+from typing import Dict, List, Optional, Set
 from model.graph_data import GraphData
+from model.home import Home
+from model.metrics import Metrics
 from model.solution import Solution
 
 
+class InfeasibleError(ValueError):
+    """
+    Raised if the problem configuration has no solution.
+    """
+
+
+class SolverTimeoutError(RuntimeError):
+    """
+    Raised if the solver reaches its time limit before it found a solution.
+    """
+
+
+@dataclass
+class _Model:
+    """
+    The MIP of one solve call together with the data needed to extract its solution.
+    """
+
+    problem: LpProblem
+    days: int
+    x: Dict
+    y: Dict
+    z: Dict
+    home_start: Home
+    home_end: Home
+    home_start_id: int
+    home_end_id: int
+    home_stamp_distances: Dict[int, float]
+    ignore_node_ids: Set[int]
+    formulation: str = 'directed'
+    # undirected edges between stamp points (undirected formulation)
+    e: Dict = field(default_factory=dict)
+
+
 class ProblemSolver:
     """
     A class to represent a problem solver for hiking routes.
     """
 
-    def __init__(self, data: GraphData):
+    def __init__(self, data: GraphData, metrics: Optional[Metrics] = None):
         """
         Constructs all the necessary attributes for the ProblemSolver object.
+        The phases of solve are recorded in metrics, which defaults to the metrics of data.
         """
         self.data = data
+        self.metrics = metrics if metrics is not None else data.metrics
 
     def solve(self,
               days: int,
@@ -29,51 +71,92 @@ class ProblemSolver:
               max_bus_days: int = 0,
               max_parking_days: int = 0,
               ignore_stamp_ids: Set[int] = set(),
-              prioritized_solver_str: Optional[str] = None) -> Solution:
+              prioritized_solver_str: Optional[str] = None,
+              time_limit: Optional[float] = None,
+              formulation: str = 'directed') -> Solution:
         """
         Solves the hiking route problem with the given constraints.
+        With a time_limit (in seconds), the best solution found by the solver within that time is returned.
+
+        The 'directed' formulation uses one arc variable per direction and MTZ constraints against subtours. The
+        'undirected' formulation uses one edge variable per pair of stamp points with arcs in both directions,
+        keeps only the legs from and to the start nodes directed and adds subtour cuts until the tours are closed.
         """
+        with self.metrics.phase('build_model') as values:
+            model = self._build_model(days, maximum_daily_distance, min_stamps, home_address,
+                                      max_bus_days, max_parking_days, ignore_stamp_ids, formulation=formulation)
+            values.update(self._model_statistics(model.problem))
+        with self.metrics.phase('solve_model') as values:
+            self._solve_model(model, prioritized_solver_str, time_limit)
+            values['solver_seconds'] = model.problem.solutionTime
+        with self.metrics.phase('extract_solution'):
+            return self._extract_solution(model)
+
+    @staticmethod
+    def _model_statistics(problem: LpProblem) -> Dict[str, float]:
+        constraints = problem.constraints.values()
+        return {'variables': len(problem.variables()),
+                'constraints': len(constraints),
+                'nonzeros': sum(len(constraint) for constraint in constraints)}
+
+    def _build_model(self,
+                     days: int,
+                     maximum_daily_distance: float,
+                     min_stamps: int,
+                     home_address: str,
+                     max_bus_days: int,
+                     max_parking_days: int,
+                     ignore_stamp_ids: Set[int],
+                     ignore_node_ids: Set[int] = frozenset(),
+                     formulation: str = 'directed') -> _Model:
         home_stamp_distances = self.data.get_home_stamp_distances(home_address)
         home_start = self.data.get_home_node(home_address, "home_start")
         home_end = self.data.get_home_node(home_address, "home_end")
-        def get_node(node_id):
-            if node_id == "home_start":
-                return home_start
-            if node_id == "home_end":
-                return home_end
-            return self.data.node(node_id)
+        # the home nodes are not registered, so they get the next free indices
+        home_start_id = len(self.data.nodes)
+        home_end_id = home_start_id + 1
 
-        ignore_stamp_point_ids = set()
+        # stamp points, bus stops and parking lots left out of the model
+        ignore_node_ids = set(ignore_node_ids)
         for stamp_point_id in self.data.stamp_points:
             if self.data.node(stamp_point_id).stamp_id in ignore_stamp_ids:
-                ignore_stamp_point_ids.add(stamp_point_id)
+                ignore_node_ids.add(stamp_point_id)
+
+        if formulation == 'undirected':
+            return self._build_undirected_model(days, maximum_daily_distance, min_stamps, max_bus_days,
+                                                max_parking_days, home_start, home_end, home_start_id, home_end_id,
+                                                home_stamp_distances, ignore_node_ids)
+        if formulation != 'directed':
+            raise ValueError(f"Unknown formulation '{formulation}'.")
 
         # Is the node (origin, bus_stop, parking_lot, stamp_point) visited on day?
         x = {}
         # Position of the stamp_point on the tour.
         z = {}
         for day in range(days):
-            x[day, home_start.neo4j_id] = LpVariable(f"x[{day},{home_start.neo4j_id}]", cat=LpBinary)
-            x[day, home_end.neo4j_id] = LpVariable(f"x[{day},{home_end.neo4j_id}]", cat=LpBinary)
+            x[day, home_start_id] = LpVariable(f"x[{day},{home_start_id}]", cat=LpBinary)
+            x[day, home_end_id] = LpVariable(f"x[{day},{home_end_id}]", cat=LpBinary)
             for stamp_point_id in self.data.stamp_points:
-                if stamp_point_id not in ignore_stamp_point_ids:
+                if stamp_point_id not in ignore_node_ids:
                     x[day, stamp_point_id] = LpVariable(f"x[{day},{stamp_point_id}]", cat=LpBinary)
                     z[day, stamp_point_id] = LpVariable(f"z[{day},{stamp_point_id}]", 0, len(self.data.stamp_points), LpContinuous)
             for bus_stop_id in self.data.bus_stops:
-                x[day, bus_stop_id] = LpVariable(f"x[{day},{bus_stop_id}]", cat=LpBinary)
+                if bus_stop_id not in ignore_node_ids:
+                    x[day, bus_stop_id] = LpVariable(f"x[{day},{bus_stop_id}]", cat=LpBinary)
             for parking_lot_id in self.data.parking_lots:
-                x[day, parking_lot_id] = LpVariable(f"x[{day},{parking_lot_id}]", cat=LpBinary)
+                if parking_lot_id not in ignore_node_ids:
+                    x[day, parking_lot_id] = LpVariable(f"x[{day},{parking_lot_id}]", cat=LpBinary)
         # Is the arc (from_id, to_id) used on day?
         y = {}
         for day in range(days):
             for from_id in self.data.distances:
                 for to_id in self.data.distances[from_id]:
-                    if from_id not in ignore_stamp_point_ids and to_id not in ignore_stamp_point_ids:
+                    if from_id not in ignore_node_ids and to_id not in ignore_node_ids:
                         y[day, from_id, to_id] = LpVariable(f"y[{day},{from_id},{to_id}]", cat=LpBinary)
             for stamp_point_id in home_stamp_distances:
-                if stamp_point_id not in ignore_stamp_point_ids:
-                    y[day, home_start.neo4j_id, stamp_point_id] = LpVariable(f"y[{day},{home_start.neo4j_id},{stamp_point_id}]", cat=LpBinary)
-                    y[day, stamp_point_id, home_end.neo4j_id] = LpVariable(f"y[{day},{stamp_point_id},{home_end.neo4j_id}]", cat=LpBinary)
+                if stamp_point_id not in ignore_node_ids:
+                    y[day, home_start_id, stamp_point_id] = LpVariable(f"y[{day},{home_start_id},{stamp_point_id}]", cat=LpBinary)
+                    y[day, stamp_point_id, home_end_id] = LpVariable(f"y[{day},{stamp_point_id},{home_end_id}]", cat=LpBinary)
         # auxiliary variable for daily distance
         d = []
         for day in range(days):
@@ -88,89 +171,282 @@ class ProblemSolver:
         # daily distance (includes maximum from ub of d[day])
         for day in range(days):
             prob += lpSum(self.data.distances[from_id][to_id] * y[day, from_id, to_id]
-                        for from_id in self.data.distances if from_id not in ignore_stamp_point_ids
-                        for to_id in self.data.distances[from_id] if to_id not in ignore_stamp_point_ids) + \
-                    lpSum(home_stamp_distances[stamp_point_id] * y[day, home_start.neo4j_id, stamp_point_id]
-                        for stamp_point_id in home_stamp_distances if stamp_point_id not in ignore_stamp_point_ids) + \
-                    lpSum(home_stamp_distances[stamp_point_id] * y[day, stamp_point_id, home_end.neo4j_id]
-                        for stamp_point_id in home_stamp_distances if stamp_point_id not in ignore_stamp_point_ids) == d[day]
+                        for from_id in self.data.distances if from_id not in ignore_node_ids
+                        for to_id in self.data.distances[from_id] if to_id not in ignore_node_ids) + \
+                    lpSum(home_stamp_distances[stamp_point_id] * y[day, home_start_id, stamp_point_id]
+                        for stamp_point_id in home_stamp_distances if stamp_point_id not in ignore_node_ids) + \
+                    lpSum(home_stamp_distances[stamp_point_id] * y[day, stamp_point_id, home_end_id]
+                        for stamp_point_id in home_stamp_distances if stamp_point_id not in ignore_node_ids) == d[day]
 
         # visit exactly one starting node each day (bus, parking or home)
         for day in range(days):
-            prob += lpSum(x[day, bus_stop] for bus_stop in self.data.bus_stops) + \
-                    lpSum(x[day, parking_lot] for parking_lot in self.data.parking_lots) + \
-                    x[day, home_start.neo4j_id] == 1
+            prob += lpSum(x[day, bus_stop] for bus_stop in self.data.bus_stops if bus_stop not in ignore_node_ids) + \
+                    lpSum(x[day, parking_lot] for parking_lot in self.data.parking_lots if parking_lot not in ignore_node_ids) + \
+                    x[day, home_start_id] == 1
             
         # visit each stamp_point at most once
         for stamp_point_id in self.data.stamp_points:
-            if stamp_point_id not in ignore_stamp_point_ids:
+            if stamp_point_id not in ignore_node_ids:
                 prob += lpSum(x[day, stamp_point_id] for day in range(days)) <= 1
             
         # link arcs to nodes (flow conservation)
         for day in range(days):
             for from_id in self.data.distances:
                 # only if there are outgoing arcs (every node except if no other point is within max_section_length_m)
-                if len(self.data.distances[from_id]) > 0 and from_id not in ignore_stamp_point_ids:
-                    prob += lpSum(y[day, from_id, to_id] for to_id in self.data.distances[from_id] if to_id not in ignore_stamp_point_ids) + \
-                         (y[day, from_id, home_end.neo4j_id] if from_id in home_stamp_distances else 0) == x[day, from_id]
+                if len(self.data.distances[from_id]) > 0 and from_id not in ignore_node_ids:
+                    prob += lpSum(y[day, from_id, to_id] for to_id in self.data.distances[from_id] if to_id not in ignore_node_ids) + \
+                         (y[day, from_id, home_end_id] if from_id in home_stamp_distances else 0) == x[day, from_id]
             for to_id in self.data.distances_reverse:
                 # only if there are incoming arcs (parking lots and stamp points except if no other point is within max_section_length_)
-                if len(self.data.distances_reverse[to_id]) > 0 and to_id not in ignore_stamp_point_ids:
-                    prob += lpSum(y[day, from_id, to_id] for from_id in self.data.distances_reverse[to_id] if from_id not in ignore_stamp_point_ids) + \
-                        (y[day, home_start.neo4j_id, to_id] if to_id in home_stamp_distances else 0) == x[day, to_id]
+                if len(self.data.distances_reverse[to_id]) > 0 and to_id not in ignore_node_ids:
+                    prob += lpSum(y[day, from_id, to_id] for from_id in self.data.distances_reverse[to_id] if from_id not in ignore_node_ids) + \
+                        (y[day, home_start_id, to_id] if to_id in home_stamp_distances else 0) == x[day, to_id]
             # home_start and home_end
-            prob += lpSum(y[day, from_id, home_end.neo4j_id] for from_id in home_stamp_distances if from_id not in ignore_stamp_point_ids) == x[day, home_end.neo4j_id]
-            prob += lpSum(y[day, home_start.neo4j_id, to_id] for to_id in home_stamp_distances if to_id not in ignore_stamp_point_ids) == x[day, home_start.neo4j_id]
+            prob += lpSum(y[day, from_id, home_end_id] for from_id in home_stamp_distances if from_id not in ignore_node_ids) == x[day, home_end_id]
+            prob += lpSum(y[day, home_start_id, to_id] for to_id in home_stamp_distances if to_id not in ignore_node_ids) == x[day, home_start_id]
 
         # no subtour consisting of stamp_points
         for day in range(days):
             for from_id in self.data.stamp_points:
-                if from_id not in ignore_stamp_point_ids:
+                if from_id not in ignore_node_ids:
                     for to_id in self.data.stamp_points:
-                        if to_id not in ignore_stamp_point_ids:
+                        if to_id not in ignore_node_ids:
                             if from_id in self.data.distances and to_id in self.data.distances[from_id]:
                                 prob += z[day, from_id] + 1 <= z[day, to_id] + len(self.data.stamp_points) * (1 - y[day, from_id, to_id])
 
         # visit at least min_stamps stamp_points
         prob += lpSum(x[day, stamp_point_id] for day in range(days)
-                      for stamp_point_id in self.data.stamp_points if stamp_point_id not in ignore_stamp_point_ids) >= min_stamps
+                      for stamp_point_id in self.data.stamp_points if stamp_point_id not in ignore_node_ids) >= min_stamps
             
         # maximum number of bus days
-        prob += lpSum(x[day, bus_stop] for day in range(days) for bus_stop in self.data.bus_stops) <= max_bus_days
+        prob += lpSum(x[day, bus_stop] for day in range(days) for bus_stop in self.data.bus_stops if bus_stop not in ignore_node_ids) <= max_bus_days
+
+        # maximum number of parking days
+        prob += lpSum(x[day, parking_lot] for day in range(days) for parking_lot in self.data.parking_lots if parking_lot not in ignore_node_ids) <= max_parking_days
+
+        return _Model(prob, days, x, y, z, home_start, home_end, home_start_id, home_end_id,
+                      home_stamp_distances, ignore_node_ids)
+
+    def _build_undirected_model(self,
+                                days: int,
+                                maximum_daily_distance: float,
+                                min_stamps: int,
+                                max_bus_days: int,
+                                max_parking_days: int,
+                                home_start: Home,
+                                home_end: Home,
+                                home_start_id: int,
+                                home_end_id: int,
+                                home_stamp_distances: Dict[int, float],
+                                ignore_node_ids: Set[int]) -> _Model:
+        stamp_point_ids = [stamp_point_id for stamp_point_id in self.data.stamp_points
+                           if stamp_point_id not in ignore_node_ids]
+        bus_stop_ids = [bus_stop_id for bus_stop_id in self.data.bus_stops if bus_stop_id not in ignore_node_ids]
+        parking_lot_ids = [parking_lot_id for parking_lot_id in self.data.parking_lots
+                           if parking_lot_id not in ignore_node_ids]
+        stamp_point_id_set = set(stamp_point_ids)
+
+        # pairs of stamp points with arcs in both directions (stored with the same distance, the longer one is used)
+        edge_distances = {}
+        for from_id in stamp_point_ids:
+            for to_id, distance in self.data.distances.get(from_id, {}).items():
+                if from_id < to_id and to_id in stamp_point_id_set and from_id in self.data.distances.get(to_id, {}):
+                    edge_distances[from_id, to_id] = max(distance, self.data.distances[to_id][from_id])
+        # directed legs from the start nodes (bus stop, parking lot, home) and back to the end nodes (parking lot, home)
+        leg_distances = {}
+        for start_id in bus_stop_ids + parking_lot_ids:
+            for to_id, distance in self.data.distances.get(start_id, {}).items():
+                if to_id in stamp_point_id_set:
+                    leg_distances[start_id, to_id] = distance
+        for end_id in parking_lot_ids:
+            for from_id, distance in self.data.distances_reverse.get(end_id, {}).items():
+                if from_id in stamp_point_id_set:
+                    leg_distances[from_id, end_id] = distance
+        for stamp_point_id, distance in home_stamp_distances.items():
+            if stamp_point_id in stamp_point_id_set:
+                leg_distances[home_start_id, stamp_point_id] = distance
+                leg_distances[stamp_point_id, home_end_id] = distance
+
+        # Is the node (start, end or stamp_point) visited on day?
+        x = {}
+        # Is the edge {from_id, to_id} (e) or the leg (from_id, to_id) (y) used on day?
+        e = {}
+        y = {}
+        for day in range(days):
+            for node_id in stamp_point_ids + bus_stop_ids + parking_lot_ids + [home_start_id, home_end_id]:
+                x[day, node_id] = LpVariable(f"x[{day},{node_id}]", cat=LpBinary)
+            for from_id, to_id in edge_distances:
+                e[day, from_id, to_id] = LpVariable(f"e[{day},{from_id},{to_id}]", cat=LpBinary)
+            for from_id, to_id in leg_distances:
+                y[day, from_id, to_id] = LpVariable(f"y[{day},{from_id},{to_id}]", cat=LpBinary)
+        d = [LpVariable(f"d[{day}]", 0, maximum_daily_distance, LpContinuous) for day in range(days)]
+
+        prob = LpProblem("Harz-Hiking", LpMinimize)
+        prob += lpSum(d[day] for day in range(days))
+
+        # incident edges and legs of each stamp point, legs of each start and end node
+        incident = {stamp_point_id: [] for stamp_point_id in stamp_point_ids}
+        legs_from = {start_id: [] for start_id in bus_stop_ids + parking_lot_ids + [home_start_id]}
+        legs_to = {end_id: [] for end_id in parking_lot_ids + [home_end_id]}
+        for from_id, to_id in edge_distances:
+            incident[from_id].append(('e', from_id, to_id))
+            incident[to_id].append(('e', from_id, to_id))
+        for from_id, to_id in leg_distances:
+            if from_id in stamp_point_id_set:
+                incident[from_id].append(('y', from_id, to_id))
+                legs_to[to_id].append(from_id)
+            else:
+                incident[to_id].append(('y', from_id, to_id))
+                legs_from[from_id].append(to_id)
+
+        variables = {'e': e, 'y': y}
+        for day in range(days):
+            # daily distance (includes maximum from ub of d[day])
+            prob += lpSum(distance * e[day, from_id, to_id] for (from_id, to_id), distance in edge_distances.items()) + \
+                    lpSum(distance * y[day, from_id, to_id] for (from_id, to_id), distance in leg_distances.items()) == d[day]
+            # visit exactly one starting node each day (bus, parking or home)
+            prob += lpSum(x[day, start_id] for start_id in bus_stop_ids + parking_lot_ids) + x[day, home_start_id] == 1
+            # one leg from the start node, one leg back to the end node (bus days end at home)
+            for start_id, to_ids in legs_from.items():
+                prob += lpSum(y[day, start_id, to_id] for to_id in to_ids) == x[day, start_id]
+            for end_id, from_ids in legs_to.items():
+                prob += lpSum(y[day, from_id, end_id] for from_id in from_ids) == x[day, end_id]
+            prob += x[day, home_end_id] == x[day, home_start_id] + lpSum(x[day, bus_stop_id] for bus_stop_id in bus_stop_ids)
+            # degree constraints
+            for stamp_point_id in stamp_point_ids:
+                prob += lpSum(variables[kind][day, from_id, to_id] for kind, from_id, to_id in incident[stamp_point_id]) == \
+                    2 * x[day, stamp_point_id]
+
+        # visit each stamp_point at most once
+        for stamp_point_id in stamp_point_ids:
+            prob += lpSum(x[day, stamp_point_id] for day in range(days)) <= 1
+
+        # visit at least min_stamps stamp_points
+        prob += lpSum(x[day, stamp_point_id] for day in range(days) for stamp_point_id in stamp_point_ids) >= min_stamps
+
+        # maximum number of bus days
+        prob += lpSum(x[day, bus_stop_id] for day in range(days) for bus_stop_id in bus_stop_ids) <= max_bus_days
 
         # maximum number of parking days
-        prob += lpSum(x[day, parking_lot] for day in range(days) for parking_lot in self.data.parking_lots) <= max_parking_days
+        prob += lpSum(x[day, parking_lot_id] for day in range(days) for parking_lot_id in parking_lot_ids) <= max_parking_days
+
+        return _Model(prob, days, x, y, {}, home_start, home_end, home_start_id, home_end_id,
+                      home_stamp_distances, ignore_node_ids, formulation='undirected', e=e)
+
+    def _solve_model(self, model: _Model, prioritized_solver_str: Optional[str], time_limit: Optional[float] = None) -> None:
+        if model.formulation == 'undirected':
+            self._solve_with_subtour_cuts(model, prioritized_solver_str, time_limit)
+        else:
+            self._solve_problem(model.problem, prioritized_solver_str, time_limit)
 
-        # solve the model
+    def _solve_with_subtour_cuts(self, model: _Model, prioritized_solver_str: Optional[str], time_limit: Optional[float]) -> None:
+        # solve again with cuts against the subtours of the last solution until there are none
+        prob = model.problem
+        start = time.perf_counter()
+        solver_seconds = 0.0
+        while True:
+            remaining_time = None if time_limit is None else time_limit - (time.perf_counter() - start)
+            if remaining_time is not None and remaining_time <= 0:
+                raise SolverTimeoutError("No solution without subtours was found within the time limit.")
+            self._solve_problem(prob, prioritized_solver_str, remaining_time)
+            solver_seconds += prob.solutionTime
+            self.metrics.count('solver_iterations')
+            subtours = [subtour for day in range(model.days) for subtour in self._subtours(model, day)]
+            if not subtours:
+                break
+            # generalized subtour elimination constraints (at most |S|-1 edges between visited stamp points of S)
+            for subtour in subtours:
+                subtour_edges = [(from_id, to_id) for from_id in subtour for to_id in subtour
+                                 if (0, from_id, to_id) in model.e]
+                for day in range(model.days):
+                    for kept_id in subtour:
+                        prob += lpSum(model.e[day, from_id, to_id] for from_id, to_id in subtour_edges) <= \
+                            lpSum(model.x[day, stamp_point_id] for stamp_point_id in subtour if stamp_point_id != kept_id)
+            self.metrics.count('subtour_cuts', len(subtours))
+        # report the time of all solver runs
+        prob.solutionTime = solver_seconds
+
+    def _subtours(self, model: _Model, day: int) -> List[Set[int]]:
+        # components of the used edges that are not connected to a leg
+        neighbours = {}
+        for (edge_day, from_id, to_id), variable in model.e.items():
+            if edge_day == day and variable.value() > 0.5:
+                neighbours.setdefault(from_id, []).append(to_id)
+                neighbours.setdefault(to_id, []).append(from_id)
+        visited = set()
+        for (leg_day, from_id, to_id), variable in model.y.items():
+            if leg_day == day and variable.value() > 0.5:
+                stack = [from_id if from_id in neighbours else to_id]
+                while stack:
+                    node_id = stack.pop()
+                    if node_id not in visited:
+                        visited.add(node_id)
+                        stack.extend(neighbours.get(node_id, ()))
+        subtours = []
+        for node_id in neighbours:
+            if node_id not in visited:
+                subtour = set()
+                stack = [node_id]
+                while stack:
+                    other_id = stack.pop()
+                    if other_id not in subtour:
+                        subtour.add(other_id)
+                        stack.extend(neighbours[other_id])
+                visited |= subtour
+                subtours.append(subtour)
+        return subtours
+
+    def _solve_problem(self, prob: LpProblem, prioritized_solver_str: Optional[str], time_limit: Optional[float]) -> None:
         # check for solvers
-        selected_solver = PULP_CBC_CMD(msg=0)
+        selected_solver = PULP_CBC_CMD(msg=0, timeLimit=time_limit)
         if prioritized_solver_str is not None and prioritized_solver_str in listSolvers():
-            prioritized_solver = getSolver(prioritized_solver_str, msg=0)
+            prioritized_solver = getSolver(prioritized_solver_str, msg=0, timeLimit=time_limit)
             if prioritized_solver.available:
                 selected_solver = prioritized_solver
         status = prob.solve(selected_solver)
         if LpStatus[status] == "Infeasible":
-            raise ValueError("Problem configuration is infeasible.")
+            raise InfeasibleError("Problem configuration is infeasible.")
+        elif LpStatus[status] == "Not Solved" and time_limit is not None:
+            raise SolverTimeoutError("No solution was found within the time limit.")
         elif status != 1:
             raise RuntimeError(f"An unexpected error occured while trying to solve the problem. ({LpStatus[status]})")
 
+    def _get_node(self, model: _Model, node_id: int):
+        if node_id == model.home_start_id:
+            return model.home_start
+        if node_id == model.home_end_id:
+            return model.home_end
+        return self.data.node(node_id)
+
+    def _extract_solution(self, model: _Model) -> Solution:
+        if model.formulation == 'undirected':
+            return self._extract_undirected_solution(model)
+        days = model.days
+        y = model.y
+        home_start_id = model.home_start_id
+        home_end_id = model.home_end_id
+        home_stamp_distances = model.home_stamp_distances
+        ignore_node_ids = model.ignore_node_ids
+        def get_node(node_id):
+            return self._get_node(model, node_id)
+
         # create the solution
         tours = []
         for day in range(days):
             # build prev dict for each day
             next_dict = {}
             for from_id in self.data.distances:
-                if from_id not in ignore_stamp_point_ids:
+                if from_id not in ignore_node_ids:
                     for to_id in self.data.distances[from_id]:
-                        if to_id not in ignore_stamp_point_ids:
+                        if to_id not in ignore_node_ids:
                             if y[day, from_id, to_id].value() > 0.5:
                                 next_dict[from_id] = to_id
             for stamp_id in home_stamp_distances:
-                if stamp_id not in ignore_stamp_point_ids:
-                    if y[day, home_start.neo4j_id, stamp_id].value() > 0.5:
-                        next_dict[home_start.neo4j_id] = stamp_id
-                    if y[day, stamp_id, home_end.neo4j_id].value() > 0.5:
-                        next_dict[stamp_id] = home_end.neo4j_id
+                if stamp_id not in ignore_node_ids:
+                    if y[day, home_start_id, stamp_id].value() > 0.5:
+                        next_dict[home_start_id] = stamp_id
+                    if y[day, stamp_id, home_end_id].value() > 0.5:
+                        next_dict[stamp_id] = home_end_id
 
             # find the destination node (not a stamp_point)
             start_id = None
@@ -190,4 +466,34 @@ class ProblemSolver:
                     tour.append(get_node(next_id))
                     break
             tours.append(tour)
-        return Solution(tours)
+        return Solution(tours, distance=value(model.problem.objective))
+
+    def _extract_undirected_solution(self, model: _Model) -> Solution:
+        tours = []
+        for day in range(model.days):
+            neighbours = {}
+            for (edge_day, from_id, to_id), variable in model.e.items():
+                if edge_day == day and variable.value() > 0.5:
+                    neighbours.setdefault(from_id, []).append(to_id)
+                    neighbours.setdefault(to_id, []).append(from_id)
+            start_leg = None
+            end_leg = None
+            for (leg_day, from_id, to_id), variable in model.y.items():
+                if leg_day == day and variable.value() > 0.5:
+                    if from_id in self.data.stamp_points:
+                        end_leg = (from_id, to_id)
+                    else:
+                        start_leg = (from_id, to_id)
+            if start_leg is None or end_leg is None:
+                raise RuntimeError("No start node found")
+            # follow the edges from the first to the last stamp point
+            tour = [self._get_node(model, start_leg[0]), self._get_node(model, start_leg[1])]
+            previous_id = None
+            current_id = start_leg[1]
+            while current_id != end_leg[0]:
+                previous_id, current_id = current_id, next(
+                    neighbour_id for neighbour_id in neighbours[current_id] if neighbour_id != previous_id)
+                tour.append(self._get_node(model, current_id))
+            tour.append(self._get_node(model, end_leg[1]))
+            tours.append(tour)
+        return Solution(tours, distance=value(model.problem.objective))
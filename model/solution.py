@@ -1,15 +1,123 @@
 from model.node import Node
-from typing import List
+from typing import Dict, Iterable, List, Optional
+import dataclasses
+import json
+import os.path
 import folium
 from folium.plugins import TagFilterButton
+from folium.elements import JSCSSMixin
+from branca.element import MacroElement
+from jinja2 import Template
+
+
+class _GeoJsonTours(JSCSSMixin, MacroElement):
+    """
+    Renders one clustered GeoJSON layer per day with client-side styling and a layer control to filter days.
+    The data is either embedded into the HTML or fetched from data_url when the map is opened.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            function pointToLayer(feature, latlng) {
+                return L.marker(latlng, {
+                    icon: L.AwesomeMarkers.icon({
+                        prefix: 'fa',
+                        icon: feature.properties.icon,
+                        markerColor: feature.properties.color
+                    })
+                }).bindPopup(feature.properties.popup);
+            }
+            function style(feature) {
+                return {color: feature.properties.color};
+            }
+            function isPoint(feature) {
+                return feature.geometry.type === 'Point';
+            }
+            function isLine(feature) {
+                return !isPoint(feature);
+            }
+            function collectionLayer(collection) {
+                var cluster = L.markerClusterGroup();
+                cluster.addLayer(L.geoJSON(collection, {filter: isPoint, pointToLayer: pointToLayer}));
+                return L.featureGroup([L.geoJSON(collection, {filter: isLine, style: style}), cluster]);
+            }
+            function render(data) {
+                var overlays = {};
+                if (data.context !== null) {
+                    overlays[data.context.name] = collectionLayer(data.context);
+                }
+                data.days.forEach(function(collection) {
+                    overlays[collection.name] = collectionLayer(collection).addTo(map);
+                });
+                L.control.layers(null, overlays, {collapsed: false}).addTo(map);
+            }
+            {% if this.data_url is not none %}
+            fetch({{ this.data_url|tojson }})
+                .then(function(response) { return response.json(); })
+                .then(render);
+            {% else %}
+            render({{ this.data|tojson }});
+            {% endif %}
+        })();
+        {% endmacro %}
+    """)
+
+    default_js = [
+        ("markerclusterjs", "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/leaflet.markercluster.js"),
+    ]
+    default_css = [
+        ("markerclustercss", "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.css"),
+        ("markerclusterdefaultcss", "https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.Default.css"),
+    ]
+
+    def __init__(self, data: Optional[Dict] = None, data_url: Optional[str] = None) -> None:
+        super().__init__()
+        self._name = 'GeoJsonTours'
+        self.data = data
+        self.data_url = data_url
 
 
 class Solution:
 
-    def __init__(self, tours: List[List[Node]]) -> None:
+    def __init__(self,
+                 tours: List[List[Node]],
+                 distance: Optional[float] = None,
+                 lower_bound: Optional[float] = None) -> None:
+        """
+        The distance is the total walking distance of the tours in meters. The lower_bound is a bound on the
+        distance of an optimal solution, if known.
+        """
         self.tours = tours
+        self.distance = distance
+        self.lower_bound = lower_bound
+
+    @property
+    def gap(self) -> Optional[float]:
+        """
+        Returns the relative gap between the distance and the lower bound, if both are known.
+        """
+        if self.distance is None or self.lower_bound is None:
+            return None
+        if self.distance <= 0:
+            return 0.0
+        return max(0.0, (self.distance - self.lower_bound) / self.distance)
 
-    def visualize_html(self, filename: str) -> None:
+    def visualize_html(self,
+                       filename: str,
+                       mode: str = 'markers',
+                       data_filename: Optional[str] = None,
+                       context_nodes: Optional[Iterable[Node]] = None) -> None:
+        """
+        Saves a map of the tours as HTML file.
+
+        The 'markers' mode adds one marker and one line object per node and day. The 'geojson' mode writes one
+        GeoJSON FeatureCollection per day, which is styled, clustered and filtered by day in the browser. If
+        data_filename is given, the collections are written to that file and fetched by the map instead of being
+        embedded (the map then has to be served over HTTP). The context_nodes (e.g. all stamp points) are shown
+        as an additional, initially hidden layer in the 'geojson' mode.
+        """
         # Find the center of the map
         min_lat, min_lon, max_lat, max_lon = None, None, None, None
         for tour in self.tours:
@@ -28,6 +136,24 @@ class Solution:
         # Create the map
         m = folium.Map(location=[center_lat, center_lon], zoom_start=12, tiles='OpenStreetMap')
 
+        if mode == 'markers':
+            self._add_markers(m)
+        elif mode == 'geojson':
+            data = self.to_geojson(context_nodes)
+            if data_filename is None:
+                _GeoJsonTours(data=data).add_to(m)
+            else:
+                with open(data_filename, 'w', encoding='utf-8') as file:
+                    json.dump(data, file, separators=(',', ':'))
+                data_url = os.path.relpath(data_filename, os.path.dirname(os.path.abspath(filename)))
+                _GeoJsonTours(data_url=data_url.replace(os.sep, '/')).add_to(m)
+        else:
+            raise ValueError(f"Unknown visualization mode '{mode}'.")
+
+        # Save the map
+        m.save(filename)
+
+    def _add_markers(self, m: folium.Map) -> None:
         # Add markers for each node
         for day, tour in enumerate(self.tours):
             for node in tour:
@@ -40,8 +166,42 @@ class Solution:
         # Add a tag filter button for each group
         TagFilterButton([f"day {day+1}" for day in range(len(self.tours))]).add_to(m)
 
-        # Save the map
-        m.save(filename)
+    def to_geojson(self, context_nodes: Optional[Iterable[Node]] = None) -> Dict:
+        """
+        Returns the tours as one GeoJSON FeatureCollection per day and the context nodes as a separate collection.
+        """
+        days = []
+        for day, tour in enumerate(self.tours):
+            features = [{
+                'type': 'Feature',
+                'geometry': {'type': 'LineString',
+                             'coordinates': [[node.longitude, node.latitude] for node in tour]},
+                'properties': {'color': 'darkred'}
+            }]
+            features.extend(self._point_features(dict.fromkeys(tour)))
+            days.append({'type': 'FeatureCollection', 'name': f"day {day+1}", 'features': features})
+        context = None
+        if context_nodes is not None:
+            context = {'type': 'FeatureCollection', 'name': 'context', 'features': self._point_features(context_nodes)}
+        return {'days': days, 'context': context}
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the tours as a JSON serializable dictionary.
+        """
+        return {'tours': [[{'type': type(node).__name__, **dataclasses.asdict(node)} for node in tour]
+                          for tour in self.tours],
+                'distance': self.distance,
+                'lower_bound': self.lower_bound,
+                'gap': self.gap}
+
+    @staticmethod
+    def _point_features(nodes: Iterable[Node]) -> List[Dict]:
+        return [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [node.longitude, node.latitude]},
+            'properties': {'popup': str(node), 'icon': node.fa_icon, 'color': node.icon_color}
+        } for node in nodes]
 
     def __str__(self) -> str:
         max_stamps = max(len(tour)-2 for tour in self.tours)
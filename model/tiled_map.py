@@ -0,0 +1,286 @@
+"""
+TiledMap class for storing a walk network in geographic tiles that are loaded on demand.
+"""
+
+from collections import OrderedDict
+import glob
+import heapq
+import json
+import math
+import os  # os.remove, os.makedirs
+import os.path  # os.path.isfile
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import networkx as nx
+import osmnx as ox
+from shapely import Polygon, box
+
+TileKey = Tuple[int, int]
+
+
+class TiledMap:
+    """
+    A walk network split into square longitude/latitude tiles.
+
+    Each tile is downloaded, simplified and stored on its own. Nodes outside a tile and the inner end of every edge
+    crossing the tile border are kept during the simplification, so neighbouring tiles share their border nodes.
+    Routing queries load only the tiles their search reaches. A search holds every tile it reached until it has
+    finished, so no tile is read twice within one search, and the max_loaded_tiles most recently used tiles stay
+    loaded for the following searches. The memory is therefore bounded by max_loaded_tiles plus the tiles within
+    the cutoff (or the whole network without a cutoff) around the source of the running search.
+    """
+
+    _index_filename = 'index.json'
+
+    def __init__(self, directory: str, tile_size_deg: float = 0.05, max_loaded_tiles: int = 16):
+        self._directory = directory
+        self._tile_size_deg = tile_size_deg
+        self._max_loaded_tiles = max_loaded_tiles
+        # adjacency (neighbour, length, tile of the neighbour) of the nodes in each loaded tile
+        self._tiles: OrderedDict[TileKey, Dict[int, List[Tuple[int, float, TileKey]]]] = OrderedDict()
+        self._raw_tile_keys: List[TileKey] = []
+        self._raw_tile = None
+        # tile of every node that was looked up or marked to keep
+        self._node_tiles: Dict[int, TileKey] = {}
+        self._keep: Dict[TileKey, Set[int]] = {}
+        self._index = None
+
+    def exists(self) -> bool:
+        """
+        Returns True if a simplified tiled map is stored in the directory.
+        """
+        return os.path.isfile(os.path.join(self._directory, self._index_filename))
+
+    def delete(self) -> None:
+        """
+        Deletes all stored tiles.
+        """
+        for filename in glob.glob(os.path.join(self._directory, '*')):
+            os.remove(filename)
+        self._tiles.clear()
+        self._index = None
+
+    def tile_key(self, lat: float, lon: float) -> TileKey:
+        """
+        Returns the key of the tile containing the given coordinates.
+        """
+        return math.floor(lon / self._tile_size_deg), math.floor(lat / self._tile_size_deg)
+
+    def _tile_box(self, key: TileKey) -> Polygon:
+        return box(key[0] * self._tile_size_deg, key[1] * self._tile_size_deg,
+                   (key[0] + 1) * self._tile_size_deg, (key[1] + 1) * self._tile_size_deg)
+
+    def _raw_filename(self, key: TileKey) -> str:
+        return os.path.join(self._directory, f"raw_{key[0]}_{key[1]}.graphml")
+
+    def _tile_filename(self, key: TileKey) -> str:
+        return os.path.join(self._directory, f"{key[0]}_{key[1]}.json")
+
+    def download(self, polygon: Polygon) -> int:
+        """
+        Downloads the unsimplified walk network of every tile intersecting the polygon and returns the number of
+        tiles with a network. Tiles already downloaded by an interrupted import are not downloaded again.
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        min_lon, min_lat, max_lon, max_lat = polygon.bounds
+        min_x, min_y = self.tile_key(min_lat, min_lon)
+        max_x, max_y = self.tile_key(max_lat, max_lon)
+        self._raw_tile_keys = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                clipped = polygon.intersection(self._tile_box((x, y)))
+                if clipped.is_empty or clipped.area == 0:
+                    continue
+                if os.path.isfile(self._raw_filename((x, y))):
+                    self._raw_tile_keys.append((x, y))
+                    continue
+                try:
+                    graph = ox.graph_from_polygon(clipped,
+                                                  network_type='walk',
+                                                  simplify=False,
+                                                  retain_all=True,
+                                                  truncate_by_edge=True)
+                except ValueError:
+                    # no walkable ways in this tile (osmnx raises its InsufficientResponseError, a ValueError)
+                    continue
+                ox.save_graphml(graph, self._raw_filename((x, y)))
+                self._raw_tile_keys.append((x, y))
+        return len(self._raw_tile_keys)
+
+    def _load_raw_tile(self, key: TileKey) -> Optional[nx.MultiDiGraph]:
+        # only the most recent raw tile is held in memory
+        if self._raw_tile is None or self._raw_tile[0] != key:
+            if key not in self._raw_tile_keys:
+                return None
+            self._raw_tile = (key, ox.load_graphml(self._raw_filename(key)))
+        return self._raw_tile[1]
+
+    def nearest_nodes(self, lons: List[float], lats: List[float]) -> List[int]:
+        """
+        Returns the osmid of the nearest network node for each point, searching the tile containing the point.
+        """
+        osmids = [None] * len(lons)
+        points_by_tile: Dict[TileKey, List[int]] = {}
+        for i, (lon, lat) in enumerate(zip(lons, lats)):
+            points_by_tile.setdefault(self.tile_key(lat, lon), []).append(i)
+        for key, indices in points_by_tile.items():
+            graph = self._load_raw_tile(key)
+            if graph is None:
+                raise RuntimeError(f"There is no walk network in the tile of the point ({lats[indices[0]]}, {lons[indices[0]]}).")
+            nearest = ox.distance.nearest_nodes(graph, [lons[i] for i in indices], [lats[i] for i in indices])
+            for i, osmid in zip(indices, nearest):
+                osmids[i] = int(osmid)
+                node = graph.nodes[osmids[i]]
+                self._node_tiles[osmids[i]] = self.tile_key(node['y'], node['x'])
+        return osmids
+
+    def contains(self, osmid: int, lat: float, lon: float) -> bool:
+        """
+        Returns True if the node with the given osmid and coordinates is part of the downloaded network.
+        """
+        key = self.tile_key(lat, lon)
+        graph = self._load_raw_tile(key)
+        if graph is None or osmid not in graph.nodes:
+            return False
+        self._node_tiles[osmid] = key
+        return True
+
+    def keep(self, osmid: int) -> None:
+        """
+        Marks a node that was found with nearest_nodes or contains to be kept during the simplification.
+        """
+        self._keep.setdefault(self._node_tiles[osmid], set()).add(osmid)
+
+    def simplify(self) -> None:
+        """
+        Simplifies and stores every downloaded tile, then deletes the unsimplified tiles.
+        """
+        for key in self._raw_tile_keys:
+            graph = self._load_raw_tile(key)
+            for osmid in self._keep.get(key, ()):
+                graph.nodes[osmid]['keep'] = True
+            # keep the border, so that the edges crossing it are identical in both tiles
+            inside = {node for node, data in graph.nodes(data=True) if self.tile_key(data['y'], data['x']) == key}
+            for u, v in graph.edges():
+                if u not in inside or v not in inside:
+                    graph.nodes[u]['keep'] = True
+                    graph.nodes[v]['keep'] = True
+            graph = ox.simplify_graph(graph, node_attrs_include=['keep'], edge_attr_aggs={'length': sum})
+            coordinates = {node: (data['y'], data['x']) for node, data in graph.nodes(data=True)}
+            edges = {}
+            for u, v, length in graph.edges(data='length'):
+                if u in inside and length < edges.get((u, v), math.inf):
+                    edges[u, v] = length
+            with open(self._tile_filename(key), 'w', encoding='utf-8') as file:
+                json.dump({'coordinates': {str(node): coordinates[node] for node in graph.nodes},
+                           'edges': [[u, v, length] for (u, v), length in edges.items()]}, file)
+        # the unsimplified tiles are only deleted once all tiles are stored, so an interrupted simplification can
+        # be repeated
+        self._raw_tile = None
+        for key in self._raw_tile_keys:
+            os.remove(self._raw_filename(key))
+
+    def save_index(self) -> None:
+        """
+        Stores the tile size, the tile keys and the tiles of the kept nodes.
+        """
+        index = {'tile_size_deg': self._tile_size_deg,
+                 'tiles': self._raw_tile_keys,
+                 'nodes': {str(osmid): self._node_tiles[osmid] for osmids in self._keep.values() for osmid in osmids}}
+        with open(os.path.join(self._directory, self._index_filename), 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+        self._index = None
+
+    @property
+    def tile_count(self) -> int:
+        """
+        Returns the number of downloaded or stored tiles.
+        """
+        if self._raw_tile_keys:
+            return len(self._raw_tile_keys)
+        return len(self._load_index()['tiles'])
+
+    def _load_index(self) -> Dict:
+        if self._index is None:
+            with open(os.path.join(self._directory, self._index_filename), 'r', encoding='utf-8') as file:
+                self._index = json.load(file)
+            self._tile_size_deg = self._index['tile_size_deg']
+            self._index['tiles'] = {tuple(key) for key in self._index['tiles']}
+            self._index['nodes'] = {int(osmid): tuple(key) for osmid, key in self._index['nodes'].items()}
+        return self._index
+
+    def _tile(self, key: TileKey) -> Dict[int, List[Tuple[int, float, TileKey]]]:
+        # least recently used tiles are evicted once more than max_loaded_tiles are loaded, but a running search
+        # keeps its own references to the evicted tiles it reached
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+        adjacency = {}
+        if key in self._load_index()['tiles']:
+            with open(self._tile_filename(key), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            node_keys = {int(node): self.tile_key(lat, lon) for node, (lat, lon) in data['coordinates'].items()}
+            for u, v, length in data['edges']:
+                adjacency.setdefault(u, []).append((v, length, node_keys[v]))
+        self._tiles[key] = adjacency
+        if len(self._tiles) > self._max_loaded_tiles:
+            self._tiles.popitem(last=False)
+        return adjacency
+
+    def node_tile_key(self, osmid: int) -> TileKey:
+        """
+        Returns the tile key of a kept node (stamp point, bus stop or parking lot).
+        """
+        try:
+            return self._load_index()['nodes'][osmid]
+        except KeyError as exc:
+            raise ValueError(f"Node with osmid {osmid} is not a kept node of the tiled map.") from exc
+
+    def shortest_path_lengths(self,
+                              source: int,
+                              targets: Iterable[int],
+                              overlay: Optional[nx.MultiDiGraph] = None,
+                              cutoff: Optional[float] = None) -> Dict[int, float]:
+        """
+        Returns the walking distance from the source to each reachable target within the cutoff.
+        The overlay is an additional unsimplified network (e.g. around a home address) sharing osmids with the tiles.
+        """
+        def overlay_key(node):
+            data = overlay.nodes[node]
+            return self.tile_key(data['y'], data['x'])
+
+        if overlay is not None and source in overlay.nodes:
+            source_key = overlay_key(source)
+        else:
+            source_key = self.node_tile_key(source)
+        # tiles reached by this search, which may be more than max_loaded_tiles
+        search_tiles = {}
+
+        def tile(key):
+            adjacency = search_tiles.get(key)
+            if adjacency is None:
+                adjacency = search_tiles[key] = self._tile(key)
+            return adjacency
+
+        remaining = set(targets)
+        lengths = {}
+        settled = set()
+        heap = [(0.0, source, source_key)]
+        while heap and remaining:
+            distance, node, key = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if cutoff is not None and distance > cutoff:
+                break
+            settled.add(node)
+            if node in remaining:
+                lengths[node] = distance
+                remaining.discard(node)
+            for neighbour, length, neighbour_key in tile(key).get(node, ()):
+                if neighbour not in settled:
+                    heapq.heappush(heap, (distance + length, neighbour, neighbour_key))
+            if overlay is not None and node in overlay.nodes:
+                for neighbour, edges in overlay[node].items():
+                    if neighbour not in settled:
+                        length = min(edge['length'] for edge in edges.values())
+                        heapq.heappush(heap, (distance + length, neighbour, overlay_key(neighbour)))
+        return lengths
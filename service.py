@@ -0,0 +1,35 @@
+"""
+This script starts a local planning service that keeps the graph data loaded and
+solves hiking plans requested over HTTP, e.g.
+
+curl -X POST localhost:8080/plans -d '{"days": 3, "maximum_daily_distance": 15000, "min_stamps": 6,
+    "home_address": "Torfhaus 1, 38667 Torfhaus", "time_limit": 60, "wait": true}'
+"""
+
+import argparse
+import asyncio
+from model.graph_data import GraphData
+from model.planning_service import PlanningService
+
+
+parser = argparse.ArgumentParser(description="Local hiking planning service.")
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8080)
+parser.add_argument('--workers', type=int, default=2)
+parser.add_argument('--queue-size', type=int, default=16)
+parser.add_argument('--time-limit', type=float, default=600.0, help="default solver time limit in seconds")
+args = parser.parse_args()
+
+# connect to the imported data
+graph_data = GraphData(
+    neo4j_uri = "bolt://localhost:7687",
+    neo4j_user = "neo4j",
+    neo4j_password = "12345678",
+    neo4j_database = "neo4j")
+
+# serve requests
+service = PlanningService(graph_data,
+                          workers = args.workers,
+                          queue_size = args.queue_size,
+                          default_time_limit = args.time_limit)
+asyncio.run(service.serve(args.host, args.port))
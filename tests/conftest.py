@@ -0,0 +1,23 @@
+"""
+Fixtures shared by the tests.
+"""
+
+import random
+import pytest
+
+
+@pytest.fixture
+def random_graph():
+    """
+    A small random directed walk network with parallel edges and pairs of nodes without a route between them.
+    """
+    nx = pytest.importorskip('networkx')
+    rng = random.Random(7)
+    graph = nx.MultiDiGraph(crs='epsg:4326')
+    for node in range(1, 41):
+        graph.add_node(node, y=51.80 + rng.uniform(0.0, 0.02), x=10.60 + rng.uniform(0.0, 0.03), street_count=3)
+    for u, v in nx.gnp_random_graph(40, 0.08, seed=7, directed=True).edges():
+        graph.add_edge(u + 1, v + 1, length=rng.uniform(50.0, 1000.0))
+        if rng.random() < 0.2:
+            graph.add_edge(u + 1, v + 1, length=rng.uniform(50.0, 1000.0))
+    return graph
@@ -0,0 +1,57 @@
+"""
+Tests of the contraction hierarchy against Dijkstra on a random directed network.
+"""
+
+import math
+import pytest
+
+for module in ('numpy', 'networkx'):
+    pytest.importorskip(module)
+
+import networkx as nx
+from model.contraction_hierarchy import ContractionHierarchy
+
+
+def _assert_dijkstra_distances(graph, table, origins, destinations):
+    for origin, row in zip(origins, table):
+        lengths = nx.single_source_dijkstra_path_length(graph, origin, weight='length')
+        for destination, distance in zip(destinations, row):
+            assert distance == pytest.approx(lengths.get(destination, math.inf))
+
+
+def test_distance_table_matches_dijkstra(random_graph):
+    nodes = list(random_graph.nodes)
+    table = ContractionHierarchy.build(random_graph).distance_table(nodes, nodes)
+    assert any(math.isinf(distance) for row in table for distance in row)
+    _assert_dijkstra_distances(random_graph, table, nodes, nodes)
+
+
+def test_saved_hierarchy_gives_the_same_distances(random_graph, tmp_path):
+    hierarchy = ContractionHierarchy.build(random_graph)
+    hierarchy.fingerprint = 'map'
+    hierarchy.save(str(tmp_path / 'contraction_hierarchy.npz'))
+    loaded = ContractionHierarchy.load(str(tmp_path / 'contraction_hierarchy.npz'))
+    assert loaded.fingerprint == 'map'
+    nodes = list(random_graph.nodes)[:10]
+    assert loaded.distance_table(nodes, nodes) == hierarchy.distance_table(nodes, nodes)
+
+
+def test_unknown_nodes_are_rejected(random_graph):
+    with pytest.raises(ValueError):
+        ContractionHierarchy.build(random_graph).distance_table([1], [1000])
+
+
+def test_routing_from_a_home_node_matches_dijkstra(random_graph, tmp_path):
+    pytest.importorskip('osmnx')
+    from model.graph_data import GraphData
+    # the driver connects lazily and is never used
+    data = GraphData("bolt://localhost:7687", "", "", contraction_hierarchy=True)
+    data._map_filename = str(tmp_path / 'graph.graphml')
+    data._map = random_graph
+    data._contraction_hierarchy = ContractionHierarchy.build(random_graph)
+    home_map = nx.MultiDiGraph()
+    home_map.add_edge(1000, 1, length=120.0)
+    home_map.add_edge(1000, 2, length=80.0)
+    destinations = list(random_graph.nodes)
+    distances = data._route_distances([1000] * len(destinations), destinations, home_map=home_map)
+    _assert_dijkstra_distances(nx.compose(random_graph, home_map), [distances], [1000], destinations)
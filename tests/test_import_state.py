@@ -0,0 +1,101 @@
+"""
+Tests of resuming an interrupted import_data after each recorded stage, run on the in-memory benchmark database.
+"""
+
+import pytest
+
+for module in ('numpy', 'scipy', 'networkx', 'osmnx', 'neo4j', 'gpxpy', 'overpy', 'geopy', 'shapely', 'matplotlib'):
+    pytest.importorskip(module)
+
+from benchmark.in_memory_graph_data import InMemoryGraphData
+from benchmark.synthetic import generate_instance
+
+_max_section_length_m = 1500.0
+
+
+class _Interrupted(Exception):
+    pass
+
+
+@pytest.fixture(scope='module')
+def instance():
+    return generate_instance(8, 2, 2, grid_size=15, seed=2)
+
+
+def _import(data):
+    data.import_data(data.stamp_point_gpx_filename, ignore_radius=0.0, max_section_length_m=_max_section_length_m)
+
+
+def _distances(data):
+    # the element IDs differ between databases, the OSM IDs of the nodes do not
+    return {(data.node(from_id).osm_id, data.node(to_id).osm_id): distance
+            for from_id, to_distances in data.distances.items() for to_id, distance in to_distances.items()}
+
+
+@pytest.fixture(scope='module')
+def uninterrupted(instance, tmp_path_factory):
+    data = InMemoryGraphData(instance, str(tmp_path_factory.mktemp('cache')))
+    _import(data)
+    return data
+
+
+@pytest.fixture(scope='module')
+def expected_distances(uninterrupted):
+    return _distances(uninterrupted)
+
+
+def _interrupt(monkeypatch, data, method_name, calls=1):
+    # the method raises on its given call, as if the process was stopped there
+    method = getattr(data, method_name)
+    count = [0]
+
+    def interrupted(*args, **kwargs):
+        count[0] += 1
+        if count[0] == calls:
+            raise _Interrupted()
+        return method(*args, **kwargs)
+
+    monkeypatch.setattr(data, method_name, interrupted)
+
+
+@pytest.mark.parametrize('method_name, completed', [
+    ('_create_map', ['import_stamp_points']),
+    ('_import_bus_stops', ['import_stamp_points', 'create_map']),
+    ('_import_parking_lots', ['import_stamp_points', 'create_map', 'import_bus_stops']),
+    ('_simplify_map', ['import_stamp_points', 'create_map', 'import_bus_stops', 'import_parking_lots']),
+    ('_save_map', ['import_stamp_points', 'create_map', 'import_bus_stops', 'import_parking_lots']),
+    ('_build_landmarks', ['import_stamp_points', 'create_map', 'import_bus_stops', 'import_parking_lots']),
+    ('_import_missing_distances', ['import_stamp_points', 'create_map', 'import_bus_stops', 'import_parking_lots']),
+])
+def test_import_resumes_after_each_stage(instance, expected_distances, tmp_path, monkeypatch, method_name, completed):
+    interrupted = InMemoryGraphData(instance, str(tmp_path))
+    _interrupt(monkeypatch, interrupted, method_name)
+    with pytest.raises(_Interrupted):
+        _import(interrupted)
+    import_state = interrupted._get_import_state()
+    assert [stage for stage in completed if import_state.is_completed(stage)] == completed
+    # a new process with the same database and cache directory
+    resumed = InMemoryGraphData(instance, str(tmp_path))
+    resumed._database = interrupted._database
+    _import(resumed)
+    assert not resumed._get_import_state().exists()
+    assert _distances(resumed) == pytest.approx(expected_distances)
+
+
+def test_distance_import_resumes_after_its_checkpoint(instance, uninterrupted, expected_distances, tmp_path,
+                                                      monkeypatch):
+    monkeypatch.setattr(InMemoryGraphData, '_checkpoint_sources', 2)
+    interrupted = InMemoryGraphData(instance, str(tmp_path))
+    _interrupt(monkeypatch, interrupted, '_route_distances', calls=3)
+    with pytest.raises(_Interrupted):
+        _import(interrupted)
+    checkpoint = interrupted._get_import_state().checkpoint('import_missing_distances')
+    assert checkpoint['sources'] == 4
+    resumed = InMemoryGraphData(instance, str(tmp_path))
+    resumed._database = interrupted._database
+    _import(resumed)
+    assert _distances(resumed) == pytest.approx(expected_distances)
+    # the routes written before the interruption are not routed again
+    routes = uninterrupted.metrics.to_dict()['import_missing_distances']['routes']
+    assert 0 < checkpoint['routed'] < routes
+    assert resumed.metrics.to_dict()['import_missing_distances']['routes'] == routes - checkpoint['routed']
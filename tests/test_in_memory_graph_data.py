@@ -0,0 +1,69 @@
+"""
+Tests of the distance import of GraphData run on the in-memory database of the benchmark, compared with the walking
+distances of networkx on the synthetic map.
+"""
+
+import pytest
+
+for module in ('numpy', 'scipy', 'networkx', 'osmnx', 'neo4j', 'gpxpy', 'overpy', 'geopy', 'shapely', 'matplotlib'):
+    pytest.importorskip(module)
+
+import networkx as nx
+from benchmark.in_memory_graph_data import InMemoryGraphData
+from benchmark.in_memory_neo4j import InMemoryNeo4j
+from benchmark.synthetic import generate_instance
+
+_max_section_length_m = 1500.0
+
+
+@pytest.fixture(scope='module')
+def instance():
+    return generate_instance(8, 2, 2, grid_size=15, seed=1)
+
+
+@pytest.fixture
+def graph_data(instance, tmp_path):
+    data = InMemoryGraphData(instance, str(tmp_path))
+    data.import_data(data.stamp_point_gpx_filename, ignore_radius=0.0, max_section_length_m=_max_section_length_m)
+    return data
+
+
+def _walking_distances(instance, node):
+    return nx.single_source_dijkstra_path_length(instance.map, node.osm_id, weight='length')
+
+
+def test_imported_distances_are_walking_distances(instance, graph_data):
+    assert graph_data.distances
+    for from_id, to_distances in graph_data.distances.items():
+        walking_distances = _walking_distances(instance, graph_data.node(from_id))
+        for to_id, distance in to_distances.items():
+            assert distance == pytest.approx(walking_distances[graph_data.node(to_id).osm_id])
+
+
+def test_pairs_within_max_section_length_are_imported(instance, graph_data):
+    # arcs between stamp points and from bus stops and parking lots to stamp points, and back to parking lots
+    pairs = [(node, stamp_point) for node in instance.stamp_points + instance.bus_stops + instance.parking_lots
+             for stamp_point in instance.stamp_points if node is not stamp_point]
+    pairs += [(stamp_point, parking_lot) for stamp_point in instance.stamp_points for parking_lot in instance.parking_lots]
+    # the imported nodes are on the network nodes of the instance
+    indices = {node.osm_id: index
+               for nodes in (graph_data.stamp_points, graph_data.bus_stops, graph_data.parking_lots)
+               for index, node in nodes.items()}
+    for from_node, to_node in pairs:
+        if _walking_distances(instance, from_node)[to_node.osm_id] < _max_section_length_m:
+            assert indices[to_node.osm_id] in graph_data.distances[indices[from_node.osm_id]]
+
+
+def test_only_new_stamp_points_are_counted(instance, tmp_path):
+    data = InMemoryGraphData(instance, str(tmp_path))
+    assert data._import_stamp_points(data.stamp_point_gpx_filename) == len(instance.stamp_points)
+    assert data._import_stamp_points(data.stamp_point_gpx_filename) == 0
+
+
+@pytest.mark.parametrize('query', ["MATCH (n) WITH n RETURN n.osmid AS osmid",
+                                   "MATCH (n) RETURN count(n) AS count",
+                                   "MATCH (n)-[r:TO]->(m) ON MATCH SET r.distance = 0",
+                                   "CALL { MATCH (n) RETURN n } RETURN *"])
+def test_unsupported_queries_are_rejected(query):
+    with pytest.raises(NotImplementedError):
+        InMemoryNeo4j().run(query)
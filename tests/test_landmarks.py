@@ -0,0 +1,72 @@
+"""
+Tests of the landmark bounds against Dijkstra on a random directed network and of the caches derived from the map.
+"""
+
+import math
+import pytest
+
+for module in ('numpy', 'scipy', 'networkx', 'osmnx', 'neo4j', 'gpxpy', 'overpy', 'geopy', 'shapely', 'matplotlib'):
+    pytest.importorskip(module)
+
+import networkx as nx
+import osmnx as ox
+from model.contraction_hierarchy import ContractionHierarchy
+from model.graph_data import GraphData
+from model.landmarks import LandmarkIndex
+
+
+def _all_lengths(graph):
+    return {node: nx.single_source_dijkstra_path_length(graph, node, weight='length') for node in graph.nodes}
+
+
+def test_lower_bounds_do_not_exceed_dijkstra(random_graph):
+    lengths = _all_lengths(random_graph)
+    landmarks = LandmarkIndex.build(random_graph, landmark_count=4)
+    pairs = [(origin, destination) for origin in random_graph.nodes for destination in random_graph.nodes]
+    bounds = landmarks.lower_bounds([origin for origin, _ in pairs], [destination for _, destination in pairs])
+    assert any(bound > 0 for bound in bounds)
+    for (origin, destination), bound in zip(pairs, bounds):
+        assert 0 <= bound <= lengths[origin].get(destination, math.inf) + 1e-6
+
+
+def test_heuristic_is_consistent(random_graph):
+    lengths = _all_lengths(random_graph)
+    landmarks = LandmarkIndex.build(random_graph, landmark_count=4)
+    for destination in random_graph.nodes:
+        heuristic = landmarks.heuristic(destination)
+        assert heuristic(destination, destination) == 0
+        for u, v, length in random_graph.edges(data='length'):
+            assert heuristic(u, destination) <= length + heuristic(v, destination) + 1e-6
+        for node in random_graph.nodes:
+            assert heuristic(node, destination) <= lengths[node].get(destination, math.inf) + 1e-6
+
+
+def test_unknown_nodes_have_no_bound(random_graph):
+    landmarks = LandmarkIndex.build(random_graph, landmark_count=4)
+    assert landmarks.lower_bounds([1, 1000], [1000, 2]).tolist() == [0.0, 0.0]
+
+
+def _graph_data(tmp_path, graph):
+    # the driver connects lazily and is never used
+    data = GraphData("bolt://localhost:7687", "", "", landmark_count=4, contraction_hierarchy=True)
+    data._map_filename = str(tmp_path / 'graph.graphml')
+    data._landmarks_filename = str(tmp_path / 'landmarks.npz')
+    data._contraction_hierarchy_filename = str(tmp_path / 'contraction_hierarchy.npz')
+    ox.save_graphml(graph, data._map_filename)
+    return data
+
+
+def test_caches_of_a_replaced_map_are_ignored(random_graph, tmp_path):
+    data = _graph_data(tmp_path, random_graph)
+    data._build_landmarks()
+    data._build_contraction_hierarchy()
+    # the same map saved again uses the stored caches
+    data = _graph_data(tmp_path, random_graph)
+    assert isinstance(data._get_landmarks(), LandmarkIndex)
+    assert isinstance(data._get_contraction_hierarchy(), ContractionHierarchy)
+    # another map with the same file name does not
+    other_graph = random_graph.copy()
+    other_graph.remove_node(1)
+    data = _graph_data(tmp_path, other_graph)
+    assert data._get_landmarks() is None
+    assert data._get_contraction_hierarchy() is None
@@ -0,0 +1,51 @@
+"""
+Tests of the nearest neighbour arc import on a walk network with two separate components.
+"""
+
+import math
+import pytest
+
+for module in ('numpy', 'scipy', 'networkx', 'osmnx', 'neo4j', 'gpxpy', 'overpy', 'geopy', 'shapely', 'matplotlib'):
+    pytest.importorskip(module)
+
+import networkx as nx
+from model.graph_data import GraphData
+from model.landmarks import LandmarkIndex
+
+
+# stamp points as (key, osmid, latitude, longitude), the last two on a network not connected to the others
+_stamp_points = [('a1', 1, 51.8, 10.600), ('a2', 2, 51.8, 10.601), ('a3', 3, 51.8, 10.602),
+                 ('b1', 11, 51.8, 10.603), ('b2', 12, 51.8, 10.604)]
+
+
+@pytest.fixture
+def graph_data(tmp_path):
+    graph = nx.MultiDiGraph()
+    for u, v, length in [(1, 2, 100.0), (2, 3, 150.0), (11, 12, 120.0)]:
+        graph.add_edge(u, v, length=length)
+        graph.add_edge(v, u, length=length)
+    # the driver connects lazily and is never used
+    data = GraphData("bolt://localhost:7687", "", "")
+    data._map_filename = str(tmp_path / 'graph.graphml')
+    data._map = graph
+    data._landmarks = LandmarkIndex.build(graph, landmark_count=2)
+    return data
+
+
+def test_route_distances_of_unreachable_pairs_are_infinite(graph_data):
+    assert graph_data._route_distances([1, 1], [3, 12]) == [250.0, math.inf]
+
+
+def test_components_without_route_stay_apart(graph_data):
+    distances, _ = graph_data._nearest_neighbour_distances(_stamp_points, [], 1, None, {})
+    assert distances == {('a1', 'a2'): 100.0, ('a2', 'a3'): 150.0, ('b1', 'b2'): 120.0}
+
+
+def test_max_section_length_only_caps_arcs(graph_data):
+    distances, _ = graph_data._nearest_neighbour_distances(_stamp_points, [], 1, 120.0, {})
+    assert distances == {('a1', 'a2'): 100.0, ('b1', 'b2'): 120.0}
+
+
+def test_arcs_within_radius_are_kept(graph_data):
+    distances, _ = graph_data._nearest_neighbour_distances(_stamp_points, [], 1, None, {}, radius_m=300.0)
+    assert distances == {('a1', 'a2'): 100.0, ('a2', 'a3'): 150.0, ('a1', 'a3'): 250.0, ('b1', 'b2'): 120.0}
@@ -0,0 +1,38 @@
+"""
+Tests of the undirected formulation with subtour cuts against the directed formulation on synthetic instances.
+"""
+
+import pytest
+
+for module in ('numpy', 'scipy', 'networkx', 'osmnx', 'neo4j', 'gpxpy', 'overpy', 'geopy', 'shapely', 'matplotlib',
+               'pulp'):
+    pytest.importorskip(module)
+
+from benchmark.in_memory_graph_data import InMemoryGraphData
+from benchmark.synthetic import generate_instance
+from model.metrics import Metrics
+from model.problem_solver import ProblemSolver
+
+
+@pytest.fixture(scope='module')
+def graph_data(tmp_path_factory):
+    instance = generate_instance(12, 2, 2, grid_size=20, seed=3)
+    data = InMemoryGraphData(instance, str(tmp_path_factory.mktemp('cache')))
+    data.import_data(data.stamp_point_gpx_filename, ignore_radius=0.0, max_section_length_m=2500.0)
+    return data
+
+
+@pytest.mark.parametrize('days, min_stamps, max_bus_days, max_parking_days', [(1, 4, 0, 0), (2, 8, 1, 1), (2, 10, 0, 2)])
+def test_subtour_cuts_find_the_directed_optimum(graph_data, days, min_stamps, max_bus_days, max_parking_days):
+    parameters = dict(days=days, maximum_daily_distance=12000.0, min_stamps=min_stamps, home_address='home',
+                      max_bus_days=max_bus_days, max_parking_days=max_parking_days)
+    directed = ProblemSolver(graph_data).solve(**parameters, formulation='directed')
+    metrics = Metrics()
+    undirected = ProblemSolver(graph_data, metrics).solve(**parameters, formulation='undirected')
+    assert undirected.distance == pytest.approx(directed.distance, rel=1e-6)
+    # every tour is closed and visits each stamp point at most once
+    visited = [node for tour in undirected.tours for node in tour[1:-1]]
+    assert len(visited) == len(set(visited))
+    assert len(visited) >= min_stamps
+    # the instances are chosen so that the first solutions contain subtours
+    assert metrics.to_dict()['solve_model']['subtour_cuts'] > 0
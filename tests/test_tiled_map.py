@@ -0,0 +1,86 @@
+"""
+Tests of the tiled map against Dijkstra on a random directed network that is split into tiles.
+"""
+
+import math
+import pytest
+
+for module in ('numpy', 'networkx', 'osmnx', 'shapely'):
+    pytest.importorskip(module)
+
+import networkx as nx
+import osmnx as ox
+from shapely import Point, box
+from model.tiled_map import TiledMap
+
+_kept_nodes = list(range(1, 41, 3))
+
+
+@pytest.fixture
+def tiled_map(random_graph, tmp_path, monkeypatch):
+    def graph_from_polygon(polygon, **kwargs):
+        # the network of the tile including the edges crossing its border, like truncate_by_edge
+        inside = {node for node, data in random_graph.nodes(data=True) if polygon.covers(Point(data['x'], data['y']))}
+        if not inside:
+            raise ValueError("Found no graph nodes within the requested polygon.")
+        graph = nx.MultiDiGraph(**random_graph.graph)
+        for u, v, key, data in random_graph.edges(keys=True, data=True):
+            if u in inside or v in inside:
+                graph.add_node(u, **random_graph.nodes[u])
+                graph.add_node(v, **random_graph.nodes[v])
+                graph.add_edge(u, v, key, **data)
+        return graph
+
+    monkeypatch.setattr(ox, 'graph_from_polygon', graph_from_polygon)
+    # a single loaded tile, so that every search crosses more tiles than are held
+    tiled_map = TiledMap(str(tmp_path / 'tiles'), tile_size_deg=0.01, max_loaded_tiles=1)
+    xs = [data['x'] for _, data in random_graph.nodes(data=True)]
+    ys = [data['y'] for _, data in random_graph.nodes(data=True)]
+    assert tiled_map.download(box(min(xs) - 0.001, min(ys) - 0.001, max(xs) + 0.001, max(ys) + 0.001)) > 1
+    for osmid in _kept_nodes:
+        data = random_graph.nodes[osmid]
+        assert tiled_map.contains(osmid, data['y'], data['x'])
+        tiled_map.keep(osmid)
+    tiled_map.simplify()
+    tiled_map.save_index()
+    return tiled_map
+
+
+def test_shortest_path_lengths_match_dijkstra(random_graph, tiled_map):
+    for source in _kept_nodes:
+        expected = nx.single_source_dijkstra_path_length(random_graph, source, weight='length')
+        lengths = tiled_map.shortest_path_lengths(source, _kept_nodes)
+        assert set(lengths) == {target for target in _kept_nodes if target in expected}
+        for target, length in lengths.items():
+            assert length == pytest.approx(expected[target])
+
+
+def test_search_reads_every_tile_once(tiled_map, monkeypatch):
+    reads = []
+    tile = tiled_map._tile
+    monkeypatch.setattr(tiled_map, '_tile', lambda key: reads.append(key) or tile(key))
+    for source in _kept_nodes:
+        reads.clear()
+        tiled_map.shortest_path_lengths(source, _kept_nodes)
+        assert len(reads) == len(set(reads))
+    assert len(set(reads)) > 1
+
+
+def test_shortest_path_lengths_stop_at_the_cutoff(random_graph, tiled_map):
+    cutoff = 1500.0
+    for source in _kept_nodes:
+        expected = nx.single_source_dijkstra_path_length(random_graph, source, cutoff=cutoff, weight='length')
+        lengths = tiled_map.shortest_path_lengths(source, _kept_nodes, cutoff=cutoff)
+        assert set(lengths) == {target for target in _kept_nodes if target in expected}
+
+
+def test_overlay_routes_from_a_home_node(random_graph, tiled_map):
+    overlay = nx.MultiDiGraph()
+    overlay.add_node(1000, y=51.81, x=10.61)
+    for node in (1, 4):
+        overlay.add_node(node, **random_graph.nodes[node])
+        overlay.add_edge(1000, node, length=100.0)
+    expected = nx.single_source_dijkstra_path_length(nx.compose(random_graph, overlay), 1000, weight='length')
+    lengths = tiled_map.shortest_path_lengths(1000, _kept_nodes, overlay=overlay)
+    for target in _kept_nodes:
+        assert lengths.get(target, math.inf) == pytest.approx(expected.get(target, math.inf))